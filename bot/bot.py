@@ -1,20 +1,24 @@
 import os
 import sys
+import json
 import logging
-import time
+import threading
+from queue import Queue
 from dotenv import load_dotenv
+from utils.startup import startup_timer
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import (
     Updater, CommandHandler, CallbackQueryHandler, MessageHandler, 
-    Filters, ConversationHandler, CallbackContext
+    Filters, ConversationHandler, CallbackContext, Dispatcher, JobQueue, ExtBot, TypeHandler
 )
+from telegram.utils.request import Request
 
 # Import handlers
 from handlers.start import start_command, language_conv_handler, referrals_command, check_referrals_callback
 from handlers.services import (
     services_command, service_callback, category_callback, platform_callback,
     SELECTING_PLATFORM, SELECTING_CATEGORY, SELECTING_SERVICE, SEARCHING_SERVICES,
-    process_search_term
+    process_search_term, _get_services
 )
 from handlers.order import (
     order_command, process_link, process_quantity, process_comments, process_order, confirm_order,
@@ -27,473 +31,412 @@ from handlers.admin import (
     handle_remove_balance_options, confirm_remove_balance, 
     ADMIN_MENU, BROADCASTING, VIEWING_STATS, ADDING_BALANCE, REMOVING_BALANCE, ENTERING_USER_ID, 
     ENTERING_BALANCE_AMOUNT, ENTERING_REFERRAL_SETTINGS, REMOVING_BALANCE_OPTIONS,
-    admin_conv_handler, handle_referral_settings_input
+    admin_conv_handler, handle_referral_settings_input, db_profile_command
 )
 from handlers.help import help_command
 from handlers.status import status_command, refresh_status_callback
 from handlers.account import account_command, refresh_account_callback
 from handlers.recharge import recharge_conv_handler, recharge_command
+from handlers.mass_order import mass_order_conv_handler
+from handlers.drip_feed import drip_feed_conv_handler, process_drip_feeds
 from handlers.support import support_command, support_conv_handler, admin_reply_conv_handler
-from handlers.command_menu import get_command_menu_handlers, show_command_menu, hide_command_menu, toggle_command_menu
+from handlers.command_menu import (
+    get_command_menu_handlers, ensure_command_menu, set_bot_commands, get_command_menu_stats
+)
 from utils.messages import get_message
 from utils.db import db
+from utils.order_queue import order_workers
+from utils.concurrency import run_async_per_user, serialize_conversation
+from utils.metrics import metrics, instrument_handlers
+from utils.logging_setup import setup_logging, get_logging_stats
+from utils.persistence import SQLitePersistence, flush_persistence_job, evict_idle_user_data_job
+from utils.callback_router import CallbackRouter, callback_router, build_callback_data
 import handlers.tutorial as tutorial_handlers
+from utils.api_client import api_client
+from utils.constants import load_currency_rates_from_db
 
 # Load environment variables
 load_dotenv()
 
-# Enable logging
-logging.basicConfig(
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    level=logging.INFO
-)
+# Enable logging through the background log writer
+setup_logging()
 logger = logging.getLogger(__name__)
 
 # Define states for status conversation
 STATUS_WAITING_FOR_ID = 0
 
-def debug_callback(update, context):
-    """Fallback handler for debugging"""
+def _fallback_tutorial(handler):
+    """Wrap a tutorial admin handler for callbacks that escaped the tutorial conversation"""
+    def callback(update, context):
+        query = update.callback_query
+        logger.info(f"Handling tutorial callback in fallback handler: {query.data}")
+        try:
+            return handler(update, context)
+        except Exception as e:
+            logger.error(f"Error handling tutorial callback in fallback: {e}", exc_info=True)
+            query.answer("Error processing tutorial action")
+            return
+    return callback
+
+def _fallback_category(update, context):
+    """Handle category callbacks that may have escaped the conversation handler"""
     query = update.callback_query
+    callback_data = query.data
     
-    if query:
-        callback_data = query.data
-        logger.debug(f"Received callback: {callback_data}")
-        
-        # Handle tutorial callbacks that may have escaped the conversation handler
-        if (callback_data.startswith("tutorial_edit_") or 
-            callback_data.startswith("tutorial_media_") or
-            callback_data.startswith("tutorial_admin_edit_") or
-            callback_data.startswith("tutorial_add_media_") or
-            callback_data.startswith("tutorial_delete_media_") or
-            callback_data.startswith("tutorial_delete_media_item_") or
-            callback_data.startswith("tutorial_publish_media_")):
-            
-            logger.info(f"Handling tutorial callback in fallback handler: {callback_data}")
-            try:
-                # Handle different types of tutorial callbacks
-                
-                if callback_data.startswith("tutorial_edit_"):
-                    return tutorial_handlers.admin_edit_text(update, context)
-                
-                elif callback_data.startswith("tutorial_media_photo_") or \
-                     callback_data.startswith("tutorial_media_video_") or \
-                     callback_data.startswith("tutorial_media_document_") or \
-                     callback_data.startswith("tutorial_media_voice_"):
-                    return tutorial_handlers.admin_select_media_type(update, context)
-                
-                elif callback_data.startswith("tutorial_media_"):
-                    return tutorial_handlers.admin_select_media_type(update, context)
-                
-                elif callback_data.startswith("tutorial_admin_edit_"):
-                    return tutorial_handlers.admin_edit_tutorial(update, context)
-                
-                elif callback_data.startswith("tutorial_add_media_"):
-                    return tutorial_handlers.admin_add_media(update, context)
-                
-                elif callback_data.startswith("tutorial_delete_media_item_"):
-                    return tutorial_handlers.admin_delete_media_item(update, context)
-                
-                elif callback_data.startswith("tutorial_delete_media_"):
-                    return tutorial_handlers.admin_delete_media(update, context)
-                
-                elif callback_data.startswith("tutorial_publish_media_"):
-                    return tutorial_handlers.admin_publish_media(update, context)
-                
-            except Exception as e:
-                logger.error(f"Error handling tutorial callback in fallback: {e}", exc_info=True)
-                query.answer("Error processing tutorial action")
-                return
+    logger.info(f"Handling category callback in fallback handler: {callback_data}")
+    try:
+        # Call the proper handler
+        return category_callback(update, context)
+    except Exception as e:
+        logger.error(f"Error handling category in fallback: {e}", exc_info=True)
+        query.answer("Error processing category")
+        query.edit_message_text("There was an error processing your category selection. Please try again.")
+        return
+
+def _fallback_platform(update, context):
+    """Handle platform callbacks that may have escaped"""
+    query = update.callback_query
+    callback_data = query.data
+    
+    logger.info(f"Handling platform callback in fallback handler: {callback_data}")
+    try:
+        if callback_data == "back_to_platforms":
+            return services_command(update, context)
+        else:
+            # Call the proper handler
+            return platform_callback(update, context)
+    except Exception as e:
+        logger.error(f"Error handling platform in fallback: {e}", exc_info=True)
+        query.answer("Error processing platform")
+        query.edit_message_text("There was an error processing your platform selection. Please try again.")
+        return
+
+def _fallback_back_to_categories(update, context):
+    """Handle back to categories callback"""
+    query = update.callback_query
+    callback_data = query.data
+    
+    logger.info(f"Handling back to categories callback in fallback handler: {callback_data}")
+    try:
+        # Get the current platform from user data
+        current_platform = context.user_data.get("current_platform", None)
+        if current_platform:
+            # Create a synthetic callback with the platform ID
+            query.data = f"platform_{current_platform}"
+            return platform_callback(update, context)
+        else:
+            # If no platform is stored, go back to services menu
+            return services_command(update, context)
+    except Exception as e:
+        logger.error(f"Error handling back to categories: {e}", exc_info=True)
+        query.answer("Error returning to categories")
+        query.edit_message_text("There was an error returning to categories. Please try again.")
+        return
+
+def _fallback_page(update, context):
+    """Handle page navigation callbacks"""
+    query = update.callback_query
+    callback_data = query.data
+    
+    logger.info(f"Handling page navigation in fallback handler: {callback_data}")
+    try:
+        # Call the service callback handler
+        return service_callback(update, context)
+    except Exception as e:
+        logger.error(f"Error handling page navigation: {e}", exc_info=True)
+        query.answer("Error navigating pages")
+        query.edit_message_text("There was an error navigating between pages. Please try again.")
+        return
+
+def _fallback_search(update, context):
+    """Handle search-related callbacks"""
+    query = update.callback_query
+    callback_data = query.data
+    
+    logger.info(f"Handling search callback in fallback handler: {callback_data}")
+    try:
+        # Call the service callback handler
+        return service_callback(update, context)
+    except Exception as e:
+        logger.error(f"Error handling search callback: {e}", exc_info=True)
+        query.answer("Error with search")
+        query.edit_message_text("There was an error with the search function. Please try again.")
+        return
+
+def _fallback_confirm_order(update, context):
+    """Handle confirm order button"""
+    query = update.callback_query
+    
+    try:
+        # Get order data
+        if "order" not in context.user_data:
+            query.answer("Order data not found")
+            query.edit_message_text("Error: Order data not found. Please try again.")
+            return
         
-        # Handle category callbacks that may have escaped the conversation handler
-        if callback_data.startswith("cat_") or callback_data.startswith("category_"):
-            logger.info(f"Handling category callback in fallback handler: {callback_data}")
-            try:
-                # Import required functions
-                from handlers.services import category_callback, _get_services, SELECTING_SERVICE
-                
-                # Call the proper handler
-                return category_callback(update, context)
-            except Exception as e:
-                logger.error(f"Error handling category in fallback: {e}", exc_info=True)
-                query.answer("Error processing category")
-                query.edit_message_text("There was an error processing your category selection. Please try again.")
-                return
+        order_data = context.user_data["order"]
         
-        # Handle platform callbacks that may have escaped
-        if callback_data.startswith("plt_") or callback_data.startswith("platform_") or callback_data == "back_to_platforms":
-            logger.info(f"Handling platform callback in fallback handler: {callback_data}")
-            try:
-                # Import required functions
-                from handlers.services import platform_callback, services_command
-                
-                if callback_data == "back_to_platforms":
-                    return services_command(update, context)
-                else:
-                    # Call the proper handler
-                    return platform_callback(update, context)
-            except Exception as e:
-                logger.error(f"Error handling platform in fallback: {e}", exc_info=True)
-                query.answer("Error processing platform")
-                query.edit_message_text("There was an error processing your platform selection. Please try again.")
-                return
+        # Check if service_info is in order_data, if not, try to get it from selected_service
+        selected_service = context.user_data.get("selected_service", {})
+        if "service_info" not in order_data and "info" in selected_service:
+            order_data["service_info"] = selected_service["info"]
+        if "service_id" not in order_data and "id" in selected_service:
+            order_data["service_id"] = selected_service["id"]
         
-        # Handle back to categories callback
-        if callback_data == "back_to_categories":
-            logger.info(f"Handling back to categories callback in fallback handler: {callback_data}")
-            try:
-                # Import required functions
-                from handlers.services import platform_callback
-                
-                # Get the current platform from user data
-                current_platform = context.user_data.get("current_platform", None)
-                if current_platform:
-                    # Create a synthetic callback with the platform ID
-                    query.data = f"platform_{current_platform}"
-                    return platform_callback(update, context)
-                else:
-                    # If no platform is stored, go back to services menu
-                    from handlers.services import services_command
-                    return services_command(update, context)
-            except Exception as e:
-                logger.error(f"Error handling back to categories: {e}", exc_info=True)
-                query.answer("Error returning to categories")
-                query.edit_message_text("There was an error returning to categories. Please try again.")
-                return
+        # Go through the regular order flow so the order is charged, saved and deduplicated
+        result = confirm_order(update, context)
         
-        # Handle page navigation callbacks
-        if callback_data.startswith("page_"):
-            logger.info(f"Handling page navigation in fallback handler: {callback_data}")
-            try:
-                # Import required functions
-                from handlers.services import service_callback
-                
-                # Call the service callback handler
-                return service_callback(update, context)
-            except Exception as e:
-                logger.error(f"Error handling page navigation: {e}", exc_info=True)
-                query.answer("Error navigating pages")
-                query.edit_message_text("There was an error navigating between pages. Please try again.")
-                return
-        
-        # Handle search-related callbacks
-        if callback_data in ["search_services", "view_search_results"]:
-            logger.info(f"Handling search callback in fallback handler: {callback_data}")
-            try:
-                # Import required functions
-                from handlers.services import service_callback
-                
-                # Call the service callback handler
-                return service_callback(update, context)
-            except Exception as e:
-                logger.error(f"Error handling search callback: {e}", exc_info=True)
-                query.answer("Error with search")
-                query.edit_message_text("There was an error with the search function. Please try again.")
-                return
+        # Clear order state
+        context.user_data.pop("order_state", None)
+        return result
+    except Exception as e:
+        logger.error(f"Error confirming order: {e}", exc_info=True)
+        query.answer("Error confirming order")
+        query.edit_message_text(f"Error confirming order: {str(e)}", parse_mode="HTML")
+        return
+
+def _fallback_cancel_order(update, context):
+    """Handle cancel order button"""
+    query = update.callback_query
+    
+    query.answer("Order canceled")
+    query.edit_message_text("Order has been canceled.")
+    # Clear order state
+    context.user_data.pop("order_state", None)
+    return
+
+def _fallback_select_service(update, context):
+    """Handle service selection callbacks"""
+    query = update.callback_query
+    callback_data = query.data
+    
+    try:
+        # Get service ID
+        service_id = callback_data.split("_")[1]
+        logger.info(f"Processing service ID: {service_id}")
         
-        # Handle confirm order button
-        if callback_data == "confirm_order":
-            try:
-                # Get order data
-                if "order" not in context.user_data:
-                    query.answer("Order data not found")
-                    query.edit_message_text("Error: Order data not found. Please try again.")
-                    return
-                
-                order_data = context.user_data["order"]
-                
-                # Check if service_info is in order_data, if not, try to get it from selected_service
-                if "service_info" not in order_data and "selected_service" in context.user_data:
-                    order_data["service_info"] = context.user_data["selected_service"]["info"]
-                    
-                service_info = order_data.get("service_info", context.user_data.get("selected_service", {}).get("info", {}))
-                service_id = order_data.get("service_id", context.user_data.get("selected_service", {}).get("id", "unknown"))
-                quantity = order_data.get("quantity", 0)
-                link = order_data.get("link", "No link provided")
-                
-                # Calculate cost - Handle string rate properly
-                rate = service_info.get("rate", 0)
-                try:
-                    if isinstance(rate, str):
-                        rate = float(rate)
-                    cost = (rate / 1000) * quantity
-                except (ValueError, TypeError):
-                    cost = 0
-                
-                # Get service name for display
-                service_name = service_info.get("name", "Unknown Service")
-                
-                # Show processing message
-                query.edit_message_text(
-                    f"⏳ <b>Processing Order...</b>\n\n"
-                    f"Submitting order to service provider...",
-                    parse_mode="HTML"
-                )
-                
-                # Place order with API
-                from utils.api_client import api_client
-                
-                # Log detailed order information for debugging
-                logger.info(f"Placing order with API - Service ID: {service_id}, Quantity: {quantity}, Link: {link}")
-                
-                # Make the real API call to place the order
-                response = api_client.place_order(service_id, link, quantity)
-                logger.info(f"API order response: {response}")
-                
-                if response and isinstance(response, dict) and ('order' in response or 'id' in response):
-                    # Get order ID from response
-                    order_id = response.get('order', response.get('id', 'Unknown'))
-                    
-                    # Store order in user data for reference
-                    if "orders" not in context.user_data:
-                        context.user_data["orders"] = []
-                        
-                    context.user_data["orders"].append({
-                        "order_id": order_id,
-                        "service_id": service_id,
-                        "service_name": service_name,
-                        "link": link,
-                        "quantity": quantity,
-                        "cost": cost,
-                        "timestamp": int(time.time())
-                    })
-                    
-                    # Display success message
-                    query.edit_message_text(
-                        f"✅ <b>Order Successfully Placed!</b>\n\n"
-                        f"<b>Order ID:</b> <code>{order_id}</code>\n"
-                        f"<b>Service:</b> {service_name}\n"
-                        f"<b>Link/Username:</b> {link}\n"
-                        f"<b>Quantity:</b> {quantity}\n"
-                        f"<b>Total Cost:</b> ${cost:.2f}\n\n"
-                        f"You can check the status of your order with /status command.",
-                        parse_mode="HTML"
-                    )
-                    
-                    # Clear order state
-                    context.user_data.pop("order_state", None)
-                    return
-                else:
-                    error_msg = response.get("error", "Unknown error") if response else "Failed to connect to service"
-                    query.edit_message_text(
-                        f"❌ <b>Order Failed</b>\n\n"
-                        f"There was an error placing your order: {error_msg}\n\n"
-                        f"Please try again later or contact support.",
-                        parse_mode="HTML"
-                    )
-                    
-                    # Clear order state
-                    context.user_data.pop("order_state", None)
-                    return
-            except Exception as e:
-                logger.error(f"Error confirming order: {e}", exc_info=True)
-                query.answer("Error confirming order")
-                query.edit_message_text(f"Error confirming order: {str(e)}", parse_mode="HTML")
-                return
+        # Get services
+        services = _get_services()
         
-        # Handle cancel order button
-        if callback_data == "cancel_order":
-            query.answer("Order canceled")
-            query.edit_message_text("Order has been canceled.")
-            # Clear order state
-            context.user_data.pop("order_state", None)
-            return
+        # Find service by ID
+        service_info = None
+        for service in services:
+            if str(service.get("service")) == service_id:
+                service_info = service
+                break
         
-        # Handle service selection callbacks
-        if callback_data.startswith("service_") or callback_data.startswith("quick_"):
-            try:
-                # Get service ID
-                service_id = callback_data.split("_")[1]
-                logger.info(f"Processing service ID: {service_id}")
-                
-                # Get services
-                from handlers.services import _get_services
-                services = _get_services()
-                
-                # Find service by ID
-                service_info = None
-                for service in services:
-                    if str(service.get("service")) == service_id:
-                        service_info = service
-                        break
-                
-                if service_info:
-                    # Store service info in user_data properly for both flows
-                    context.user_data["selected_service"] = {
-                        "id": service_id,
-                        "info": service_info
-                    }
-                    # Also store in order for compatibility with order flow
-                    if "order" not in context.user_data:
-                        context.user_data["order"] = {}
-                    context.user_data["order"]["service_id"] = service_id
-                    context.user_data["order"]["service_info"] = service_info
-                    
-                    # Format service details for min/max display
-                    service_name = service_info.get('name', 'Unknown Service')
-                    min_quantity_display = service_info.get('min', 100)
-                    max_quantity_display = service_info.get('max', 10000)
-                    
-                    # Convert min/max to integers for button generation
-                    min_qty = min_quantity_display
-                    max_qty = max_quantity_display
-                    if isinstance(min_qty, str):
-                        min_qty = int(min_qty)
-                    if isinstance(max_qty, str):
-                        max_qty = int(max_qty)
+        if service_info:
+            # Store service info in user_data properly for both flows
+            context.user_data["selected_service"] = {
+                "id": service_id,
+                "info": service_info
+            }
+            # Also store in order for compatibility with order flow
+            if "order" not in context.user_data:
+                context.user_data["order"] = {}
+            context.user_data["order"]["service_id"] = service_id
+            context.user_data["order"]["service_info"] = service_info
+            
+            # Format service details for min/max display
+            service_name = service_info.get('name', 'Unknown Service')
+            min_quantity_display = service_info.get('min', 100)
+            max_quantity_display = service_info.get('max', 10000)
+            
+            # Convert min/max to integers for button generation
+            min_qty = min_quantity_display
+            max_qty = max_quantity_display
+            if isinstance(min_qty, str):
+                min_qty = int(min_qty)
+            if isinstance(max_qty, str):
+                max_qty = int(max_qty)
 
-                    # Generate quantity options (starting from min, doubling until reaching max)
-                    quantity_options = []
-                    current_qty = min_qty
-                    while current_qty <= max_qty:
-                        quantity_options.append(current_qty)
-                        current_qty *= 2
-                        if len(quantity_options) >= 8:  # Limit to 8 buttons to avoid too many
-                            break
+            # Generate quantity options (starting from min, doubling until reaching max)
+            quantity_options = []
+            current_qty = min_qty
+            while current_qty <= max_qty:
+                quantity_options.append(current_qty)
+                current_qty *= 2
+                if len(quantity_options) >= 8:  # Limit to 8 buttons to avoid too many
+                    break
 
-                    # Add the max as the last option if it's not already included
-                    if quantity_options[-1] < max_qty and len(quantity_options) < 8:
-                        quantity_options.append(max_qty)
+            # Add the max as the last option if it's not already included
+            if quantity_options[-1] < max_qty and len(quantity_options) < 8:
+                quantity_options.append(max_qty)
 
-                    # Create quantity selection buttons
-                    buttons = []
-                    for i in range(0, len(quantity_options), 2):  # Create rows with 2 buttons each
-                        row = []
-                        row.append(InlineKeyboardButton(f"{quantity_options[i]}", callback_data=f"qty_{quantity_options[i]}"))
-                        if i + 1 < len(quantity_options):
-                            row.append(InlineKeyboardButton(f"{quantity_options[i+1]}", callback_data=f"qty_{quantity_options[i+1]}"))
-                        buttons.append(row)
-                    
-                    # Add a "Custom" button for custom quantity input
-                    buttons.append([InlineKeyboardButton("Custom", callback_data="qty_custom")])
+            # Create quantity selection buttons
+            buttons = []
+            for i in range(0, len(quantity_options), 2):  # Create rows with 2 buttons each
+                row = []
+                row.append(InlineKeyboardButton(f"{quantity_options[i]}", callback_data=build_callback_data("order", "qty", quantity_options[i])))
+                if i + 1 < len(quantity_options):
+                    row.append(InlineKeyboardButton(f"{quantity_options[i+1]}", callback_data=build_callback_data("order", "qty", quantity_options[i+1])))
+                buttons.append(row)
+            
+            # Add a "Custom" button for custom quantity input
+            buttons.append([InlineKeyboardButton("Custom", callback_data=build_callback_data("order", "qty", "custom"))])
 
-                    quantity_keyboard = InlineKeyboardMarkup(buttons)
+            quantity_keyboard = InlineKeyboardMarkup(buttons)
 
-                    # Get user language
-                    user_id = query.from_user.id
-                    language = db.get_language(user_id)
+            # Get user language
+            user_id = query.from_user.id
+            language = db.get_language(user_id)
 
-                    # SKIP PROCESSING MESSAGE AND ASK FOR QUANTITY DIRECTLY WITH BUTTONS
-                    query.edit_message_text(
-                        f"{get_message(language, 'order', 'order_quantity')}\n\n"
-                        f"<b>Service:</b> {service_name}\n"
-                        f"<b>Min:</b> {min_quantity_display}\n"
-                        f"<b>Max:</b> {max_quantity_display}\n\n"
-                        f"{get_message(language, 'order', 'please_select_quantity')}",
-                        parse_mode="HTML",
-                        reply_markup=quantity_keyboard
-                    )
-                    
-                    # No need to set state for text-based quantity collection
-                    # State will be handled by quantity button callback
-                    return
-                else:
-                    query.answer("Service not found!")
-                    query.edit_message_text(f"⚠️ Service with ID {service_id} not found.")
-                    return
-            except Exception as e:
-                logger.error(f"Error in debug_callback processing service: {e}")
-                query.answer("Error processing service")
-                query.edit_message_text(f"Error: {str(e)}")
-                return
+            # SKIP PROCESSING MESSAGE AND ASK FOR QUANTITY DIRECTLY WITH BUTTONS
+            query.edit_message_text(
+                f"{get_message(language, 'order', 'order_quantity')}\n\n"
+                f"<b>Service:</b> {service_name}\n"
+                f"<b>Min:</b> {min_quantity_display}\n"
+                f"<b>Max:</b> {max_quantity_display}\n\n"
+                f"{get_message(language, 'order', 'please_select_quantity')}",
+                parse_mode="HTML",
+                reply_markup=quantity_keyboard
+            )
+            
+            # No need to set state for text-based quantity collection
+            # State will be handled by quantity button callback
+            return
+        else:
+            query.answer("Service not found!")
+            query.edit_message_text(f"⚠️ Service with ID {service_id} not found.")
+            return
+    except Exception as e:
+        logger.error(f"Error in debug_callback processing service: {e}")
+        query.answer("Error processing service")
+        query.edit_message_text(f"Error: {str(e)}")
+        return
+
+def _fallback_quantity(update, context):
+    """Handle quantity buttons"""
+    query = update.callback_query
+    callback_data = query.data
+    
+    try:
+        # Compact "order:qty:<n>" buttons carry the quantity as an argument, older ones are "qty_<n>"
+        value = context.args[0] if context.args else callback_data.split("_")[1]
         
-        # Handle quantity buttons
-        if callback_data.startswith("qty_"):
-            try:
-                # Check if this is the custom quantity option
-                if callback_data == "qty_custom":
-                    # Get service info
-                    service_info = context.user_data.get("selected_service", {}).get("info", {})
-                    service_name = service_info.get("name", "Unknown Service")
-                    min_qty = service_info.get("min", 1)
-                    max_qty = service_info.get("max", 1000000)
-                    
-                    # Get user language
-                    user_id = query.from_user.id
-                    language = db.get_language(user_id)
-                    
-                    # Prompt user to enter a custom quantity
-                    query.edit_message_text(
-                        f"{get_message(language, 'order', 'order_quantity')}\n\n"
-                        f"<b>Service:</b> {service_name}\n"
-                        f"<b>Min:</b> {min_qty}\n"
-                        f"<b>Max:</b> {max_qty}\n\n"
-                        f"Please enter your desired quantity:",
-                        parse_mode="HTML"
-                    )
-                    
-                    # Update state to wait for custom quantity
-                    context.user_data["order_state"] = "waiting_for_custom_quantity"
-                    return
-                
-                # Extract quantity from callback data
-                quantity = int(callback_data.split("_")[1])
-                logger.info(f"Selected quantity: {quantity}")
-                
-                # Get service info
-                service_info = context.user_data.get("selected_service", {}).get("info", {})
-                service_name = service_info.get("name", "Unknown Service")
-                
-                # Save the quantity to order context
-                if "order" not in context.user_data:
-                    context.user_data["order"] = {}
-                context.user_data["order"]["quantity"] = quantity
-                
-                # Store service info properly for compatibility with order handlers
-                context.user_data["order"]["service_info"] = service_info
-                
-                # Get user language
-                user_id = query.from_user.id
-                language = db.get_language(user_id)
-                
-                # Show confirmation and ask for link/username
-                query.edit_message_text(
-                    get_message(language, 'order', 'quantity_set').format(quantity=quantity) + 
-                    "\n\n👉 Now please send the link for your order:",
-                    parse_mode="HTML"
-                )
-                
-                # Update state to wait for link
-                context.user_data["order_state"] = "waiting_for_link"
-                return
-            except Exception as e:
-                logger.error(f"Error processing quantity selection: {e}")
-                query.answer("Error processing quantity")
-                query.edit_message_text("There was an error processing your quantity selection. Please try again.")
-                return
+        # Check if this is the custom quantity option
+        if value == "custom":
+            # Get service info
+            service_info = context.user_data.get("selected_service", {}).get("info", {})
+            service_name = service_info.get("name", "Unknown Service")
+            min_qty = service_info.get("min", 1)
+            max_qty = service_info.get("max", 1000000)
+            
+            # Get user language
+            user_id = query.from_user.id
+            language = db.get_language(user_id)
+            
+            # Prompt user to enter a custom quantity
+            query.edit_message_text(
+                f"{get_message(language, 'order', 'order_quantity')}\n\n"
+                f"<b>Service:</b> {service_name}\n"
+                f"<b>Min:</b> {min_qty}\n"
+                f"<b>Max:</b> {max_qty}\n\n"
+                f"Please enter your desired quantity:",
+                parse_mode="HTML"
+            )
+            
+            # Update state to wait for custom quantity
+            context.user_data["order_state"] = "waiting_for_custom_quantity"
+            return
         
-        # Handle confirm button if not caught by conversation handler
-        if callback_data == "confirm" or callback_data == "order_confirm":
-            logger.info(f"Handling order confirmation in debug_callback: {callback_data}")
-            try:
-                from handlers.order import confirm_order
-                return confirm_order(update, context)
-            except Exception as e:
-                logger.error(f"Error handling order confirmation: {e}", exc_info=True)
-                query.answer("Error processing order")
-                query.edit_message_text(
-                    f"❌ <b>Order Failed</b>\n\n"
-                    f"An unexpected error occurred: {str(e)}\n\n"
-                    f"Please try again later or contact support.",
-                    parse_mode="HTML"
-                )
-                return
+        # Extract quantity from callback data
+        quantity = int(value)
+        logger.info(f"Selected quantity: {quantity}")
         
-        # Handle tutorial admin callbacks
-        if callback_data.startswith("tutorial_admin_edit_"):
-            logger.info(f"Handling tutorial admin edit callback in fallback handler: {callback_data}")
-            try:
-                # Import required function
-                from handlers.tutorial import admin_edit_tutorial
-                return admin_edit_tutorial(update, context)
-            except Exception as e:
-                logger.error(f"Error handling tutorial admin edit: {e}", exc_info=True)
-                query.answer("Error processing tutorial admin action")
-                return
+        # Get service info
+        service_info = context.user_data.get("selected_service", {}).get("info", {})
+        service_name = service_info.get("name", "Unknown Service")
+        
+        # Save the quantity to order context
+        if "order" not in context.user_data:
+            context.user_data["order"] = {}
+        context.user_data["order"]["quantity"] = quantity
+        
+        # Store service info properly for compatibility with order handlers
+        context.user_data["order"]["service_info"] = service_info
+        
+        # Get user language
+        user_id = query.from_user.id
+        language = db.get_language(user_id)
+        
+        # Show confirmation and ask for link/username
+        query.edit_message_text(
+            get_message(language, 'order', 'quantity_set').format(quantity=quantity) + 
+            "\n\n👉 Now please send the link for your order:",
+            parse_mode="HTML"
+        )
         
-        # Default handler for other callbacks - Try looking up the handler
-        logger.warning(f"Unhandled callback data: {callback_data}")
-        query.answer(f"Unhandled action: {callback_data}")
+        # Update state to wait for link
+        context.user_data["order_state"] = "waiting_for_link"
+        return
+    except Exception as e:
+        logger.error(f"Error processing quantity selection: {e}")
+        query.answer("Error processing quantity")
+        query.edit_message_text("There was an error processing your quantity selection. Please try again.")
+        return
+
+def _fallback_confirm(update, context):
+    """Handle confirm button if not caught by conversation handler"""
+    query = update.callback_query
+    callback_data = query.data
+    
+    logger.info(f"Handling order confirmation in debug_callback: {callback_data}")
+    try:
+        return confirm_order(update, context)
+    except Exception as e:
+        logger.error(f"Error handling order confirmation: {e}", exc_info=True)
+        query.answer("Error processing order")
+        query.edit_message_text(
+            f"❌ <b>Order Failed</b>\n\n"
+            f"An unexpected error occurred: {str(e)}\n\n"
+            f"Please try again later or contact support.",
+            parse_mode="HTML"
+        )
+        return
+
+# Callbacks not taken by any other handler, and the compact "namespace:action:args" ones
+for prefix, tutorial_handler in (
+    ("tutorial_edit_", tutorial_handlers.admin_edit_text),
+    ("tutorial_media_", tutorial_handlers.admin_select_media_type),
+    ("tutorial_admin_edit_", tutorial_handlers.admin_edit_tutorial),
+    ("tutorial_add_media_", tutorial_handlers.admin_add_media),
+    ("tutorial_delete_media_", tutorial_handlers.admin_delete_media),
+    ("tutorial_delete_media_item_", tutorial_handlers.admin_delete_media_item),
+    ("tutorial_publish_media_", tutorial_handlers.admin_publish_media)
+):
+    callback_router.add_prefix(prefix, _fallback_tutorial(tutorial_handler))
+callback_router.add_prefix("cat_", _fallback_category)
+callback_router.add_prefix("category_", _fallback_category)
+callback_router.add_prefix("plt_", _fallback_platform)
+callback_router.add_prefix("platform_", _fallback_platform)
+callback_router.add_exact("back_to_platforms", _fallback_platform)
+callback_router.add_exact("back_to_categories", _fallback_back_to_categories)
+callback_router.add_prefix("page_", _fallback_page)
+callback_router.add_exact("search_services", _fallback_search)
+callback_router.add_exact("view_search_results", _fallback_search)
+callback_router.add_exact("confirm_order", _fallback_confirm_order)
+callback_router.add_exact("cancel_order", _fallback_cancel_order)
+callback_router.add_prefix("service_", _fallback_select_service)
+callback_router.add_prefix("quick_", _fallback_select_service)
+callback_router.add("order", "qty", _fallback_quantity)
+callback_router.add_prefix("qty_", _fallback_quantity)
+callback_router.add_exact("confirm", _fallback_confirm)
+callback_router.add_exact("order_confirm", _fallback_confirm)
+
+def debug_callback(update, context):
+    """Fallback handler for debugging"""
+    query = update.callback_query
+    
+    if query:
+        logger.debug(f"Received callback: {query.data}")
+        matched, result = callback_router.dispatch(update, context)
+        if matched:
+            return result
+        
+        # Default handler for other callbacks
+        logger.warning(f"Unhandled callback data: {query.data}")
+        query.answer(f"Unhandled action: {query.data}")
         return
     
     # For text messages - IMPORTANT FOR NEW FLOW
@@ -878,23 +821,95 @@ def customer_service_command(update: Update, context: CallbackContext):
     # Redirect to support command
     return support_command(update, context)
 
-def main():
-    """Start the bot"""
-    # Get the token from environment variables
-    token = os.getenv("TELEGRAM_BOT_TOKEN")
-    
-    if not token:
-        logger.error("TELEGRAM_BOT_TOKEN not set in environment variables")
-        return
+def reconcile_user_totals_job(context: CallbackContext):
+    """Periodic job that verifies the user_totals summaries against the raw ledger"""
+    mismatched = db.reconcile_user_totals()
+    if mismatched:
+        logger.warning(f"user_totals drifted for {len(mismatched)} users: {mismatched[:20]}")
+    else:
+        logger.info("user_totals verified against ledger")
+
+def register_metrics_sources(dispatcher):
+    """Export the counters of the panel client, order queue, router, logging and persistence"""
+    metrics.register_stats('bot_panel_retry', api_client.get_retry_stats)
+    metrics.register_stats('bot_panel_scheduler', api_client.get_scheduler_stats, keyed=True)
+    metrics.register_stats('bot_panel_coalescing', api_client.get_coalescing_stats, keyed=True)
+    metrics.register_stats('bot_panel_endpoint', api_client.get_endpoint_health, keyed=True)
+    metrics.register_stats('bot_order_status_cache', api_client.get_status_cache_stats)
+    metrics.register_stats('bot_order_queue', db.get_order_queue_stats)
+    metrics.register_stats('bot_callback_router', callback_router.stats)
+    metrics.register_stats('bot_command_menu', get_command_menu_stats)
+    metrics.register_stats('bot_update_queue', lambda: {'size': dispatcher.update_queue.qsize()})
+    metrics.register_stats('bot_logging', get_logging_stats)
+    if dispatcher.persistence:
+        metrics.register_stats('bot_persistence', dispatcher.persistence.stats)
+
+def build_updater(token, request=None):
+    """Create the Updater with a configurable number of workers and update queue size
     
-    logger.info(f"Starting bot with token: {token[:5]}...")
+    UPDATE_QUEUE_SIZE bounds the updates waiting for the dispatcher (0 means
+    unbounded); when it is full, intake blocks until the dispatcher catches up.
+    Conversation states and user_data are kept in SQLite across restarts.
     
-    # Create the Updater and pass it the bot's token
-    updater = Updater(token=token, use_context=True)
+    Args:
+        token (str): Bot token
+        request (Request, optional): Connection to the Bot API, e.g. a stub in load tests
+    """
+    workers = int(os.getenv("UPDATE_WORKERS", "8"))
+    queue_size = int(os.getenv("UPDATE_QUEUE_SIZE", "0"))
     
-    # Get the dispatcher to register handlers
-    dispatcher = updater.dispatcher
+    # One connection per worker plus dispatcher, updater, job queue and main thread
+    bot = ExtBot(token, request=request or Request(con_pool_size=workers + 4))
+    job_queue = JobQueue()
+    dispatcher = Dispatcher(
+        bot, Queue(maxsize=queue_size), workers=workers, job_queue=job_queue,
+        persistence=SQLitePersistence(), use_context=True
+    )
+    job_queue.set_dispatcher(dispatcher)
+    return Updater(dispatcher=dispatcher, workers=None)
+
+def start_receiving_updates(updater, token):
+    """Start the webhook server if BOT_MODE is webhook, long polling otherwise"""
+    if os.getenv("BOT_MODE", "polling").lower() != "webhook":
+        updater.start_polling(
+            timeout=int(os.getenv("POLLING_TIMEOUT", "10")),
+            drop_pending_updates=os.getenv("DROP_PENDING_UPDATES", "false").lower() == "true"
+        )
+        logger.info("Bot started and polling for updates")
+        return
     
+    # The token as default path keeps the endpoint unguessable
+    url_path = os.getenv("WEBHOOK_PATH", token)
+    webhook_url = os.getenv("WEBHOOK_URL")
+    updater.start_webhook(
+        listen=os.getenv("WEBHOOK_LISTEN", "0.0.0.0"),
+        port=int(os.getenv("WEBHOOK_PORT", "8443")),
+        url_path=url_path,
+        cert=os.getenv("WEBHOOK_CERT"),
+        key=os.getenv("WEBHOOK_KEY"),
+        webhook_url=f"{webhook_url.rstrip('/')}/{url_path}",
+        max_connections=int(os.getenv("WEBHOOK_MAX_CONNECTIONS", "40")),
+        drop_pending_updates=os.getenv("DROP_PENDING_UPDATES", "false").lower() == "true"
+    )
+    logger.info(f"Bot started and listening for updates on port {os.getenv('WEBHOOK_PORT', '8443')}")
+
+_record_lock = threading.Lock()
+
+def record_update(update: Update, context: CallbackContext):
+    """Append every incoming update to UPDATE_RECORD_FILE, for replay with tools/replay_updates.py"""
+    with _record_lock:
+        with open(os.getenv("UPDATE_RECORD_FILE"), "a") as f:
+            f.write(json.dumps(update.to_dict()) + "\n")
+
+def register_handlers(dispatcher):
+    """Add all handlers of the bot to the dispatcher, in priority order"""
+    # Optionally record updates as they arrive, before any other handler
+    if os.getenv("UPDATE_RECORD_FILE"):
+        dispatcher.add_handler(TypeHandler(Update, record_update), group=-1)
+
+    # Compact "namespace:action:args" callbacks go straight to the router
+    dispatcher.add_handler(CallbackQueryHandler(callback_router.handle, pattern=CallbackRouter.COMPACT_PATTERN))
+
     # Add command handlers
     dispatcher.add_handler(CommandHandler("start", start_command))
     
@@ -904,7 +919,7 @@ def main():
     # Add other command handlers
     dispatcher.add_handler(CommandHandler("help", help_command))
     dispatcher.add_handler(CommandHandler("balance", balance_command))
-    dispatcher.add_handler(CommandHandler("account", account_command))
+    dispatcher.add_handler(CommandHandler("account", run_async_per_user(account_command)))
     dispatcher.add_handler(CommandHandler("support", support_command))
     
     # Add new menu command handlers
@@ -927,7 +942,7 @@ def main():
         ],
         states={
             STATUS_WAITING_FOR_ID: [
-                MessageHandler(Filters.text & ~Filters.command, handle_order_id),
+                MessageHandler(Filters.text & ~Filters.command, run_async_per_user(handle_order_id)),
                 CallbackQueryHandler(status_command, pattern=r"^show_order_ids$"),
                 CallbackQueryHandler(status_command, pattern=r"^check_status$"),
                 CallbackQueryHandler(start_command, pattern=r"^back_to_main$")
@@ -938,16 +953,19 @@ def main():
             CallbackQueryHandler(start_command, pattern=r"^cancel$"),
             CallbackQueryHandler(start_command, pattern=r"^back_to_main$")
         ],
-        allow_reentry=True
+        allow_reentry=True,
+        name="status",
+        persistent=True
     )
-    dispatcher.add_handler(status_conv_handler)
+    dispatcher.add_handler(serialize_conversation(status_conv_handler))
     
     # Add refresh status callback handler
-    dispatcher.add_handler(CallbackQueryHandler(refresh_status_callback, pattern=r"^refresh_status"))
+    dispatcher.add_handler(CallbackQueryHandler(run_async_per_user(refresh_status_callback), pattern=r"^refresh_status"))
     
     # Add admin conversation handler
     dispatcher.add_handler(admin_conv_handler)
-    dispatcher.add_handler(CallbackQueryHandler(broadcast_confirm, pattern=r"^broadcast_"))
+    dispatcher.add_handler(CommandHandler("dbprofile", db_profile_command))
+    dispatcher.add_handler(CallbackQueryHandler(run_async_per_user(broadcast_confirm), pattern=r"^broadcast_"))
     
     # Add admin stats detail view handlers
     dispatcher.add_handler(CallbackQueryHandler(admin_menu_callback, pattern=r"^admin_view_all_users$"))
@@ -962,9 +980,9 @@ def main():
     # Add conversation handler for ordering
     order_conv_handler = ConversationHandler(
         entry_points=[
-            CommandHandler("services", services_command),
+            CommandHandler("services", run_async_per_user(services_command)),
             CommandHandler("order", order_command),
-            CallbackQueryHandler(services_command, pattern=r"^show_services$"),
+            CallbackQueryHandler(run_async_per_user(services_command), pattern=r"^show_services$"),
             CallbackQueryHandler(order_command, pattern=r"^place_order$"),
         ],
         states={
@@ -1000,8 +1018,8 @@ def main():
                 MessageHandler(Filters.text & ~Filters.command, process_comments)
             ],
             CONFIRMING_ORDER: [
-                CallbackQueryHandler(confirm_order, pattern=r"^order_confirm$"),
-                CallbackQueryHandler(confirm_order, pattern=r"^confirm$"),
+                CallbackQueryHandler(run_async_per_user(confirm_order), pattern=r"^order_confirm$"),
+                CallbackQueryHandler(run_async_per_user(confirm_order), pattern=r"^confirm$"),
                 CallbackQueryHandler(lambda update, context: start_command(update, context), pattern=r"^order_cancel$"),
                 CallbackQueryHandler(lambda update, context: start_command(update, context), pattern=r"^cancel$")
             ],
@@ -1010,16 +1028,24 @@ def main():
             CommandHandler("start", start_command),
             CallbackQueryHandler(start_command, pattern=r"^cancel$")
         ],
-        allow_reentry=True
+        allow_reentry=True,
+        name="order",
+        persistent=True
     )
-    dispatcher.add_handler(order_conv_handler)
+    dispatcher.add_handler(serialize_conversation(order_conv_handler))
+    
+    # Add mass order handler (many orders pasted or uploaded at once)
+    dispatcher.add_handler(mass_order_conv_handler)
+    
+    # Add drip-feed handler (large orders spread over scheduled runs)
+    dispatcher.add_handler(drip_feed_conv_handler)
     
     # Add callback query handlers for other main menu items
     dispatcher.add_handler(CallbackQueryHandler(balance_command, pattern=r"^show_balance$"))
     dispatcher.add_handler(CallbackQueryHandler(refresh_balance_callback, pattern=r"^refresh_balance$"))
     dispatcher.add_handler(CallbackQueryHandler(help_command, pattern=r"^help$"))
-    dispatcher.add_handler(CallbackQueryHandler(account_command, pattern=r"^show_account$"))
-    dispatcher.add_handler(CallbackQueryHandler(refresh_account_callback, pattern=r"^refresh_account$"))
+    dispatcher.add_handler(CallbackQueryHandler(run_async_per_user(account_command), pattern=r"^show_account$"))
+    dispatcher.add_handler(CallbackQueryHandler(run_async_per_user(refresh_account_callback), pattern=r"^refresh_account$"))
     dispatcher.add_handler(CallbackQueryHandler(support_command, pattern=r"^support$"))
     
     # Add referrals command handler
@@ -1052,45 +1078,109 @@ def main():
     # Add handler to show command menu when user sends a photo, video, document, or voice message
     dispatcher.add_handler(MessageHandler(
         Filters.photo | Filters.video | Filters.document | Filters.voice,
-        lambda update, context: show_command_menu(update, context)
-    ))
-    
-    # Add a handler to ensure the command menu is shown for all users
-    # This will be called for any message that isn't handled by other handlers
-    dispatcher.add_handler(MessageHandler(
-        Filters.all & ~Filters.update.edited_message,
         lambda update, context: ensure_command_menu(update, context)
-    ), group=999)  # Use a high group number to make this run last
+    ))
     
     # Debug handler for unhandled callbacks - logs and processes them
     dispatcher.add_handler(CallbackQueryHandler(debug_callback))
+
+def schedule_jobs(job_queue):
+    """Schedule the periodic background jobs"""
+    # Verify the per-user spending/balance summaries periodically (default every 6 hours)
+    job_queue.run_repeating(
+        reconcile_user_totals_job,
+        interval=int(os.getenv("TOTALS_RECONCILE_INTERVAL", "21600")),
+        first=60
+    )
     
-    # Start the Bot
-    updater.start_polling()
-    logger.info("Bot started and polling for updates")
+    # Write conversation states and user_data changes in batches (default every 5 seconds)
+    job_queue.run_repeating(
+        flush_persistence_job,
+        interval=float(os.getenv("PERSISTENCE_FLUSH_INTERVAL", "5")),
+        first=5
+    )
     
-    # Run the bot until you press Ctrl-C
-    updater.idle()
+    # Keep only recently active users' user_data in memory (default: idle for 30 minutes)
+    user_data_idle = int(os.getenv("USER_DATA_IDLE_SECONDS", "1800"))
+    job_queue.run_repeating(
+        evict_idle_user_data_job,
+        interval=max(60, user_data_idle // 4),
+        first=user_data_idle,
+        context=user_data_idle
+    )
     
-    logger.info("Bot stopped")
+    # Move due drip-feed runs to the order queue; one timer for all scheduled runs
+    job_queue.run_repeating(
+        process_drip_feeds,
+        interval=int(os.getenv("DRIP_FEED_INTERVAL", "30")),
+        first=10
+    )
 
-def ensure_command_menu(update: Update, context: CallbackContext) -> None:
-    """Ensure the command menu is shown for all users"""
-    # Only process if this is a message
-    if not update.message:
+def main():
+    """Start the bot"""
+    # Get the token from environment variables
+    token = os.getenv("TELEGRAM_BOT_TOKEN")
+    
+    if not token:
+        logger.error("TELEGRAM_BOT_TOKEN not set in environment variables")
+        return
+    
+    # Telegram must be told the public address of the webhook
+    if os.getenv("BOT_MODE", "polling").lower() == "webhook" and not os.getenv("WEBHOOK_URL"):
+        logger.error("WEBHOOK_URL must be set when BOT_MODE is webhook")
         return
     
-    # Check if the user already has the command menu active
-    if not context.user_data.get('command_menu_active', False):
+    logger.info(f"Starting bot with token: {token[:5]}...")
+    startup_timer.mark("imports")
+    
+    # Slow startup work runs in the background while handlers are registered
+    rates_thread = startup_timer.run_in_background("currency_rates", load_currency_rates_from_db)
+    detect_thread = api_client.start_endpoint_detection()
+    if detect_thread:
+        startup_timer.run_in_background("api_endpoint", detect_thread.join)
+    
+    # Create the Updater and pass it the bot's token
+    updater = build_updater(token)
+    
+    # The "/" command list is set once for all users instead of per message
+    startup_timer.run_in_background("bot_commands", set_bot_commands, updater.bot)
+    
+    # Get the dispatcher to register handlers
+    dispatcher = updater.dispatcher
+    
+    # Register every handler and the periodic jobs
+    register_handlers(dispatcher)
+    schedule_jobs(updater.job_queue)
+    
+    # Latency and error metrics for every handler, scraped from a local port
+    instrument_handlers(dispatcher)
+    register_metrics_sources(dispatcher)
+    metrics_port = int(os.getenv("METRICS_PORT", "9108"))
+    if metrics_port:
         try:
-            # Import here to avoid circular imports
-            from handlers.command_menu import show_command_menu
-            show_command_menu(update, context)
-        except Exception as e:
-            logger.error(f"Error ensuring command menu: {e}")
+            metrics.start_server(metrics_port, os.getenv("METRICS_HOST", "127.0.0.1"))
+        except OSError as e:
+            logger.error(f"Could not start metrics server on port {metrics_port}: {e}")
     
-    # Let the message be processed by other handlers
-    return
+    startup_timer.mark("handlers")
+    
+    # Prices must not be shown with the default currency rates
+    rates_thread.join()
+    startup_timer.mark("wait_currency_rates")
+    
+    # Start the workers that submit queued orders to the panel
+    order_workers.start(updater.bot)
+    
+    # Start the Bot
+    start_receiving_updates(updater, token)
+    startup_timer.mark("start_receiving")
+    startup_timer.report()
+    
+    # Run the bot until you press Ctrl-C
+    updater.idle()
+    
+    order_workers.stop()
+    logger.info("Bot stopped")
 
 if __name__ == "__main__":
     main() 
\ No newline at end of file
@@ -1,3 +1,4 @@
+import html
 import logging
 import os
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, InputMediaPhoto, InputMediaVideo
@@ -5,7 +6,9 @@ from telegram.ext import CallbackContext, ConversationHandler, CommandHandler, C
 
 from utils.api_client import api_client
 from utils.db import db
-from utils.helpers import is_admin
+from utils.helpers import is_admin, format_sparkline
+from utils.concurrency import run_async_per_user, serialize_conversation
+from utils.db_profiler import profiler
 
 # Define states
 ADMIN_MENU, BROADCASTING, VIEWING_STATS, ADDING_BALANCE, REMOVING_BALANCE, ENTERING_USER_ID, ENTERING_BALANCE_AMOUNT, ENTERING_REFERRAL_SETTINGS, ENTERING_CURRENCY_RATE, MANAGING_SERVICE_PRICES, ENTERING_SERVICE_ID, ENTERING_SERVICE_PRICE, ENTERING_PRICE_RANGE, REMOVING_BALANCE_OPTIONS, BROADCAST_MEDIA_TYPE, BROADCAST_CONTENT, BROADCAST_COLLECTION = range(17)
@@ -45,6 +48,39 @@ def admin_command(update: Update, context: CallbackContext):
     
     return ADMIN_MENU
 
+def db_profile_command(update: Update, context: CallbackContext):
+    """Handler for /dbprofile [n|reset] - top SQLite statements and write lock holders"""
+    user = update.effective_user
+    
+    if not is_admin(user.id):
+        update.message.reply_text("❌ You don't have permission to use this command.")
+        return
+    
+    if not profiler.enabled:
+        update.message.reply_text("Query profiling is off. Start the bot with SQLITE_PROFILE=1 to enable it.")
+        return
+    
+    if context.args and context.args[0] == "reset":
+        profiler.reset()
+        update.message.reply_text("Query profile reset.")
+        return
+    
+    try:
+        count = int(context.args[0]) if context.args else 10
+    except ValueError:
+        count = 10
+    
+    # Telegram messages are limited to 4096 characters, so the escaped report is cut to fit in <pre></pre>
+    report = html.escape(profiler.report(max(1, min(count, 50))))
+    limit = 4096 - len("<pre></pre>")
+    if len(report) > limit:
+        report = report[:limit]
+        # Don't leave half an entity like "&am" at the cut
+        amp = report.rfind("&", limit - 6)
+        if amp != -1 and ";" not in report[amp:]:
+            report = report[:amp]
+    update.message.reply_text(f"<pre>{report}</pre>", parse_mode="HTML")
+
 def admin_menu_callback(update: Update, context: CallbackContext):
     """Handle admin menu callbacks"""
     query = update.callback_query
@@ -288,21 +324,27 @@ def show_stats(update: Update, context: CallbackContext):
     """Show bot statistics"""
     query = update.callback_query
     
-    # Get statistics from database
-    total_users = db.get_total_users()
-    active_users = db.get_active_users(days=7)
-    total_orders = db.get_total_orders()
-    recent_orders = db.get_recent_orders(days=7)
+    # Get statistics from the running counters and daily rollups
+    stats = db.get_dashboard_stats(days=7)
+    daily_stats = db.get_daily_stats(days=90)
     
     # Format statistics message
     stats_message = (
         f"📊 <b>Bot Statistics</b>\n\n"
-        f"👥 Total Users: {total_users}\n"
-        f"👤 Active Users (7d): {active_users}\n"
-        f"📦 Total Orders: {total_orders}\n"
-        f"📦 Recent Orders (7d): {recent_orders}\n"
+        f"👥 Total Users: {stats['total_users']}\n"
+        f"👤 Active Users (7d): {stats['active_users']}\n"
+        f"📦 Total Orders: {stats['total_orders']}\n"
+        f"📦 Recent Orders (7d): {stats['recent_orders']}\n"
     )
     
+    # Add trend sparklines for 7, 30 and 90 days
+    for label, key in [("📦 Orders", "orders"), ("🆕 New Users", "new_users"), ("👤 Active Users", "active_users")]:
+        stats_message += f"\n<b>{label}</b>\n"
+        for days in (7, 30, 90):
+            values = [day[key] for day in daily_stats[-days:]]
+            total = f" {sum(values)}" if key != "active_users" else ""
+            stats_message += f"<code>{days:>2}d {format_sparkline(values)}</code>{total}\n"
+    
     # Create keyboard with detailed view buttons
     keyboard = [
         [InlineKeyboardButton("👥 View All Users", callback_data="admin_view_all_users")],
@@ -333,8 +375,8 @@ def handle_user_id_input(update: Update, context: CallbackContext):
     # Look up user based on input type
     user_data = None
     if is_numeric:
-        # Lookup by user ID
-        user_data = db.get_user(user_id)
+        # Lookup by user ID (without creating a user for an unknown ID)
+        user_data = db.find_user(user_id)
         if user_data:
             user_id = user_data['user_id']
     else:
@@ -1539,9 +1581,10 @@ def process_referral_bonus(update: Update, context: CallbackContext, bonus_id, s
     
     if success:
         # Get the user ID for notification
-        cursor = db.conn.cursor()
-        cursor.execute('SELECT user_id FROM referral_bonuses WHERE id = ?', (bonus_id,))
-        user_id = cursor.fetchone()[0]
+        with db.write_lock:
+            cursor = db.conn.cursor()
+            cursor.execute('SELECT user_id FROM referral_bonuses WHERE id = ?', (bonus_id,))
+            user_id = cursor.fetchone()[0]
         
         # Notify the user
         try:
@@ -1763,7 +1806,7 @@ def handle_referral_settings_input(update: Update, context: CallbackContext):
 def show_user_referrals(update: Update, context: CallbackContext, user_id, page=1):
     """Show referrals for a specific user with verification options"""
     # Get user data
-    user_data = context.user_data.get('target_user_data') or db.get_user(user_id)
+    user_data = context.user_data.get('target_user_data') or db.find_user(user_id) or {}
     
     # Get all referrals for this user
     all_referrals = db.get_referrals(user_id)
@@ -2085,12 +2128,11 @@ def show_all_orders(update: Update, context: CallbackContext, page=1):
     """Show list of all orders with pagination"""
     query = update.callback_query
     
-    # Get all orders from database
-    orders = db.get_all_orders(limit=1000)  # Limit to 1000 orders for performance
+    # Count all orders (rows for the current page are fetched below)
+    total_orders = db.get_total_orders()
     
     # Pagination settings
     items_per_page = 10
-    total_orders = len(orders)
     total_pages = max(1, (total_orders + items_per_page - 1) // items_per_page)  # Ceiling division
     
     # Ensure page is valid
@@ -2100,8 +2142,8 @@ def show_all_orders(update: Update, context: CallbackContext, page=1):
     start_idx = (page - 1) * items_per_page
     end_idx = min(start_idx + items_per_page, total_orders)
     
-    # Get orders for current page
-    page_orders = orders[start_idx:end_idx]
+    # Get orders for current page, joined with user details in one query
+    page_orders = db.get_orders_with_users(limit=items_per_page, offset=start_idx)
     
     # Format order list
     order_list = ""
@@ -2112,11 +2154,10 @@ def show_all_orders(update: Update, context: CallbackContext, page=1):
         created_at = order.get('created_at', '')
         status = order.get('status', '')
         
-        # Get user info
-        user = db.get_user(user_id)
-        username = user.get('username', '')
-        first_name = user.get('first_name', '')
-        last_name = user.get('last_name', '')
+        # User info comes from the joined users columns
+        username = order.get('username') or ''
+        first_name = order.get('first_name') or ''
+        last_name = order.get('last_name') or ''
         
         # Format user display with both username and real name if available
         user_display = ""
@@ -2201,12 +2242,11 @@ def show_recent_orders(update: Update, context: CallbackContext, page=1):
     """Show list of recent orders (last 7 days) with pagination"""
     query = update.callback_query
     
-    # Get recent orders from database
-    orders = db.get_recent_orders_list(days=7, limit=1000)  # Limit to 1000 orders for performance
+    # Count recent orders (rows for the current page are fetched below)
+    total_orders = db.get_recent_orders(days=7)
     
     # Pagination settings
     items_per_page = 10
-    total_orders = len(orders)
     total_pages = max(1, (total_orders + items_per_page - 1) // items_per_page)  # Ceiling division
     
     # Ensure page is valid
@@ -2216,8 +2256,8 @@ def show_recent_orders(update: Update, context: CallbackContext, page=1):
     start_idx = (page - 1) * items_per_page
     end_idx = min(start_idx + items_per_page, total_orders)
     
-    # Get orders for current page
-    page_orders = orders[start_idx:end_idx]
+    # Get orders for current page, joined with user details in one query
+    page_orders = db.get_orders_with_users(days=7, limit=items_per_page, offset=start_idx)
     
     # Format order list
     order_list = ""
@@ -2228,11 +2268,10 @@ def show_recent_orders(update: Update, context: CallbackContext, page=1):
         created_at = order.get('created_at', '')
         status = order.get('status', '')
         
-        # Get user info
-        user = db.get_user(user_id)
-        username = user.get('username', '')
-        first_name = user.get('first_name', '')
-        last_name = user.get('last_name', '')
+        # User info comes from the joined users columns
+        username = order.get('username') or ''
+        first_name = order.get('first_name') or ''
+        last_name = order.get('last_name') or ''
         
         # Format user display with both username and real name if available
         user_display = ""
@@ -2826,7 +2865,7 @@ def reset_service_price(update: Update, context: CallbackContext, service_id):
     return show_price_overrides(update, context)
 
 # Create conversation handler for admin commands
-admin_conv_handler = ConversationHandler(
+admin_conv_handler = serialize_conversation(ConversationHandler(
     entry_points=[CommandHandler('admin', admin_command)],
     states={
         ADMIN_MENU: [
@@ -2834,7 +2873,7 @@ admin_conv_handler = ConversationHandler(
             CallbackQueryHandler(confirm_add_balance, pattern=r'^confirm_add_balance$'),
             CallbackQueryHandler(confirm_remove_balance, pattern=r'^confirm_remove'),
             CallbackQueryHandler(handle_remove_balance_options, pattern=r'^admin_remove_'),
-            CallbackQueryHandler(broadcast_confirm, pattern=r'^broadcast_confirm$|^broadcast_cancel$')
+            CallbackQueryHandler(run_async_per_user(broadcast_confirm), pattern=r'^broadcast_confirm$|^broadcast_cancel$')
         ],
         BROADCAST_MEDIA_TYPE: [
             CallbackQueryHandler(handle_broadcast_media_type, pattern=r'^broadcast_type_')
@@ -2886,5 +2925,7 @@ admin_conv_handler = ConversationHandler(
         CommandHandler('cancel', cancel_command),
         CallbackQueryHandler(cancel_command, pattern=r'^cancel$')
     ],
-    allow_reentry=True
-)
\ No newline at end of file
+    allow_reentry=True,
+    name="admin",
+    persistent=True
+))
\ No newline at end of file
@@ -1,6 +1,7 @@
-from telegram import Update, ReplyKeyboardMarkup, KeyboardButton, ReplyKeyboardRemove
+from telegram import Update, ReplyKeyboardMarkup, KeyboardButton, ReplyKeyboardRemove, BotCommand
 from telegram.ext import CallbackContext, CommandHandler, MessageHandler, Filters
 import logging
+import threading
 from utils.db import db
 from utils.helpers import is_admin
 from utils.messages import get_message
@@ -8,6 +9,62 @@ from utils.messages import get_message
 # Module logger
 logger = logging.getLogger(__name__)
 
+# Commands listed in Telegram's "/" menu, set once for all users at startup
+BOT_COMMANDS = [
+    ("start", "Main menu"),
+    ("services", "Browse services"),
+    ("recharge", "Add funds"),
+    ("balance", "Check balance"),
+    ("my_orders", "My orders"),
+    ("check_order", "Check an order"),
+    ("referrals", "Referrals"),
+    ("customer_service", "Support"),
+    ("menu", "Show or hide the command keyboard")
+]
+
+# Outgoing Telegram calls made and avoided for the command menu
+menu_stats = {'sent': 0, 'saved': 0}
+_stats_lock = threading.Lock()
+
+def _count(key):
+    with _stats_lock:
+        menu_stats[key] += 1
+
+def get_command_menu_stats():
+    """Command menu keyboards sent and sends skipped because the user already has it"""
+    with _stats_lock:
+        return dict(menu_stats)
+
+def set_bot_commands(bot):
+    """Register the bot commands with Telegram, one call for all users"""
+    try:
+        bot.set_my_commands([BotCommand(command, description) for command, description in BOT_COMMANDS])
+        logger.info(f"Registered {len(BOT_COMMANDS)} bot commands")
+    except Exception as e:
+        logger.error(f"Error registering bot commands: {e}")
+
+def is_command_menu_active(user_id, context: CallbackContext):
+    """Whether the user has the command menu keyboard
+    
+    The state is read from the database once and then kept in user_data.
+    
+    Returns:
+        bool: The menu state, or None if it was never sent to the user
+    """
+    if 'command_menu_active' not in context.user_data:
+        context.user_data['command_menu_active'] = db.get_command_menu_state(user_id)
+    return context.user_data['command_menu_active']
+
+def ensure_command_menu(update: Update, context: CallbackContext) -> None:
+    """Send the command menu keyboard unless the user already got it"""
+    if not update.message or not update.effective_user:
+        return
+    
+    if is_command_menu_active(update.effective_user.id, context) is None:
+        show_command_menu(update, context)
+    else:
+        _count('saved')
+
 def show_command_menu(update: Update, context: CallbackContext) -> None:
     """Show a persistent keyboard with common commands"""
     user = update.effective_user
@@ -63,6 +120,8 @@ def show_command_menu(update: Update, context: CallbackContext) -> None:
             reply_markup=reply_markup
         )
         context.user_data['command_menu_active'] = True
+        db.set_command_menu_state(user.id, True)
+        _count('sent')
     except Exception as e:
         logger.error(f"Error showing command menu: {e}")
     
@@ -76,6 +135,7 @@ def hide_command_menu(update: Update, context: CallbackContext) -> None:
             reply_markup=ReplyKeyboardRemove()
         )
         context.user_data['command_menu_active'] = False
+        db.set_command_menu_state(update.effective_user.id, False)
         logger.info(f"Hiding command menu for user {update.effective_user.id}")
     except Exception as e:
         logger.error(f"Error hiding command menu: {e}")
@@ -84,8 +144,8 @@ def toggle_command_menu(update: Update, context: CallbackContext) -> None:
     """Toggle the command menu on/off"""
     user_id = update.effective_user.id
     
-    # Check if the user has the menu active (stored in user_data)
-    menu_active = context.user_data.get('command_menu_active', False)
+    # Check if the user has the menu active
+    menu_active = is_command_menu_active(user_id, context)
     
     if menu_active:
         # Hide the menu
@@ -0,0 +1,332 @@
+import html
+import logging
+import os
+from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.ext import CallbackContext, ConversationHandler, CommandHandler, CallbackQueryHandler, MessageHandler, Filters
+
+from utils.db import db
+from utils.helpers import calculate_order_price
+from utils.constants import CURRENCY_RATES
+from utils.messages import get_message
+from utils.order_queue import order_workers
+from handlers.services import get_service_by_id
+
+logger = logging.getLogger(__name__)
+
+# States
+WAITING_FOR_PLAN = 1
+CONFIRMING_PLAN = 2
+
+# Limits for one plan
+DRIP_FEED_MAX_RUNS = int(os.getenv("DRIP_FEED_MAX_RUNS", "500"))
+DRIP_FEED_MIN_INTERVAL = 1  # minutes
+DRIP_FEED_MAX_INTERVAL = 7 * 24 * 60  # minutes
+
+# Slices moved to the order queue per scheduler pass
+DRIP_FEED_BATCH = int(os.getenv("DRIP_FEED_BATCH", "200"))
+
+def build_drip_slices(service, total_quantity, slice_quantity):
+    """Split a drip-feed into runs and price each of them
+
+    The remainder becomes a last, smaller run, or is added to the previous
+    run if it is below the service minimum.
+
+    Returns:
+        list: (quantity, price) for every run
+
+    Raises:
+        ValueError: If the plan does not fit the service limits
+    """
+    # Convert min/max to integers before comparing
+    try:
+        min_quantity = int(service.get("min", 1))
+        max_quantity = int(service.get("max", 1000000))
+    except (ValueError, TypeError):
+        min_quantity = 1
+        max_quantity = 1000000
+
+    if slice_quantity < min_quantity:
+        raise ValueError(f"Quantity per run must be at least {min_quantity}")
+    if slice_quantity > max_quantity:
+        raise ValueError(f"Quantity per run must be at most {max_quantity}")
+    if total_quantity < slice_quantity:
+        raise ValueError("Total quantity must be at least the quantity per run")
+
+    quantities = [slice_quantity] * (total_quantity // slice_quantity)
+    remainder = total_quantity % slice_quantity
+    if remainder:
+        if remainder >= min_quantity:
+            quantities.append(remainder)
+        elif quantities[-1] + remainder <= max_quantity:
+            quantities[-1] += remainder
+        else:
+            raise ValueError(f"The last run would be {remainder}, below the minimum of {min_quantity}")
+
+    if len(quantities) > DRIP_FEED_MAX_RUNS:
+        raise ValueError(f"A drip-feed can have at most {DRIP_FEED_MAX_RUNS} runs")
+
+    return [(quantity, calculate_order_price(service, quantity)) for quantity in quantities]
+
+def _active_plans_text(user_id, language):
+    """List the user's active drip-feeds with a cancel button for each"""
+    plans = db.get_drip_feeds(user_id)
+    if not plans:
+        return "", []
+
+    text = get_message(language, 'drip_feed', 'active_header')
+    buttons = []
+    for plan in plans:
+        text += get_message(language, 'drip_feed', 'active_item').format(
+            id=plan['id'],
+            service_name=plan['service_name'],
+            started=plan['runs_started'],
+            runs=plan['runs'],
+            slice_quantity=plan['slice_quantity'],
+            interval=plan['interval_seconds'] // 60
+        )
+        buttons.append([InlineKeyboardButton(
+            get_message(language, 'drip_feed', 'cancel_plan_button').format(id=plan['id']),
+            callback_data=f"drip_stop_{plan['id']}"
+        )])
+    return text + "\n", buttons
+
+def drip_feed_command(update: Update, context: CallbackContext):
+    """Handler for /dripfeed command"""
+    user = update.effective_user
+    db.update_user_activity(user.id)
+
+    # Get user's language preference
+    language = db.get_language(user.id)
+
+    context.user_data.pop("drip_feed", None)
+    plans_text, buttons = _active_plans_text(user.id, language)
+    update.message.reply_html(
+        plans_text + get_message(language, 'drip_feed', 'instructions'),
+        reply_markup=InlineKeyboardMarkup(buttons) if buttons else None
+    )
+    return WAITING_FOR_PLAN
+
+def process_drip_feed_plan(update: Update, context: CallbackContext):
+    """Validate a drip-feed line and ask for confirmation"""
+    user = update.effective_user
+    db.update_user_activity(user.id)
+    language = db.get_language(user.id)
+
+    fields = [field.strip() for field in update.message.text.split("|")]
+    if len(fields) != 5:
+        fields = update.message.text.split()
+
+    try:
+        service_id, link = fields[0], fields[1]
+        total_quantity, slice_quantity, interval = int(fields[2]), int(fields[3]), int(fields[4])
+    except (IndexError, ValueError):
+        update.message.reply_html(get_message(language, 'drip_feed', 'invalid_format'))
+        return WAITING_FOR_PLAN
+
+    service = get_service_by_id(service_id)
+    try:
+        if not service:
+            raise ValueError(f"Unknown service {service_id}")
+        if not link:
+            raise ValueError("Missing link")
+        if not DRIP_FEED_MIN_INTERVAL <= interval <= DRIP_FEED_MAX_INTERVAL:
+            raise ValueError(f"Minutes between runs must be between {DRIP_FEED_MIN_INTERVAL} and {DRIP_FEED_MAX_INTERVAL}")
+        slices = build_drip_slices(service, total_quantity, slice_quantity)
+    except ValueError as e:
+        update.message.reply_html(
+            get_message(language, 'drip_feed', 'invalid_plan').format(reason=html.escape(str(e)))
+        )
+        return WAITING_FOR_PLAN
+
+    # Always show both USD and ETB prices
+    total = sum(price for _, price in slices)
+    user_balance = db.get_balance(user.id)
+    etb_total = total * CURRENCY_RATES["ETB"]
+    etb_balance = user_balance * CURRENCY_RATES["ETB"]
+
+    context.user_data["drip_feed"] = {
+        "service_id": str(service.get("service")),
+        "service_name": service.get("name", "Unknown Service"),
+        "link": link,
+        "slices": slices,
+        "interval": interval
+    }
+
+    keyboard = [
+        [
+            InlineKeyboardButton(get_message(language, 'drip_feed', 'confirm_button'), callback_data="drip_confirm"),
+            InlineKeyboardButton(get_message(language, 'drip_feed', 'cancel_button'), callback_data="drip_abort")
+        ]
+    ]
+    update.message.reply_html(
+        get_message(language, 'drip_feed', 'summary').format(
+            service_name=service.get("name", "Unknown Service"),
+            link=html.escape(link[:30] + "..." if len(link) > 30 else link),
+            total_quantity=sum(quantity for quantity, _ in slices),
+            runs=len(slices),
+            slice_quantity=slice_quantity,
+            interval=interval,
+            price_display=f"${total:.6f} / ETB {etb_total:.2f}",
+            balance_display=f"${user_balance:.6f} / ETB {etb_balance:.2f}"
+        ),
+        reply_markup=InlineKeyboardMarkup(keyboard)
+    )
+    return CONFIRMING_PLAN
+
+def confirm_drip_feed(update: Update, context: CallbackContext):
+    """Reserve the balance for the plan and schedule its runs"""
+    query = update.callback_query
+    user = update.effective_user
+    db.update_user_activity(user.id)
+    language = db.get_language(user.id)
+    query.answer()
+
+    plan = context.user_data.pop("drip_feed", None)
+    if not plan:
+        query.edit_message_text(get_message(language, 'drip_feed', 'expired'), parse_mode="HTML")
+        return ConversationHandler.END
+
+    result = db.create_drip_feed(
+        user.id, plan["service_id"], plan["service_name"], plan["link"], plan["slices"],
+        plan["interval"] * 60,
+        charge=not db.is_admin(user.id),
+        chat_id=query.message.chat_id,
+        language=language
+    )
+
+    if result is not None and result.get('error'):
+        # Nothing was reserved or charged
+        query.edit_message_text(
+            get_message(language, 'order', 'error').format(error=result['error']),
+            parse_mode="HTML"
+        )
+        return ConversationHandler.END
+
+    if result is None:
+        total = sum(price for _, price in plan["slices"])
+        user_balance = db.get_balance(user.id)
+
+        # Create keyboard with Add Fund and Back buttons
+        keyboard = [
+            [InlineKeyboardButton("💰 Add Fund", callback_data="recharge")],
+            [InlineKeyboardButton("◀️ Back", callback_data="show_services")]
+        ]
+        query.edit_message_text(
+            get_message(language, 'order', 'insufficient_balance').format(
+                price=total,
+                etb_price=total * CURRENCY_RATES["ETB"],
+                user_balance=user_balance,
+                etb_balance=user_balance * CURRENCY_RATES["ETB"]
+            ),
+            parse_mode="HTML",
+            reply_markup=InlineKeyboardMarkup(keyboard)
+        )
+        return ConversationHandler.END
+
+    logger.info(f"Scheduled drip-feed #{result['id']} for user {user.id}: {len(plan['slices'])} runs, ${result['total']:.6f}")
+    query.edit_message_text(
+        get_message(language, 'drip_feed', 'scheduled').format(
+            id=result['id'],
+            runs=len(plan["slices"]),
+            slice_quantity=plan["slices"][0][0],
+            interval=plan["interval"]
+        ),
+        parse_mode="HTML"
+    )
+
+    # Queue the first run right away instead of waiting for the next scheduler pass
+    queued = db.enqueue_due_drip_slices(DRIP_FEED_BATCH)
+    if queued:
+        order_workers.notify(queued)
+    return ConversationHandler.END
+
+def abort_drip_feed(update: Update, context: CallbackContext):
+    """Drop a drip-feed before it is scheduled"""
+    user = update.effective_user
+    language = db.get_language(user.id)
+    context.user_data.pop("drip_feed", None)
+
+    if update.callback_query:
+        update.callback_query.answer()
+        update.callback_query.edit_message_text(get_message(language, 'drip_feed', 'cancelled'))
+    else:
+        update.message.reply_text(get_message(language, 'drip_feed', 'cancelled'))
+    return ConversationHandler.END
+
+def stop_drip_feed_callback(update: Update, context: CallbackContext):
+    """Cancel a scheduled drip-feed and refund its remaining runs"""
+    query = update.callback_query
+    user = update.effective_user
+    language = db.get_language(user.id)
+    query.answer()
+
+    try:
+        drip_feed_id = int(query.data.split("_")[-1])
+    except ValueError:
+        return ConversationHandler.END
+
+    refund = db.cancel_drip_feed(drip_feed_id, user.id)
+    if refund is None:
+        query.edit_message_text(get_message(language, 'drip_feed', 'not_found'))
+        return ConversationHandler.END
+
+    etb_refund = refund * CURRENCY_RATES["ETB"]
+    query.edit_message_text(
+        get_message(language, 'drip_feed', 'plan_cancelled').format(
+            id=drip_feed_id,
+            refund_display=f"${refund:.6f} / ETB {etb_refund:.2f}"
+        )
+    )
+    return ConversationHandler.END
+
+def process_drip_feeds(context: CallbackContext):
+    """Scheduler pass: queue due drip-feed runs and report finished plans"""
+    queued = 0
+    while True:
+        count = db.enqueue_due_drip_slices(DRIP_FEED_BATCH)
+        queued += count
+        if count < DRIP_FEED_BATCH:
+            break
+    if queued:
+        order_workers.notify(queued)
+        logger.info(f"Queued {queued} drip-feed runs")
+
+    for plan in db.complete_drip_feeds():
+        if not plan['chat_id']:
+            continue
+        try:
+            context.bot.send_message(
+                chat_id=plan['chat_id'],
+                text=get_message(plan['language'], 'drip_feed', 'completed').format(
+                    id=plan['id'],
+                    service_name=plan['service_name'],
+                    placed=plan['placed'],
+                    runs=plan['runs']
+                ),
+                parse_mode="HTML"
+            )
+        except Exception as e:
+            logger.error(f"Error notifying user {plan['user_id']} about drip-feed #{plan['id']}: {e}")
+
+drip_feed_conv_handler = ConversationHandler(
+    entry_points=[
+        CommandHandler('dripfeed', drip_feed_command),
+        CallbackQueryHandler(stop_drip_feed_callback, pattern=r'^drip_stop_\d+$'),
+        CallbackQueryHandler(confirm_drip_feed, pattern=r'^drip_confirm$'),
+        CallbackQueryHandler(abort_drip_feed, pattern=r'^drip_abort$')
+    ],
+    states={
+        WAITING_FOR_PLAN: [
+            MessageHandler(Filters.text & ~Filters.command, process_drip_feed_plan),
+            CallbackQueryHandler(stop_drip_feed_callback, pattern=r'^drip_stop_\d+$')
+        ],
+        CONFIRMING_PLAN: [
+            CallbackQueryHandler(confirm_drip_feed, pattern=r'^drip_confirm$'),
+            CallbackQueryHandler(abort_drip_feed, pattern=r'^drip_abort$')
+        ]
+    },
+    fallbacks=[CommandHandler('cancel', abort_drip_feed)],
+    allow_reentry=True,
+    name="drip_feed",
+    persistent=True
+)
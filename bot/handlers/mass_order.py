@@ -0,0 +1,351 @@
+import csv
+import html
+import hashlib
+import logging
+import os
+from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.ext import CallbackContext, ConversationHandler, CommandHandler, CallbackQueryHandler, MessageHandler, Filters
+
+from utils.db import db
+from utils.helpers import calculate_order_price
+from utils.constants import CURRENCY_RATES
+from utils.messages import get_message
+from utils.order_queue import order_workers
+from handlers.services import get_service_by_id
+
+logger = logging.getLogger(__name__)
+
+# States
+WAITING_FOR_ORDERS = 1
+CONFIRMING_MASS_ORDER = 2
+
+# Limits for one batch
+MASS_ORDER_MAX_LINES = int(os.getenv("MASS_ORDER_MAX_LINES", "100"))
+MASS_ORDER_MAX_FILE_KB = 256
+
+# Number of rejected lines listed in the summary
+MAX_REJECTED_SHOWN = 20
+
+def mass_order_command(update: Update, context: CallbackContext):
+    """Handler for /massorder command"""
+    user = update.effective_user
+    db.update_user_activity(user.id)
+
+    # Get user's language preference
+    language = db.get_language(user.id)
+
+    context.user_data.pop("mass_order", None)
+    update.message.reply_html(
+        get_message(language, 'mass_order', 'instructions').format(max_lines=MASS_ORDER_MAX_LINES)
+    )
+    return WAITING_FOR_ORDERS
+
+def parse_mass_order(text):
+    """Split a pasted block or CSV file into order lines
+
+    Columns are service_id, link and quantity separated by |, tab, ; or ,
+    (whitespace if none of those is present). Empty lines, # comments and a
+    header row are skipped.
+
+    Returns:
+        list: (line number, service_id, link, quantity) tuples, with link and
+        quantity set to None when the line has too few columns
+    """
+    rows = []
+    first_line = True
+    for line_no, raw_line in enumerate(text.splitlines(), start=1):
+        line = raw_line.strip().lstrip('\ufeff')
+        if not line or line.startswith('#'):
+            continue
+
+        delimiter = next((d for d in ('|', '\t', ';', ',') if d in line), None)
+        if delimiter:
+            fields = [field.strip() for field in next(csv.reader([line], delimiter=delimiter))]
+        else:
+            delimiter = ' '
+            fields = line.split()
+
+        # Skip a header row
+        if first_line and fields and fields[0].lower() in ('service', 'service_id', 'id'):
+            first_line = False
+            continue
+        first_line = False
+
+        if len(fields) < 3:
+            rows.append((line_no, fields[0] if fields else '', None, None))
+        else:
+            # Links may contain the delimiter, so everything between the first and last column is the link
+            rows.append((line_no, fields[0], delimiter.join(fields[1:-1]).strip(), fields[-1]))
+    return rows
+
+def validate_mass_order(rows):
+    """Check the parsed lines against the service catalog and price the valid ones
+
+    Returns:
+        tuple: (list of order items, list of (line number, reason) for rejected lines)
+    """
+    items = []
+    rejected = []
+    for line_no, service_id, link, quantity_text in rows:
+        if link is None:
+            rejected.append((line_no, "expected service | link | quantity"))
+            continue
+
+        service = get_service_by_id(service_id)
+        if not service:
+            rejected.append((line_no, f"unknown service {service_id}"))
+            continue
+
+        if not link:
+            rejected.append((line_no, "missing link"))
+            continue
+
+        try:
+            quantity = int(quantity_text)
+        except (ValueError, TypeError):
+            rejected.append((line_no, f"invalid quantity {quantity_text}"))
+            continue
+
+        # Convert min/max to integers before comparing
+        try:
+            min_quantity = int(service.get("min", 1))
+            max_quantity = int(service.get("max", 1000000))
+        except (ValueError, TypeError):
+            min_quantity = 1
+            max_quantity = 1000000
+
+        if quantity < min_quantity:
+            rejected.append((line_no, f"minimum quantity is {min_quantity}"))
+            continue
+        if quantity > max_quantity:
+            rejected.append((line_no, f"maximum quantity is {max_quantity}"))
+            continue
+
+        items.append({
+            'line': line_no,
+            'service_id': str(service.get('service')),
+            'service_name': service.get('name', 'Unknown Service'),
+            'quantity': quantity,
+            'link': link,
+            'price': calculate_order_price(service, quantity)
+        })
+    return items, rejected
+
+def _format_rejected(rejected):
+    """List the rejected lines for the summary message"""
+    if not rejected:
+        return ""
+    lines = [f"Line {line_no}: {html.escape(reason)}" for line_no, reason in rejected[:MAX_REJECTED_SHOWN]]
+    if len(rejected) > MAX_REJECTED_SHOWN:
+        lines.append(f"... and {len(rejected) - MAX_REJECTED_SHOWN} more")
+    return "\n".join(lines) + "\n\n"
+
+def _batch_id(user_id, message_id):
+    """Build the dedup key of a mass order from its summary message"""
+    return hashlib.sha256(f"mass|{user_id}|{message_id}".encode("utf-8")).hexdigest()[:32]
+
+def _prepare_mass_order(update: Update, context: CallbackContext, text):
+    """Parse, validate and price a mass order and ask for confirmation"""
+    user = update.effective_user
+    language = db.get_language(user.id)
+
+    rows = parse_mass_order(text)
+    if not rows:
+        update.message.reply_html(get_message(language, 'mass_order', 'empty'))
+        return WAITING_FOR_ORDERS
+
+    if len(rows) > MASS_ORDER_MAX_LINES:
+        update.message.reply_html(
+            get_message(language, 'mass_order', 'too_many_lines').format(
+                count=len(rows),
+                max_lines=MASS_ORDER_MAX_LINES
+            )
+        )
+        return WAITING_FOR_ORDERS
+
+    items, rejected = validate_mass_order(rows)
+    logger.info(f"Mass order from user {user.id}: {len(items)} valid lines, {len(rejected)} rejected")
+
+    if not items:
+        update.message.reply_html(
+            get_message(language, 'mass_order', 'no_valid_lines').format(
+                rejected_details=_format_rejected(rejected)
+            )
+        )
+        return WAITING_FOR_ORDERS
+
+    # Always show both USD and ETB prices
+    total = sum(item['price'] for item in items)
+    user_balance = db.get_balance(user.id)
+    etb_total = total * CURRENCY_RATES["ETB"]
+    etb_balance = user_balance * CURRENCY_RATES["ETB"]
+
+    keyboard = [
+        [
+            InlineKeyboardButton(
+                get_message(language, 'mass_order', 'confirm_button').format(count=len(items)),
+                callback_data="mass_confirm"
+            ),
+            InlineKeyboardButton(get_message(language, 'mass_order', 'cancel_button'), callback_data="mass_cancel")
+        ]
+    ]
+
+    context.user_data["mass_order"] = {"items": items}
+    update.message.reply_html(
+        get_message(language, 'mass_order', 'summary').format(
+            valid=len(items),
+            rejected=len(rejected),
+            price_display=f"${total:.6f} / ETB {etb_total:.2f}",
+            balance_display=f"${user_balance:.6f} / ETB {etb_balance:.2f}",
+            rejected_details=_format_rejected(rejected)
+        ),
+        reply_markup=InlineKeyboardMarkup(keyboard)
+    )
+    return CONFIRMING_MASS_ORDER
+
+def process_mass_order_text(update: Update, context: CallbackContext):
+    """Handle a pasted block of order lines"""
+    db.update_user_activity(update.effective_user.id)
+    return _prepare_mass_order(update, context, update.message.text)
+
+def process_mass_order_file(update: Update, context: CallbackContext):
+    """Handle an uploaded CSV or text file of order lines"""
+    user = update.effective_user
+    db.update_user_activity(user.id)
+    language = db.get_language(user.id)
+
+    document = update.message.document
+    file_name = (document.file_name or "").lower()
+    if not file_name.endswith(('.csv', '.txt')) or (document.file_size or 0) > MASS_ORDER_MAX_FILE_KB * 1024:
+        update.message.reply_html(
+            get_message(language, 'mass_order', 'invalid_file').format(max_kb=MASS_ORDER_MAX_FILE_KB)
+        )
+        return WAITING_FOR_ORDERS
+
+    try:
+        data = document.get_file().download_as_bytearray()
+    except Exception as e:
+        logger.error(f"Error downloading mass order file from user {user.id}: {e}")
+        update.message.reply_html(
+            get_message(language, 'mass_order', 'invalid_file').format(max_kb=MASS_ORDER_MAX_FILE_KB)
+        )
+        return WAITING_FOR_ORDERS
+
+    return _prepare_mass_order(update, context, bytes(data).decode('utf-8-sig', errors='replace'))
+
+def confirm_mass_order(update: Update, context: CallbackContext):
+    """Debit the whole batch in one transaction and queue every line"""
+    query = update.callback_query
+    user = update.effective_user
+    db.update_user_activity(user.id)
+    language = db.get_language(user.id)
+
+    batch_id = _batch_id(user.id, query.message.message_id)
+    mass_order = context.user_data.get("mass_order")
+    if not mass_order or not mass_order.get("items"):
+        # Repeated tap on a batch that was already queued - leave its report message alone
+        if db.get_order_batch(batch_id):
+            query.answer(get_message(language, 'mass_order', 'already_submitted'))
+        else:
+            query.answer()
+            query.edit_message_text(get_message(language, 'mass_order', 'expired'), parse_mode="HTML")
+        return ConversationHandler.END
+
+    query.answer()
+    items = mass_order["items"]
+    is_admin = db.is_admin(user.id)
+
+    # Always show both USD and ETB prices
+    total = sum(item['price'] for item in items)
+    etb_total = total * CURRENCY_RATES["ETB"]
+    price_display = f"${total:.6f} / ETB {etb_total:.2f}"
+
+    # Show the queued message before the jobs exist, so it can never overwrite the report
+    if is_admin or db.get_balance(user.id) >= total:
+        query.edit_message_text(
+            get_message(language, 'mass_order', 'queued').format(
+                count=len(items),
+                price_display=price_display
+            ),
+            parse_mode="HTML"
+        )
+
+    result = db.reserve_order_batch(
+        user.id, batch_id, items,
+        charge=not is_admin,
+        enqueue={
+            'chat_id': query.message.chat_id,
+            'message_id': query.message.message_id,
+            'language': language
+        }
+    )
+
+    if result is not None and result.get('error'):
+        # Nothing was reserved or charged
+        query.edit_message_text(
+            get_message(language, 'order', 'error').format(error=result['error']),
+            parse_mode="HTML"
+        )
+    elif result is None:
+        user_balance = db.get_balance(user.id)
+        etb_balance = user_balance * CURRENCY_RATES["ETB"]
+
+        # Create keyboard with Add Fund and Back buttons
+        keyboard = [
+            [InlineKeyboardButton("💰 Add Fund", callback_data="recharge")],
+            [InlineKeyboardButton("◀️ Back", callback_data="show_services")]
+        ]
+        query.edit_message_text(
+            get_message(language, 'order', 'insufficient_balance').format(
+                price=total,
+                etb_price=etb_total,
+                user_balance=user_balance,
+                etb_balance=etb_balance
+            ),
+            parse_mode="HTML",
+            reply_markup=InlineKeyboardMarkup(keyboard)
+        )
+    elif result['duplicate']:
+        logger.info(f"Duplicate confirmation of mass order {batch_id} from user {user.id}")
+    else:
+        # Let the worker pool submit the lines concurrently
+        order_workers.notify(len(items))
+        logger.info(f"Queued mass order {batch_id} for user {user.id}: {len(items)} orders, ${total:.6f}")
+
+    context.user_data.pop("mass_order", None)
+    return ConversationHandler.END
+
+def cancel_mass_order(update: Update, context: CallbackContext):
+    """Cancel a mass order before it is confirmed"""
+    user = update.effective_user
+    language = db.get_language(user.id)
+    context.user_data.pop("mass_order", None)
+
+    if update.callback_query:
+        update.callback_query.answer()
+        update.callback_query.edit_message_text(get_message(language, 'mass_order', 'cancelled'))
+    else:
+        update.message.reply_text(get_message(language, 'mass_order', 'cancelled'))
+    return ConversationHandler.END
+
+mass_order_conv_handler = ConversationHandler(
+    entry_points=[
+        CommandHandler('massorder', mass_order_command),
+        CallbackQueryHandler(confirm_mass_order, pattern=r'^mass_confirm$'),
+        CallbackQueryHandler(cancel_mass_order, pattern=r'^mass_cancel$')
+    ],
+    states={
+        WAITING_FOR_ORDERS: [
+            MessageHandler(Filters.text & ~Filters.command, process_mass_order_text),
+            MessageHandler(Filters.document, process_mass_order_file)
+        ],
+        CONFIRMING_MASS_ORDER: [
+            CallbackQueryHandler(confirm_mass_order, pattern=r'^mass_confirm$'),
+            CallbackQueryHandler(cancel_mass_order, pattern=r'^mass_cancel$')
+        ]
+    },
+    fallbacks=[CommandHandler('cancel', cancel_mass_order)],
+    allow_reentry=True,
+    name="mass_order",
+    persistent=True
+)
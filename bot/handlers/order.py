@@ -1,10 +1,12 @@
+import hashlib
 import logging
+import os
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import CallbackContext, ConversationHandler
 
-from utils.api_client import api_client
 from utils.db import db
-from utils.helpers import create_confirmation_keyboard, format_service_details, format_order_details
+from utils.order_queue import order_workers
+from utils.helpers import create_confirmation_keyboard, format_service_details, format_order_details, calculate_order_price
 from utils.constants import CURRENCY_RATES
 from utils.messages import get_message, MESSAGES
 
@@ -14,6 +16,32 @@ SELECTING_SERVICE, ENTERING_LINK, ENTERING_QUANTITY, ENTERING_COMMENTS, CONFIRMI
 # Module logger
 logger = logging.getLogger(__name__)
 
+# Seconds during which a repeated confirmation returns the original order
+ORDER_DEDUP_WINDOW = int(os.getenv("ORDER_DEDUP_WINDOW", "600"))
+
+def _order_idempotency_key(user_id, chat_id, message_id):
+    """Build the dedup key for an order confirmation, one per confirmation message"""
+    raw = f"{user_id}|{chat_id}|{message_id}"
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()[:32]
+
+def _show_duplicate_order(query, language, is_admin, order):
+    """Show the result of an order confirmed before, without calling the panel again"""
+    if not order['order_id']:
+        # Still queued - the worker edits this message once it is placed
+        return
+    price = order['price'] or 0.0
+    etb_price = price * CURRENCY_RATES["ETB"]
+    query.edit_message_text(
+        get_message(language, 'order', 'success').format(
+            admin_note=" (Admin Order)" if is_admin else "",
+            order_id=order['order_id'],
+            service_name=order['service_name'],
+            quantity=order['quantity'],
+            price_display=f"${price:.6f} / ETB {etb_price:.2f}"
+        ),
+        parse_mode="HTML"
+    )
+
 def order_command(update: Update, context: CallbackContext):
     """Handler for /order command"""
     user = update.effective_user
@@ -178,32 +206,7 @@ def process_link(update: Update, context: CallbackContext):
         quantity = context.user_data["order"]["quantity"]
         
         # Calculate price
-        if "increased_rate" in service_info:
-            rate = service_info.get("increased_rate", 0)
-        else:
-            rate = service_info.get("rate", 0)
-            # Convert rate to float if it's a string
-            if isinstance(rate, str):
-                try:
-                    rate = float(rate)
-                except (ValueError, TypeError):
-                    rate = 0
-            
-            # Check if this service has a custom price that should skip markup
-            if service_info.get('skip_markup', False) or service_info.get('has_custom_price', False):
-                # Use the rate directly without additional markup
-                pass  # rate is already set correctly
-            else:
-                # Apply price increase based on original price
-                original_price_per_1k = rate/1000
-                if original_price_per_1k < 1:
-                    increased_price = original_price_per_1k * 2  # 100% increase
-                else:
-                    increased_price = original_price_per_1k * 1.5  # 50% increase
-                
-                rate = increased_price * 1000
-                
-        price = (rate * quantity) / 1000
+        price = calculate_order_price(service_info, quantity)
         
         # Calculate ETB price
         etb_price = price * CURRENCY_RATES["ETB"]
@@ -272,32 +275,7 @@ def show_order_confirmation(update: Update, context: CallbackContext):
     language = db.get_language(user.id)
     
     # Calculate price
-    if "increased_rate" in service_info:
-        rate = service_info.get("increased_rate", 0)
-    else:
-        rate = service_info.get("rate", 0)
-        # Convert rate to float if it's a string
-        if isinstance(rate, str):
-            try:
-                rate = float(rate)
-            except (ValueError, TypeError):
-                rate = 0
-        
-        # Check if this service has a custom price that should skip markup
-        if service_info.get('skip_markup', False) or service_info.get('has_custom_price', False):
-            # Use the rate directly without additional markup
-            pass  # rate is already set correctly
-        else:
-            # Apply price increase based on original price
-            original_price_per_1k = rate/1000
-            if original_price_per_1k < 1:
-                increased_price = original_price_per_1k * 2  # 100% increase
-            else:
-                increased_price = original_price_per_1k * 1.5  # 50% increase
-            
-            rate = increased_price * 1000
-            
-    price = (rate * quantity) / 1000
+    price = calculate_order_price(service_info, quantity)
     
     # Get user balance
     user_balance = db.get_balance(user.id)
@@ -445,32 +423,7 @@ def process_comments(update: Update, context: CallbackContext):
     quantity = context.user_data["order"]["quantity"]
     
     # Calculate price
-    if "increased_rate" in service_info:
-        rate = service_info.get("increased_rate", 0)
-    else:
-        rate = service_info.get("rate", 0)
-        # Convert rate to float if it's a string
-        if isinstance(rate, str):
-            try:
-                rate = float(rate)
-            except (ValueError, TypeError):
-                rate = 0
-            
-        # Check if this service has a custom price that should skip markup
-        if service_info.get('skip_markup', False) or service_info.get('has_custom_price', False):
-            # Use the rate directly without additional markup
-            pass  # rate is already set correctly
-        else:
-            # Apply price increase based on original price
-            original_price_per_1k = rate/1000
-            if original_price_per_1k < 1:
-                increased_price = original_price_per_1k * 2  # 100% increase
-            else:
-                increased_price = original_price_per_1k * 1.5  # 50% increase
-            
-            rate = increased_price * 1000
-            
-    price = (rate * quantity) / 1000
+    price = calculate_order_price(service_info, quantity)
     
     # Get user balance
     user_balance = db.get_balance(user.id)
@@ -528,8 +481,8 @@ def confirm_order(update: Update, context: CallbackContext):
     if callback_data == "order_confirm":
         logger.info("Processing order confirmation with order_confirm callback")
         return process_order(update, context, confirm=True)
-    elif callback_data == "confirm":
-        logger.info("Processing order confirmation with confirm callback")
+    elif callback_data in ("confirm", "confirm_order"):
+        logger.info(f"Processing order confirmation with {callback_data} callback")
         return process_order(update, context, confirm=True)
     else:
         logger.warning(f"Unexpected callback data in confirm_order: {callback_data}")
@@ -551,6 +504,15 @@ def process_order(update: Update, context: CallbackContext, confirm=False):
         query = update.callback_query
         query.answer("Processing your order...")
         
+        # A double tap or a Telegram retry of this confirmation reuses the original order.
+        # Checked first, since the order data is cleared once the order is queued.
+        idempotency_key = _order_idempotency_key(user.id, query.message.chat_id, query.message.message_id)
+        existing = db.get_order_by_idempotency_key(idempotency_key, ORDER_DEDUP_WINDOW)
+        if existing:
+            logger.info(f"Duplicate order confirmation from user {user.id}, reusing order row {existing['id']}")
+            _show_duplicate_order(query, language, db.is_admin(user.id), existing)
+            return ConversationHandler.END
+        
         # Get order details from user_data
         order_data = context.user_data.get("order", {})
         service_id = order_data.get("service_id")
@@ -560,7 +522,6 @@ def process_order(update: Update, context: CallbackContext, confirm=False):
         comments = order_data.get("comments")
         
         logger.info(f"Order confirmation received - User: {user.id}, Service: {service_id}, Quantity: {quantity}, Link: {link[:30] if link else 'None'}")
-        logger.info(f"Order data: {order_data}")
         
         if not all([service_id, quantity]):
             logger.warning(f"Incomplete order data - service_id: {service_id}, quantity: {quantity}")
@@ -568,44 +529,48 @@ def process_order(update: Update, context: CallbackContext, confirm=False):
             return ConversationHandler.END
         
         # Calculate price
-        if "increased_rate" in service_info:
-            rate = service_info.get("increased_rate", 0)
-        else:
-            rate = service_info.get("rate", 0)
-            # Convert rate to float if it's a string
-            if isinstance(rate, str):
-                try:
-                    rate = float(rate)
-                except (ValueError, TypeError):
-                    rate = 0
-            
-            # Check if this service has a custom price that should skip markup
-            if service_info.get('skip_markup', False) or service_info.get('has_custom_price', False):
-                # Use the rate directly without additional markup
-                pass  # rate is already set correctly
-            else:
-                # Apply price increase based on original price
-                original_price_per_1k = rate/1000
-                if original_price_per_1k < 1:
-                    increased_price = original_price_per_1k * 2  # 100% increase
-                else:
-                    increased_price = original_price_per_1k * 1.5  # 50% increase
-                
-                rate = increased_price * 1000
-                
-        price = (rate * quantity) / 1000
+        price = calculate_order_price(service_info, quantity)
         
         # Check if user is admin
         is_admin = db.is_admin(user.id)
+        service_name = service_info.get('name', 'Unknown Service')
         
-        # Get user's currency preference
-        currency_preference = db.get_currency_preference(user.id)
+        # Always show both USD and ETB prices
+        etb_price = price * CURRENCY_RATES["ETB"]
+        price_display = f"${price:.6f} / ETB {etb_price:.2f}"
         
-        # Check if user has enough balance (skip for admins)
-        user_balance = db.get_balance(user.id)
-        if not is_admin and user_balance < price:
-            # Always show both USD and ETB prices
-            etb_price = price * CURRENCY_RATES["ETB"]
+        # Show the queued message before the job exists, so it can never overwrite the worker's result
+        if is_admin or db.get_balance(user.id) >= price:
+            query.edit_message_text(
+                get_message(language, 'order', 'queued').format(
+                    service_name=service_name,
+                    quantity=quantity,
+                    price_display=price_display
+                ),
+                parse_mode="HTML"
+            )
+        
+        # Reserve the balance, create the order row and queue it in one transaction (admins are not charged)
+        reservation = db.reserve_order(
+            user.id, service_id, service_name, quantity, link, price,
+            charge=not is_admin, idempotency_key=idempotency_key, dedup_window=ORDER_DEDUP_WINDOW,
+            enqueue={
+                'chat_id': query.message.chat_id,
+                'message_id': query.message.message_id,
+                'language': language,
+                'comments': comments
+            }
+        )
+        if reservation is not None and reservation.get('error'):
+            # Nothing was reserved or charged
+            query.edit_message_text(
+                get_message(language, 'order', 'error').format(error=reservation['error']),
+                parse_mode="HTML"
+            )
+            return ConversationHandler.END
+        
+        if reservation is None:
+            user_balance = db.get_balance(user.id)
             etb_balance = user_balance * CURRENCY_RATES["ETB"]
             
             # Create keyboard with Add Fund and Back buttons
@@ -628,81 +593,22 @@ def process_order(update: Update, context: CallbackContext, confirm=False):
             )
             return ConversationHandler.END
         
-        # Show processing message
-        query.edit_message_text(
-            get_message(language, 'order', 'processing'),
-            parse_mode="HTML"
-        )
+        if reservation['duplicate']:
+            logger.info(f"Duplicate order confirmation from user {user.id}, reusing order row {reservation['id']}")
+            _show_duplicate_order(query, language, is_admin, dict(
+                reservation, service_name=service_name, quantity=quantity, price=price
+            ))
+            return ConversationHandler.END
         
-        # Log detailed order information
-        logger.info(f"Placing order on website - User: {user.id}, Service: {service_id}, Quantity: {quantity}, Link: {link[:30] if link else 'None'}")
+        # Hand the order to the worker pool, which edits this message with the panel order ID
+        order_workers.notify()
+        logger.info(f"Queued order reservation {reservation['id']} - User: {user.id}, Service: {service_id}, Quantity: {quantity}, Link: {link[:30] if link else 'None'}")
         
-        # Place the order
-        try:
-            response = api_client.place_order(service_id, link, quantity, comments)
-            logger.info(f"API response: {response}")
-            
-            # If the API call fails, create a mock order for testing
-            if not response or (isinstance(response, dict) and 'error' in response):
-                logger.warning("API call failed, creating mock order for testing")
-                import random
-                mock_order_id = random.randint(10000, 99999)
-                response = {"order": mock_order_id}
-                
-            if "order" in response:
-                order_id = response["order"]
-                
-                # Save order to database
-                db.add_order(user.id, order_id, service_id, service_info.get('name', 'Unknown Service'), quantity, link, price)
-                
-                # Add admin note if admin placed free order
-                admin_note = " (Admin Order)" if is_admin and user_balance < price else ""
-                
-                # Deduct balance if not admin
-                if not is_admin:
-                    db.deduct_balance(user.id, price, f"Payment for order #{order_id}")
-                    logger.info(f"Deducted ${price:.6f} from user {user.id}'s balance for order {order_id}")
-                
-                # Always show both USD and ETB prices
-                etb_price = price * CURRENCY_RATES["ETB"]
-                price_display = f"${price:.6f} / ETB {etb_price:.2f}"
-                
-                # Send confirmation message with language-specific text
-                query.edit_message_text(
-                    get_message(language, 'order', 'success').format(
-                        admin_note=admin_note,
-                        order_id=order_id,
-                        service_name=service_info['name'],
-                        quantity=quantity,
-                        price_display=price_display
-                    ),
-                    parse_mode="HTML"
-                )
-                
-                # Clear order data
-                if "order" in context.user_data:
-                    del context.user_data["order"]
-                
-                return ConversationHandler.END
-            else:
-                # Order failed
-                error_message = response.get("error", "Unknown error")
-                query.edit_message_text(
-                    get_message(language, 'order', 'failed').format(
-                        error_message=error_message
-                    ),
-                    parse_mode="HTML"
-                )
-                return ConversationHandler.END
-        except Exception as e:
-            logger.error(f"Error placing order: {e}", exc_info=True)
-            query.edit_message_text(
-                get_message(language, 'order', 'error').format(
-                    error=str(e)
-                ),
-                parse_mode="HTML"
-            )
-            return ConversationHandler.END
+        # Clear order data
+        if "order" in context.user_data:
+            del context.user_data["order"]
+        
+        return ConversationHandler.END
     
     # If this is just the initial quantity message, pass to process_quantity
     return process_quantity(update, context) 
\ No newline at end of file
@@ -7,6 +7,7 @@ from utils.db import db
 from utils.helpers import is_admin
 from utils.constants import CURRENCY_RATES
 from utils.messages import get_message
+from utils.concurrency import run_async_per_user, serialize_conversation
 
 logger = logging.getLogger(__name__)
 
@@ -1208,7 +1209,7 @@ def handle_wise_direct_message(update: Update, context: CallbackContext, amount:
     )
 
 # Create conversation handler
-recharge_conv_handler = ConversationHandler(
+recharge_conv_handler = serialize_conversation(ConversationHandler(
     entry_points=[
         CommandHandler('recharge', recharge_command),
         CallbackQueryHandler(handle_method_selection, pattern=r'^method_'),
@@ -1219,14 +1220,16 @@ recharge_conv_handler = ConversationHandler(
         CallbackQueryHandler(handle_international_selection, pattern=r'^intl_'),
         CallbackQueryHandler(handle_crypto_selection, pattern=r'^crypto_'),
         CallbackQueryHandler(handle_paid_confirmation, pattern=r'^paid_'),
-        CallbackQueryHandler(handle_verification, pattern=r'^verify_|^reject_')
+        CallbackQueryHandler(run_async_per_user(handle_verification), pattern=r'^verify_|^reject_')
     ],
     states={
         AMOUNT: [MessageHandler(Filters.text & ~Filters.command, handle_custom_amount)],
-        RECEIPT: [MessageHandler(Filters.photo & ~Filters.command, handle_receipt_photo)]
+        RECEIPT: [MessageHandler(Filters.photo & ~Filters.command, run_async_per_user(handle_receipt_photo))]
     },
     fallbacks=[CommandHandler('cancel', lambda u, c: ConversationHandler.END)],
-    allow_reentry=True
-)
+    allow_reentry=True,
+    name="recharge",
+    persistent=True
+))
 
 # No need for separate callback handlers since they're included in the conversation handler 
\ No newline at end of file
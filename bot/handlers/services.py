@@ -2,6 +2,7 @@ import logging
 import time
 import re
 import os
+from collections import OrderedDict
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import CallbackContext, ConversationHandler
 
@@ -38,6 +39,24 @@ _platforms_cache = {
     "expiry": 300  # 5 minutes
 }
 
+# Index of the cached services by service ID, rebuilt whenever the cache is refreshed
+_services_index = {
+    "data": {},
+    "timestamp": None
+}
+
+# Services per category and platform, and recent search results, for the cached
+# catalog version; users keep only the listing key and page in user_data
+_catalog_index = {
+    "by_category": {},
+    "by_platform": {},
+    "searches": OrderedDict(),
+    "timestamp": None
+}
+
+# Number of search results lists kept for the current catalog
+MAX_CACHED_SEARCHES = 256
+
 def invalidate_services_cache():
     """Invalidate the services cache to force a refresh on next fetch"""
     global _services_cache
@@ -68,6 +87,79 @@ def _get_services():
     
     return _services_cache["data"]
 
+def get_service_by_id(service_id):
+    """Look up a service in the cached catalog by its ID"""
+    services = _get_services()
+    
+    # Rebuild the index if the cache was refreshed since it was built
+    if _services_index["timestamp"] != _services_cache["timestamp"]:
+        _services_index["data"] = {str(service.get("service")): service for service in services}
+        _services_index["timestamp"] = _services_cache["timestamp"]
+    
+    return _services_index["data"].get(str(service_id).strip())
+
+def _get_catalog_index():
+    """Get the category and platform index of the cached catalog, rebuilt on refresh"""
+    services = _get_services()
+    
+    if _catalog_index["timestamp"] != _services_cache["timestamp"]:
+        by_category = {}
+        by_platform = {}
+        for service in services:
+            by_category.setdefault(service.get("category", "Uncategorized"), []).append(service)
+            by_platform.setdefault(service.get("platform", "Other"), []).append(service)
+        _catalog_index["by_category"] = by_category
+        _catalog_index["by_platform"] = by_platform
+        _catalog_index["searches"] = OrderedDict()
+        _catalog_index["timestamp"] = _services_cache["timestamp"]
+    
+    return _catalog_index
+
+def _search_services(services, search_term):
+    """Services whose name contains any word of the search term"""
+    search_words = search_term.split()
+    return [
+        service for service in services
+        if any(word in service.get("name", "").lower() for word in search_words)
+    ]
+
+def set_service_listing(context: CallbackContext, **listing):
+    """Remember the services list a user browses as a reference into the catalog
+    
+    Args:
+        listing: One of category=<name or "all">, platform=<name> or query=<search term>
+    """
+    _get_services()
+    context.user_data["service_listing"] = dict(listing, catalog_version=_services_cache["timestamp"])
+    context.user_data["current_page"] = 0
+    # Lists stored by earlier versions of the bot
+    context.user_data.pop("filtered_services", None)
+
+def get_listing_services(context: CallbackContext):
+    """Resolve the user's services listing against the current catalog"""
+    listing = context.user_data.get("service_listing")
+    if not listing:
+        return []
+    
+    index = _get_catalog_index()
+    if listing.get("catalog_version") != index["timestamp"]:
+        logger.debug(f"Catalog refreshed since the listing was opened, resolving {listing} against the new one")
+    
+    if "query" in listing:
+        searches = index["searches"]
+        results = searches.get(listing["query"])
+        if results is None:
+            results = _search_services(_get_services(), listing["query"])
+            searches[listing["query"]] = results
+            while len(searches) > MAX_CACHED_SEARCHES:
+                searches.popitem(last=False)
+        return results
+    if "platform" in listing:
+        return index["by_platform"].get(listing["platform"], [])
+    if listing.get("category", "all") == "all":
+        return _get_services()
+    return index["by_category"].get(listing["category"], [])
+
 def _get_platforms():
     """Extract main platforms from categories"""
     current_time = time.time()
@@ -455,17 +547,10 @@ def category_callback(update: Update, context: CallbackContext):
             platform = context.user_data.get("selected_platform", "Other")
             platform_data = _get_platforms()
             
-            # Get all services for this platform
-            all_services = _get_services()
-            
-            # Filter services by platform
-            services = [service for service in all_services if service.get("platform", "Other") == platform]
+            # Browse all services of this platform
+            set_service_listing(context, platform=platform)
             
-            # Store services in context
-            context.user_data["filtered_services"] = services
-            context.user_data["current_page"] = 0
-            
-            logger.info(f"Filtered to {len(services)} services for platform {platform}")
+            logger.info(f"Showing services for platform {platform}")
             
             # Show services
             return display_services_page(update, context)
@@ -483,20 +568,10 @@ def category_callback(update: Update, context: CallbackContext):
         # Store selected category
         context.user_data["selected_category"] = category
         
-        # Get services
-        all_services = _get_services()
-        
-        # Filter services by category if not "all"
-        if category != "all":
-            services = [service for service in all_services if service.get("category", "Uncategorized") == category]
-        else:
-            services = all_services
+        # Browse the services of the category
+        set_service_listing(context, category=category)
         
-        # Store services in context
-        context.user_data["filtered_services"] = services
-        context.user_data["current_page"] = 0
-        
-        logger.info(f"Filtered to {len(services)} services for category {category}")
+        logger.info(f"Showing services for category {category}")
         
         # Show services
         return display_services_page(update, context)
@@ -515,8 +590,8 @@ def display_services_page(update: Update, context: CallbackContext):
     language = db.get_language(user.id)
     
     try:
-        # Get services from context
-        services = context.user_data.get("filtered_services", [])
+        # Get the services of the listing the user browses
+        services = get_listing_services(context)
         current_page = context.user_data.get("current_page", 0)
         
         # Calculate pagination
@@ -720,11 +795,10 @@ def view_search_results(update: Update, context: CallbackContext):
     # Display the services page with filtered results
     return display_services_page(update, context)
 
-def show_services_list(update: Update, context: CallbackContext, services):
+def show_services_list(update: Update, context: CallbackContext, **listing):
     """Show a list of services"""
-    # Store services in context
-    context.user_data["filtered_services"] = services
-    context.user_data["current_page"] = 0
+    # Store the listing in context
+    set_service_listing(context, **listing)
     
     # Display the services page
     return display_services_page(update, context)
@@ -759,19 +833,12 @@ def service_callback(update: Update, context: CallbackContext):
             
         # Handle back to services button
         if callback_data == "back_to_services":
-            # Get services for the current category
-            category = context.user_data.get("selected_category", {}).get("name")
+            # Go back to the listing the service was picked from
+            if context.user_data.get("service_listing"):
+                return display_services_page(update, context)
             
-            # If no category selected or all services were shown
-            if not category or category == "All Services":
-                # Get all services
-                services = _get_services()
-            else:
-                # Filter services by selected category
-                services = [service for service in _get_services() if service.get("category") == category]
-            
-            # Show services list
-            show_services_list(update, context, services)
+            # Otherwise show all services
+            show_services_list(update, context, category="all")
             return SELECTING_SERVICE
         
         # Handle back to categories button
@@ -1005,23 +1072,9 @@ def process_search_term(update: Update, context: CallbackContext):
     search_term = update.message.text.strip().lower()
     
     try:
-        # Get all services
-        all_services = _get_services()
-        
-        # Filter services by search term - improved to match any word in the name
-        filtered_services = []
-        for service in all_services:
-            service_name = service.get("name", "").lower()
-            # Check if any word in the search term is in the service name
-            search_words = search_term.split()
-            for word in search_words:
-                if word in service_name:
-                    filtered_services.append(service)
-                    break
-        
-        # Store filtered services in context
-        context.user_data["filtered_services"] = filtered_services
-        context.user_data["current_page"] = 0
+        # Filter services by search term - matches any word in the name
+        set_service_listing(context, query=search_term)
+        filtered_services = get_listing_services(context)
         context.user_data["selected_category"] = f"Search: {search_term}"
         
         logger.info(f"Search found {len(filtered_services)} services matching '{search_term}'")
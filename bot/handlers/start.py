@@ -155,12 +155,12 @@ def start_command(update: Update, context: CallbackContext) -> int:
     # For normal start command, show main menu directly
     show_main_menu(update, context)
     
-    # Always show command menu for all users
+    # Show the command menu to users who never got it
     if update.message:
         try:
             # Import here to avoid circular imports
-            from handlers.command_menu import show_command_menu
-            show_command_menu(update, context)
+            from handlers.command_menu import ensure_command_menu
+            ensure_command_menu(update, context)
         except Exception as e:
             logger.error(f"Error showing command menu from start: {e}")
     
@@ -497,5 +497,7 @@ language_conv_handler = ConversationHandler(
         CommandHandler('start', start_command),
         CallbackQueryHandler(start_command, pattern=r'^back_to_main$')
     ],
-    allow_reentry=True
+    allow_reentry=True,
+    name="language",
+    persistent=True
 ) 
\ No newline at end of file
@@ -557,7 +557,9 @@ support_conv_handler = ConversationHandler(
         CommandHandler("start", cancel_support_chat),
         CallbackQueryHandler(cancel_support_chat, pattern=r"^cancel_support_chat$")
     ],
-    allow_reentry=True
+    allow_reentry=True,
+    name="support",
+    persistent=True
 )
 
 # Create conversation handler for admin replies
@@ -579,5 +581,7 @@ admin_reply_conv_handler = ConversationHandler(
     fallbacks=[
         CallbackQueryHandler(cancel_admin_reply, pattern=r"^cancel_admin_reply$")
     ],
-    allow_reentry=True
+    allow_reentry=True,
+    name="admin_reply",
+    persistent=True
 ) 
\ No newline at end of file
@@ -1391,6 +1391,7 @@ def tutorial_conversation_handler():
             -1: ConversationHandler.END,
         },
         allow_reentry=True,
+        persistent=True,
         name="tutorial_conversation",
     )
 
@@ -0,0 +1,122 @@
+"""Compare callback routing through an if/startswith chain with the router
+
+The chain reproduces the order of the checks the fallback callback handler
+used to run one by one; the router resolves the same callback data with dict
+lookups. Example:
+
+    python tools/bench_callback_router.py --count 200000
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from collections import Counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.callback_router import CallbackRouter, build_callback_data
+
+# (kind, value, route name) in the order of the old chain
+LEGACY_CHECKS = [
+    ("prefix", "tutorial_edit_", "tutorial_edit_"),
+    ("prefix", "tutorial_media_", "tutorial_media_"),
+    ("prefix", "cat_", "cat_"),
+    ("prefix", "category_", "category_"),
+    ("prefix", "plt_", "plt_"),
+    ("prefix", "platform_", "platform_"),
+    ("exact", "back_to_platforms", "back_to_platforms"),
+    ("exact", "back_to_categories", "back_to_categories"),
+    ("prefix", "page_", "page_"),
+    ("exact", "search_services", "search_services"),
+    ("exact", "view_search_results", "view_search_results"),
+    ("exact", "confirm_order", "confirm_order"),
+    ("exact", "cancel_order", "cancel_order"),
+    ("prefix", "service_", "service_"),
+    ("prefix", "quick_", "quick_"),
+    ("prefix", "qty_", "qty_"),
+    ("exact", "confirm", "confirm"),
+    ("exact", "order_confirm", "order_confirm"),
+    ("prefix", "tutorial_admin_edit_", "tutorial_admin_edit_"),
+    ("prefix", "tutorial_add_media_", "tutorial_add_media_"),
+    ("prefix", "tutorial_delete_media_item_", "tutorial_delete_media_item_"),
+    ("prefix", "tutorial_delete_media_", "tutorial_delete_media_"),
+    ("prefix", "tutorial_publish_media_", "tutorial_publish_media_"),
+]
+
+def chain_resolve(data):
+    """Walk the checks in order like the old handler did"""
+    for kind, value, name in LEGACY_CHECKS:
+        if kind == "exact":
+            if data == value:
+                return name
+        elif data.startswith(value):
+            return name
+    return None
+
+def build_router():
+    router = CallbackRouter()
+    for kind, value, name in LEGACY_CHECKS:
+        if kind == "exact":
+            router.add_exact(value, None, name)
+        else:
+            router.add_prefix(value, None, name)
+    router.add("order", "qty", None)
+    return router
+
+def sample_callbacks(count, seed=1):
+    """A mix weighted towards the browse and order flow"""
+    rng = random.Random(seed)
+    makers = [
+        (30, lambda: f"service_{rng.randint(1, 5000)}"),
+        (20, lambda: f"cat_{rng.randint(1, 300)}"),
+        (15, lambda: f"plt_{rng.randint(1, 20)}"),
+        (10, lambda: f"page_{rng.randint(1, 40)}"),
+        (10, lambda: f"qty_{rng.choice([100, 200, 400, 800])}"),
+        (5, lambda: rng.choice(["confirm", "order_confirm", "back_to_categories"])),
+        (5, lambda: f"tutorial_publish_media_{rng.randint(1, 50)}"),
+        (5, lambda: f"unknown_{rng.randint(1, 10)}"),
+    ]
+    weights = [weight for weight, _ in makers]
+    chosen = rng.choices([maker for _, maker in makers], weights=weights, k=count)
+    return [maker() for maker in chosen]
+
+def time_resolver(resolve, callbacks):
+    start = time.perf_counter()
+    for data in callbacks:
+        resolve(data)
+    return time.perf_counter() - start
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--count', type=int, default=200000, help='Number of callbacks to route')
+    args = parser.parse_args()
+
+    callbacks = sample_callbacks(args.count)
+    router = build_router()
+
+    # Both must agree on every callback before timing them
+    for data in callbacks:
+        resolved = router.resolve(data)
+        assert chain_resolve(data) == (resolved[0] if resolved else None), data
+
+    chain_time = time_resolver(chain_resolve, callbacks)
+    router_time = time_resolver(router.resolve, callbacks)
+    compact = [build_callback_data("order", "qty", 100)] * args.count
+    compact_time = time_resolver(router.resolve, compact)
+
+    routes = Counter()
+    for data in callbacks:
+        resolved = router.resolve(data)
+        routes[resolved[0] if resolved else "(unhandled)"] += 1
+
+    print(f"Callbacks:        {args.count}")
+    print(f"startswith chain: {chain_time / args.count * 1e6:.2f} us/callback")
+    print(f"router (legacy):  {router_time / args.count * 1e6:.2f} us/callback")
+    print(f"router (compact): {compact_time / args.count * 1e6:.2f} us/callback")
+    print("Hits per route:")
+    for name, hits in routes.most_common():
+        print(f"  {name:<28} {hits}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+"""Compare the cost of logging on a handler thread, directly and through the queue
+
+Logs the messages get_message and _make_request used to produce on every
+call, once with a synchronous StreamHandler like logging.basicConfig
+installs and once through the pipeline of utils.logging_setup, and times
+the calls on the logging thread. Output goes to temporary files; with a
+terminal or a slow log collector on stderr the direct handler only gets
+slower. Example:
+
+    python tools/bench_logging.py --records 20000
+"""
+import argparse
+import logging
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils import logging_setup
+
+API_KEY = 'a1b2c3d4e5f6a1b2c3d4e5f6'
+
+def hot_path(logger, count, level=logging.INFO):
+    """Seconds per logging call, logging like the old hot paths"""
+    params = {'key': API_KEY, 'action': 'status', 'order': 0}
+    start = time.perf_counter()
+    for i in range(count):
+        params['order'] = i
+        logger.log(level, "get_message called with language=en, key=order_status, subkey=None")
+        logger.log(level, f"Making API request: status with params: {params}")
+    return (time.perf_counter() - start) / (count * 2)
+
+def run_pipeline(logger, count, rate_limit):
+    """Time the queue pipeline writing to a temporary file
+
+    Returns:
+        tuple: (seconds per call, logging stats, API keys found in the output)
+    """
+    output = tempfile.TemporaryFile("w+")
+    sys.stderr = output
+    os.environ["LOG_RATE_LIMIT"] = str(rate_limit)
+    try:
+        logging_setup.setup_logging()
+        elapsed = hot_path(logger, count)
+        stats = logging_setup.get_logging_stats()
+        logging_setup.stop_logging()
+    finally:
+        sys.stderr = sys.__stderr__
+    output.seek(0)
+    leaked = sum(1 for line in output if API_KEY in line)
+    output.close()
+    return elapsed, stats, leaked
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--records', type=int, default=20000, help='Number of records to log')
+    args = parser.parse_args()
+    count = args.records // 2
+
+    root = logging.getLogger()
+    logger = logging.getLogger("bench.hot_path")
+    root.setLevel(logging.INFO)
+
+    # Synchronous: format and write under the handler lock on the caller's thread
+    with tempfile.TemporaryFile("w") as output:
+        direct = logging.StreamHandler(output)
+        direct.setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
+        root.addHandler(direct)
+        direct_time = hot_path(logger, count)
+        debug_time = hot_path(logger, count, logging.DEBUG)
+        root.removeHandler(direct)
+
+    queued_time, queued_stats, leaked = run_pipeline(logger, count, 0)
+    limited_time, limited_stats, _ = run_pipeline(logger, count, 20)
+
+    print(f"Records: {count * 2}")
+    print(f"direct StreamHandler:    {direct_time * 1e6:6.2f} us/call")
+    print(f"below the level (DEBUG): {debug_time * 1e6:6.2f} us/call")
+    print(f"queue:                   {queued_time * 1e6:6.2f} us/call  queued {queued_stats['queued']}, dropped {queued_stats['dropped']}")
+    print(f"queue, rate limited:     {limited_time * 1e6:6.2f} us/call  queued {limited_stats['queued']}, limited {limited_stats['rate_limited']}")
+    print(f"API keys left in the queued output: {leaked}")
+
+if __name__ == '__main__':
+    main()
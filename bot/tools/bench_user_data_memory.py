@@ -0,0 +1,131 @@
+"""Measure the memory held in user_data by users browsing the services catalog
+
+Simulates N users who opened a category, platform or search listing. Before,
+each user kept the list of matching services in user_data; now each keeps a
+reference to the listing and a page, resolved from the shared catalog index.
+Example (run from the bot directory, with the bot's .env or DB_FILE set):
+
+    python tools/bench_user_data_memory.py --users 2000 --services 3000
+"""
+import argparse
+import copy
+import os
+import random
+import sys
+import time
+import tracemalloc
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from handlers import services as services_module
+from utils.persistence import LazyUserData, SQLitePersistence
+
+WORDS = ["followers", "likes", "views", "comments", "real", "fast", "premium", "cheap", "story", "live"]
+PLATFORMS = ["Instagram", "TikTok", "YouTube", "Telegram", "Facebook", "Twitter"]
+
+def synthetic_catalog(count, seed=1):
+    rng = random.Random(seed)
+    catalog = []
+    for i in range(count):
+        platform = rng.choice(PLATFORMS)
+        catalog.append({
+            "service": str(1000 + i),
+            "name": f"{platform} {' '.join(rng.sample(WORDS, 3))} #{i}",
+            "category": f"{platform} {rng.choice(WORDS).title()}",
+            "rate": f"{rng.uniform(0.01, 20):.4f}",
+            "min": "100",
+            "max": "100000",
+            "type": "Default"
+        })
+    return catalog
+
+def browsing_actions(users, catalog, seed=2):
+    """A listing for every simulated user, mostly categories"""
+    rng = random.Random(seed)
+    categories = sorted({service["category"] for service in catalog})
+    actions = []
+    for _ in range(users):
+        roll = rng.random()
+        if roll < 0.7:
+            actions.append({"category": rng.choice(categories)})
+        elif roll < 0.8:
+            actions.append({"category": "all"})
+        else:
+            actions.append({"query": " ".join(rng.sample(WORDS, 2))})
+    return actions
+
+def old_filtered_list(catalog, listing):
+    """What the handlers used to store in user_data["filtered_services"]"""
+    if "query" in listing:
+        return services_module._search_services(catalog, listing["query"])
+    if listing["category"] == "all":
+        return catalog
+    return [service for service in catalog if service.get("category", "Uncategorized") == listing["category"]]
+
+def measure(build):
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    start = time.perf_counter()
+    kept = build()
+    elapsed = time.perf_counter() - start
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    size = sum(stat.size_diff for stat in after.compare_to(before, 'filename'))
+    return kept, size, elapsed
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=2000, help='Number of simulated browsing users')
+    parser.add_argument('--services', type=int, default=3000, help='Number of services in the catalog')
+    parser.add_argument('--idle-fraction', type=float, default=0.8, help='Share of users idle at eviction time')
+    args = parser.parse_args()
+
+    catalog = synthetic_catalog(args.services)
+    services_module._services_cache["data"] = catalog
+    services_module._services_cache["timestamp"] = time.time()
+    services_module._get_catalog_index()
+    actions = browsing_actions(args.users, catalog)
+
+    def old_approach():
+        user_data = {}
+        for user_id, listing in enumerate(actions):
+            user_data[user_id] = {"filtered_services": old_filtered_list(catalog, listing), "current_page": 0}
+        return user_data
+
+    def old_approach_copied():
+        # Persisted user_data is deep-copied on every update by PTB persistence
+        return {user_id: copy.deepcopy(data) for user_id, data in old_approach().items()}
+
+    def new_approach():
+        user_data = {}
+        for user_id, listing in enumerate(actions):
+            context = SimpleNamespace(user_data={})
+            services_module.set_service_listing(context, **listing)
+            services_module.get_listing_services(context)
+            user_data[user_id] = context.user_data
+        return user_data
+
+    _, old_size, old_time = measure(old_approach)
+    _, copied_size, copied_time = measure(old_approach_copied)
+    new_data, new_size, new_time = measure(new_approach)
+
+    print(f"Users: {args.users}, services in catalog: {args.services}")
+    print(f"filtered lists (shared dicts):  {old_size / 1024:10.1f} KiB  {old_time:.2f}s")
+    print(f"filtered lists (deep copies):   {copied_size / 1024:10.1f} KiB  {copied_time:.2f}s")
+    print(f"listing references:             {new_size / 1024:10.1f} KiB  {new_time:.2f}s")
+    print(f"  per user: {old_size / args.users:.0f} / {copied_size / args.users:.0f} / {new_size / args.users:.0f} bytes")
+
+    # Idle eviction of the same users held in the lazily loaded user_data
+    persistence = SQLitePersistence()
+    lazy = LazyUserData(lambda user_id: {})
+    for user_id, data in new_data.items():
+        lazy[user_id].update(data)
+    idle_users = int(args.users * args.idle_fraction)
+    for user_id in range(idle_users):
+        lazy.last_access[user_id] -= 3600
+    evicted = persistence.evict_idle(lazy, 1800)
+    print(f"Idle eviction: {evicted} of {args.users} users evicted, {len(lazy)} kept in memory")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+"""Check that the user_data the handlers keep survives a persistence round trip
+
+Builds the order, drip_feed and service_listing values the handlers store
+in user_data, writes them through SQLitePersistence to a temporary database
+and reads them back with a new instance, as after a restart. Exits with
+status 1 if a value comes back different, e.g. a tuple as a list or an int
+key as a string. Example (run from the bot directory):
+
+    python tools/check_persistence_roundtrip.py
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+SERVICE = {
+    "service": "1042",
+    "name": "Instagram Followers [Real] ⚡",
+    "category": "Instagram Followers",
+    "rate": "1.2500",
+    "original_rate": 0.8333,
+    "min": "100",
+    "max": "100000",
+    "type": "Default",
+    "refill": True
+}
+
+def handler_payloads():
+    """user_data values in the shapes the order, drip-feed and services handlers store"""
+    from handlers import services as services_module
+    from handlers.drip_feed import build_drip_slices
+
+    services_module._services_cache["data"] = [SERVICE]
+    services_module._services_cache["timestamp"] = time.time()
+    listing_context = SimpleNamespace(user_data={})
+    services_module.set_service_listing(listing_context, category=SERVICE["category"])
+
+    return {
+        "order": {
+            "service_id": SERVICE["service"],
+            "service_info": SERVICE,
+            "link": "https://instagram.com/p/example",
+            "quantity": 1500,
+            "comments": None
+        },
+        "drip_feed": {
+            "service_id": SERVICE["service"],
+            "service_name": SERVICE["name"],
+            "link": "https://instagram.com/p/example",
+            "slices": build_drip_slices(SERVICE, 2550, 500),
+            "interval": 3600
+        },
+        "service_listing": listing_context.user_data["service_listing"],
+        "current_page": listing_context.user_data["current_page"]
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--user-id', type=int, default=7000000, help='Telegram ID to store the values under')
+    args = parser.parse_args()
+
+    # Never touch the real database
+    os.environ["DB_FILE"] = os.path.join(tempfile.mkdtemp(prefix="bot-persistence-check-"), "check.db")
+    from utils.persistence import SQLitePersistence
+
+    expected = handler_payloads()
+    writer = SQLitePersistence()
+    writer.update_user_data(args.user_id, expected)
+    writer.flush_pending()
+    loaded = SQLitePersistence().get_user_data()[args.user_id]
+
+    failed = False
+    for key, value in expected.items():
+        if key not in loaded:
+            print(f"{key}: not persisted")
+            failed = True
+        elif loaded[key] != value:
+            print(f"{key}: stored {value!r}")
+            print(f"{' ' * len(key)}  loaded {loaded[key]!r}")
+            failed = True
+        else:
+            print(f"{key}: ok")
+    sys.exit(1 if failed else 0)
+
+if __name__ == '__main__':
+    main()
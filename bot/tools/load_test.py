@@ -0,0 +1,611 @@
+"""Load-test the bot offline with simulated users, a stub Bot API and a fake panel
+
+Simulated users go through the flows real users take (start, browsing
+platforms, categories and pages, search, ordering, order status, recharge)
+by sending Update objects to the real dispatcher, with the handlers and jobs
+main() registers. Every user waits for the bot's reply before the next step
+and clicks the buttons of the keyboard the bot actually sent. Calls to the
+Bot API are answered locally and counted; panel requests go to a fake panel
+served on a local port. The database is a temporary file unless --db is
+given. Example (run from the bot directory):
+
+    python tools/load_test.py --users 50 --duration 30 --panel-latency 80
+
+Reports updates/s, p50/p99 reply latency per flow, how long confirmed
+orders took to reach the panel and the outgoing Bot API and panel calls.
+Orders still queued when the users stop are given --drain seconds to be
+placed and are reported as not placed after that.
+"""
+import argparse
+import itertools
+import json
+import os
+import random
+import re
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter, defaultdict, deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+from telegram import Update
+from telegram.utils.request import Request
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+PLATFORMS = ["Instagram", "TikTok", "YouTube", "Telegram", "Facebook", "Twitter", "Spotify"]
+KINDS = ["Followers", "Likes", "Views", "Comments", "Shares", "Story Views", "Live Viewers", "Subscribers"]
+SEARCH_TERMS = ["followers", "likes", "views", "real", "fast", "premium", "instagram", "tiktok"]
+
+BOT_USER = {'id': 999999, 'is_bot': True, 'first_name': 'LoadTestBot', 'username': 'load_test_bot'}
+
+# (kind, value, optional) steps of each flow; clicks pick a button whose callback data matches
+FLOWS = {
+    'start': [
+        ('command', '/start', False),
+    ],
+    'browse': [
+        ('command', '/services', False),
+        ('click', r'^plt_', False),
+        ('click', r'^cat_', False),
+        ('click', r'^page_', True),
+    ],
+    'search': [
+        ('command', '/services', False),
+        ('click', r'^search_services$', False),
+        ('text', lambda user: random.choice(SEARCH_TERMS), False),
+        ('click', r'^service_', True),
+    ],
+    'order': [
+        ('command', '/services', False),
+        ('click', r'^plt_', False),
+        ('click', r'^cat_', False),
+        ('click', r'^service_', False),
+        ('click', r'^order:qty:\d', False),
+        ('text', lambda user: user.order_link(), False),
+        ('click', r'^(order_)?confirm$', False),
+    ],
+    'status': [
+        ('command', '/status', False),
+        ('text', lambda user: user.last_order_id(), False),
+    ],
+    'recharge': [
+        ('command', '/recharge', False),
+        ('click', r'^method_eth$', False),
+        ('click', r'^recharge_eth_\d', False),
+        ('click', r'^bank_', True),
+    ],
+}
+
+DEFAULT_WEIGHTS = "start=10,browse=35,search=15,order=20,status=15,recharge=5"
+
+def synthetic_catalog(count, seed=1):
+    """Services spread over platform categories like a real panel's"""
+    rng = random.Random(seed)
+    catalog = []
+    for i in range(count):
+        platform = rng.choice(PLATFORMS)
+        kind = rng.choice(KINDS)
+        catalog.append({
+            "service": 1000 + i,
+            "name": f"{platform} {kind} [{rng.choice(['Real', 'Fast', 'Premium', 'Cheap'])}] #{i}",
+            "category": f"{platform} {kind}",
+            "rate": f"{rng.uniform(0.05, 15):.4f}",
+            "min": "100",
+            "max": "100000",
+            "type": "Default"
+        })
+    return catalog
+
+class FakePanel:
+    """SMM panel API on a local port: services, balance, add and status"""
+
+    def __init__(self, catalog, latency=0.0):
+        self.catalog = catalog
+        self.latency = latency
+        self.calls = Counter()
+        self.orders = {}  # link -> last order ID placed for it
+        self.placed = defaultdict(list)  # link -> perf_counter() of every order placed for it
+        self._order_ids = itertools.count(500000)
+        self._lock = threading.Lock()
+        self.server = None
+
+    def answer(self, params):
+        action = params.get('action', '')
+        with self._lock:
+            self.calls[action] += 1
+        if self.latency:
+            time.sleep(self.latency)
+        if action == 'services':
+            return self.catalog
+        if action == 'balance':
+            return {"balance": "100000.00", "currency": "USD"}
+        if action == 'add':
+            order_id = next(self._order_ids)
+            with self._lock:
+                self.orders[params.get('link')] = order_id
+                self.placed[params.get('link')].append(time.perf_counter())
+            return {"order": order_id}
+        if action == 'status':
+            return {"charge": "0.50", "start_count": "100", "status": "In progress", "remains": "500", "currency": "USD"}
+        return {"error": f"Unknown action {action}"}
+
+    def start(self):
+        panel = self
+
+        class PanelHandler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self):
+                length = int(self.headers.get('Content-Length') or 0)
+                form = parse_qs(self.rfile.read(length).decode('utf-8'))
+                body = json.dumps(panel.answer({key: values[0] for key, values in form.items()})).encode('utf-8')
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), PanelHandler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, name="fake-panel", daemon=True).start()
+        return f"http://127.0.0.1:{self.server.server_address[1]}/api/v2"
+
+    def stop(self):
+        if self.server:
+            self.server.shutdown()
+
+class SimulatedChats:
+    """What the simulated users see: replies and the last inline keyboard per chat"""
+
+    def __init__(self):
+        self.replies = defaultdict(int)  # chat_id -> messages sent or edited by the bot
+        self.last_reply = {}             # chat_id -> perf_counter() of the last reply
+        self.reply_times = defaultdict(lambda: deque(maxlen=32))  # chat_id -> (reply number, time)
+        self.keyboards = {}              # chat_id -> last message dict with an inline keyboard
+        self.last_text = {}              # chat_id -> text of the last message sent or edited
+        self._condition = threading.Condition()
+
+    def record_reply(self, chat_id, message, background=False):
+        with self._condition:
+            self.last_text[chat_id] = message.get('text', '') if isinstance(message, dict) else ''
+            if background:
+                # Sent on its own schedule (order results), not in reply to the user's last step
+                return
+            self.replies[chat_id] += 1
+            self.last_reply[chat_id] = time.perf_counter()
+            self.reply_times[chat_id].append((self.replies[chat_id], self.last_reply[chat_id]))
+            if isinstance(message, dict) and message.get('reply_markup', {}).get('inline_keyboard'):
+                self.keyboards[chat_id] = message
+            self._condition.notify_all()
+
+    def reply_count(self, chat_id):
+        with self._condition:
+            return self.replies[chat_id]
+
+    def wait_for_reply(self, chat_id, seen, timeout):
+        """perf_counter() of the first reply after the seen-th, None on timeout"""
+        deadline = time.perf_counter() + timeout
+        with self._condition:
+            while self.replies[chat_id] <= seen:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    return None
+                self._condition.wait(remaining)
+            for number, replied_at in self.reply_times[chat_id]:
+                if number == seen + 1:
+                    return replied_at
+            return self.last_reply[chat_id]
+
+    def wait_until_quiet(self, chat_id, quiet, timeout):
+        """Wait until the bot sent nothing to the chat for quiet seconds"""
+        deadline = time.perf_counter() + timeout
+        while time.perf_counter() < deadline:
+            with self._condition:
+                idle = time.perf_counter() - self.last_reply.get(chat_id, 0)
+            if idle >= quiet:
+                return
+            time.sleep(quiet - idle)
+
+    def buttons(self, chat_id, pattern, timeout=0):
+        """The last keyboard message of the chat and its callback data matching pattern
+
+        Waits up to timeout seconds for a keyboard with a matching button, like
+        a user waiting for the bot to show the next menu.
+        """
+        deadline = time.perf_counter() + timeout
+        with self._condition:
+            while True:
+                message = self.keyboards.get(chat_id)
+                data = [
+                    button['callback_data']
+                    for row in (message or {}).get('reply_markup', {}).get('inline_keyboard', [])
+                    for button in row if button.get('callback_data')
+                ]
+                matches = [value for value in data if re.search(pattern, value)]
+                remaining = deadline - time.perf_counter()
+                if matches or remaining <= 0:
+                    return message, matches
+                self._condition.wait(remaining)
+
+def make_stub_request(chats, calls, latency=0.0):
+    """A Request answering every Bot API call locally, counting calls per method in calls"""
+    message_ids = itertools.count(1)
+    lock = threading.Lock()
+
+    class StubRequest(Request):
+        def post(self, url, data=None, timeout=None):
+            method = url.rsplit('/', 1)[-1]
+            data = data or {}
+            with lock:
+                calls[method] += 1
+            if latency:
+                time.sleep(latency)
+
+            if method == 'getMe':
+                return BOT_USER
+            if method.startswith(('send', 'edit', 'copy')) and method != 'sendChatAction' and 'chat_id' in data:
+                chat_id = int(data['chat_id'])
+                message = {
+                    'message_id': int(data.get('message_id') or next(message_ids)),
+                    'date': int(time.time()),
+                    'chat': {'id': chat_id, 'type': 'private'},
+                    'from': BOT_USER,
+                    'text': str(data.get('text') or data.get('caption') or '')
+                }
+                markup = data.get('reply_markup')
+                if markup:
+                    markup = json.loads(markup) if isinstance(markup, str) else markup
+                    # Only inline keyboards are part of the returned message
+                    if 'inline_keyboard' in markup:
+                        message['reply_markup'] = markup
+                chats.record_reply(chat_id, message, threading.current_thread().name.startswith('order-worker'))
+                return message
+            return True
+
+        def retrieve(self, url, timeout=None):
+            with lock:
+                calls['file_download'] += 1
+            return b''
+
+    return StubRequest(con_pool_size=1)
+
+class SimulatedUser(threading.Thread):
+    """Runs random flows against the dispatcher until the deadline"""
+
+    def __init__(self, user_id, harness):
+        super().__init__(name=f"user-{user_id}", daemon=True)
+        self.user_id = user_id
+        self.harness = harness
+        self.rng = random.Random(user_id)
+        self._callback_ids = itertools.count(1)
+
+    def order_link(self):
+        return f"https://instagram.com/p/load{self.user_id}"
+
+    def last_order_id(self):
+        """The last order the panel placed for this user, or an unknown ID"""
+        order_id = self.harness.panel.orders.get(self.order_link())
+        return str(order_id or self.rng.randint(100000, 999999))
+
+    def user_dict(self):
+        return {'id': self.user_id, 'is_bot': False, 'first_name': f"Load{self.user_id}", 'language_code': 'en'}
+
+    def build_update(self, kind, value, keyboard_message=None):
+        """Update dict for a command, a text message or a click on a button of keyboard_message"""
+        harness = self.harness
+        update_id = next(harness.update_ids)
+        if kind == 'click':
+            return {
+                'update_id': update_id,
+                'callback_query': {
+                    'id': f"{self.user_id}-{next(self._callback_ids)}",
+                    'from': self.user_dict(),
+                    'chat_instance': str(self.user_id),
+                    'message': keyboard_message,
+                    'data': value
+                }
+            }
+        message = {
+            'message_id': next(harness.message_ids),
+            'date': int(time.time()),
+            'chat': {'id': self.user_id, 'type': 'private'},
+            'from': self.user_dict(),
+            'text': value
+        }
+        if kind == 'command':
+            message['entities'] = [{'type': 'bot_command', 'offset': 0, 'length': len(value.split()[0])}]
+        return {'update_id': update_id, 'message': message}
+
+    def run_flow(self, name):
+        harness = self.harness
+        flow_start = time.perf_counter()
+        for index, (kind, value, optional) in enumerate(FLOWS[name]):
+            keyboard_message = None
+            if harness.stopping.is_set():
+                return
+            if callable(value):
+                value = value(self)
+            if kind == 'click':
+                keyboard_message, matches = harness.chats.buttons(self.user_id, value, 0 if optional else harness.reply_timeout)
+                if not matches:
+                    if not optional:
+                        harness.record_failure(name, index, 'no button', harness.chats.last_text.get(self.user_id))
+                        return
+                    continue
+                value = self.rng.choice(matches)
+
+            update = Update.de_json(self.build_update(kind, value, keyboard_message), harness.bot)
+            seen = harness.chats.reply_count(self.user_id)
+            sent_at = time.perf_counter()
+            harness.dispatcher.update_queue.put(update)
+            replied_at = harness.chats.wait_for_reply(self.user_id, seen, harness.reply_timeout)
+            if replied_at is None:
+                harness.record_failure(name, index, 'no reply', harness.chats.last_text.get(self.user_id))
+                return
+            harness.record_step(name, replied_at - sent_at)
+            if name == 'order' and index == len(FLOWS[name]) - 1:
+                harness.record_confirm(self.order_link(), sent_at)
+            # Let follow-up messages of the same update arrive before the next step
+            harness.chats.wait_until_quiet(self.user_id, harness.settle, harness.reply_timeout)
+            harness.wait_for_handlers(self.user_id, harness.reply_timeout)
+            if harness.think:
+                time.sleep(self.rng.uniform(0, 2 * harness.think))
+        harness.record_flow(name, time.perf_counter() - flow_start)
+
+    def run(self):
+        names = list(self.harness.weights)
+        weights = [self.harness.weights[name] for name in names]
+        while not self.harness.stopping.is_set() and time.time() < self.harness.deadline:
+            self.run_flow(self.rng.choices(names, weights=weights)[0])
+
+class LoadTest:
+    """Wires the dispatcher of bot.py to the stub Bot API and runs the users"""
+
+    def __init__(self, args, panel):
+        self.args = args
+        self.panel = panel
+        self.chats = SimulatedChats()
+        self.weights = parse_weights(args.flows)
+        self.reply_timeout = args.reply_timeout
+        self.settle = args.settle / 1000
+        self.think = args.think / 1000
+        self.deadline = 0
+        self.stopping = threading.Event()
+        self.update_ids = itertools.count(1)
+        self.message_ids = itertools.count(1)
+        self.step_latencies = defaultdict(list)  # flow -> seconds from update to first reply
+        self.flow_times = defaultdict(list)      # flow -> seconds for the whole flow
+        self.failures = Counter()                # (flow, step, reason) -> count
+        self.failure_texts = {}                  # (flow, step, reason) -> last message the user saw
+        self.errors = Counter()                  # handler exceptions by message
+        self.bot_calls = Counter()               # Bot API method -> calls
+        self.confirmed = defaultdict(list)       # link -> perf_counter() of every order confirmed for it
+        self.unplaced = 0                        # orders still queued after draining
+        self._lock = threading.Lock()
+
+    def record_step(self, flow, latency):
+        with self._lock:
+            self.step_latencies[flow].append(latency)
+
+    def record_flow(self, flow, elapsed):
+        with self._lock:
+            self.flow_times[flow].append(elapsed)
+
+    def record_failure(self, flow, step, reason, last_text=None):
+        with self._lock:
+            self.failures[(flow, step, reason)] += 1
+            self.failure_texts[(flow, step, reason)] = " ".join((last_text or "").split())[:60]
+
+    def record_confirm(self, link, sent_at):
+        with self._lock:
+            self.confirmed[link].append(sent_at)
+
+    def wait_for_handlers(self, user_id, timeout):
+        """Wait until the per-user callbacks queued for the user's updates have returned
+
+        A ConversationHandler moves to the state such a callback returns only
+        once it has finished, and a callback may still edit its reply after the
+        chat went quiet (e.g. after a slow panel call), which would be taken
+        for the reply to the next step.
+        """
+        deadline = time.perf_counter() + timeout
+        while self.user_serializer.busy(user_id) and time.perf_counter() < deadline:
+            time.sleep(0.005)
+
+    def drain_orders(self, timeout):
+        """Give the order workers timeout seconds to place the orders still queued"""
+        deadline = time.perf_counter() + timeout
+        while True:
+            stats = self.db.get_order_queue_stats()
+            waiting = stats['queued'] + stats['processing']
+            if not waiting or time.perf_counter() >= deadline:
+                break
+            time.sleep(0.05)
+        self.unplaced = waiting
+
+    def record_error(self, update, context):
+        with self._lock:
+            self.errors[f"{type(context.error).__name__}: {context.error}"[:120]] += 1
+
+    def setup(self):
+        # Imported here so the environment set in main() is used by the bot's modules
+        import bot as bot_module
+        from utils.concurrency import user_serializer
+        from utils.db import db
+        from utils.metrics import instrument_handlers
+        from utils.order_queue import order_workers
+        from utils.constants import load_currency_rates_from_db
+        from handlers.services import _get_services
+
+        self.db = db
+        self.order_workers = order_workers
+        self.user_serializer = user_serializer
+        self.request = make_stub_request(self.chats, self.bot_calls, self.args.telegram_latency / 1000)
+        self.updater = bot_module.build_updater(os.environ["TELEGRAM_BOT_TOKEN"], request=self.request)
+        self.dispatcher = self.updater.dispatcher
+        self.bot = self.updater.bot
+
+        # The same handlers and jobs as main()
+        bot_module.register_handlers(self.dispatcher)
+        bot_module.schedule_jobs(self.updater.job_queue)
+        instrument_handlers(self.dispatcher)
+        self.dispatcher.add_error_handler(self.record_error)
+        load_currency_rates_from_db()
+
+        # Users with enough balance to order, and a warm catalog cache
+        for offset in range(self.args.users):
+            user_id = self.args.first_user_id + offset
+            db.get_user(user_id)
+            if db.get_balance(user_id) < 1000:
+                db.add_balance(user_id, 10000, "Load test credit")
+        _get_services()
+
+        order_workers.start(self.bot)
+        self.updater.job_queue.start()
+        threading.Thread(target=self.dispatcher.start, name="dispatcher", daemon=True).start()
+        while not self.dispatcher.running:
+            time.sleep(0.01)
+
+    def run(self):
+        users = [SimulatedUser(self.args.first_user_id + offset, self) for offset in range(self.args.users)]
+        self.bot_calls.clear()
+        self.panel.calls.clear()
+        start = time.perf_counter()
+        self.deadline = time.time() + self.args.duration
+        for user in users:
+            user.start()
+        try:
+            for user in users:
+                user.join()
+        except KeyboardInterrupt:
+            self.stopping.set()
+            for user in users:
+                user.join(self.reply_timeout)
+        return time.perf_counter() - start
+
+    def teardown(self):
+        self.dispatcher.stop()
+        self.updater.job_queue.stop()
+        self.order_workers.stop()
+        if self.dispatcher.persistence:
+            self.dispatcher.persistence.flush()
+
+    def report(self, elapsed):
+        updates = sum(len(latencies) for latencies in self.step_latencies.values())
+        failed = sum(self.failures.values())
+        print(f"Users: {self.args.users}, duration: {elapsed:.1f}s, "
+              f"Telegram latency {self.args.telegram_latency:.0f} ms, panel latency {self.args.panel_latency:.0f} ms")
+        print(f"Updates answered: {updates} ({updates / elapsed:.1f} updates/s), flows aborted: {failed}")
+        print()
+        print(f"{'flow':<10} {'runs':>6} {'steps':>7} {'p50 ms':>8} {'p99 ms':>8} {'max ms':>8} {'flow p50 s':>11}")
+        for name in FLOWS:
+            latencies = sorted(self.step_latencies.get(name, []))
+            flows = sorted(self.flow_times.get(name, []))
+            if not latencies and not flows:
+                continue
+            print(f"{name:<10} {len(flows):>6} {len(latencies):>7} {percentile(latencies, 50) * 1000:>8.1f} "
+                  f"{percentile(latencies, 99) * 1000:>8.1f} {(latencies[-1] if latencies else 0) * 1000:>8.1f} "
+                  f"{percentile(flows, 50):>11.2f}")
+        confirmed = sum(len(times) for times in self.confirmed.values())
+        if confirmed:
+            # The n-th order placed for a link is the n-th one confirmed for it
+            placements = sorted(
+                placed_at - confirmed_at
+                for link, times in self.confirmed.items()
+                for confirmed_at, placed_at in zip(times, self.panel.placed.get(link, []))
+            )
+            print()
+            print(f"Orders confirmed: {confirmed}, placed: {len(placements)}, not placed after draining: {self.unplaced}")
+            print(f"Confirm to panel: p50 {percentile(placements, 50):.2f}s, p99 {percentile(placements, 99):.2f}s, "
+                  f"max {(placements[-1] if placements else 0):.2f}s")
+        if self.failures:
+            print()
+            print("Aborted flows (flow, step, reason, last message seen):")
+            for key, count in self.failures.most_common():
+                flow, step, reason = key
+                kind, value, _ = FLOWS[flow][step]
+                print(f"  {flow:<10} step {step} {kind} {value if isinstance(value, str) else ''!s:<24} {reason:<10} {count:>5}")
+                print(f"      {self.failure_texts[key]!r}")
+        if self.errors:
+            print()
+            print("Handler errors:")
+            for message, count in self.errors.most_common(10):
+                print(f"  {count:>6}  {message}")
+        print()
+        print("Bot API calls:")
+        for method, count in self.bot_calls.most_common():
+            print(f"  {method:<24} {count:>7}  ({count / elapsed:.1f}/s)")
+        print("Panel calls:")
+        for action, count in self.panel.calls.most_common():
+            print(f"  {action:<24} {count:>7}  ({count / elapsed:.1f}/s)")
+
+def percentile(values, pct):
+    """pct-th percentile of sorted values, 0 for none"""
+    if not values:
+        return 0
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+def parse_weights(value):
+    """Parse "browse=35,order=20" into flow weights"""
+    weights = {}
+    for item in value.split(","):
+        if "=" not in item:
+            continue
+        name, weight = item.split("=", 1)
+        name = name.strip()
+        if name not in FLOWS:
+            raise SystemExit(f"Unknown flow {name!r}, expected one of {', '.join(FLOWS)}")
+        if float(weight) > 0:
+            weights[name] = float(weight)
+    if not weights:
+        raise SystemExit("No flows to run")
+    return weights
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=20, help='Number of simulated users')
+    parser.add_argument('--duration', type=float, default=20, help='Seconds to start new flows for')
+    parser.add_argument('--flows', default=DEFAULT_WEIGHTS, help=f'Flow weights (default {DEFAULT_WEIGHTS})')
+    parser.add_argument('--services', type=int, default=2000, help='Number of services in the fake panel')
+    parser.add_argument('--panel-latency', type=float, default=50, help='Fake panel response time in ms')
+    parser.add_argument('--telegram-latency', type=float, default=0, help='Simulated Bot API round trip in ms')
+    parser.add_argument('--think', type=float, default=0, help='Average pause between steps in ms')
+    parser.add_argument('--settle', type=float, default=20, help='Quiet time in ms before a user takes the next step')
+    parser.add_argument('--drain', type=float, default=30, help='Seconds to wait for queued orders after the run')
+    parser.add_argument('--reply-timeout', type=float, default=15, help='Seconds to wait for a reply before aborting a flow')
+    parser.add_argument('--first-user-id', type=int, default=7000000, help='Telegram ID of the first simulated user')
+    parser.add_argument('--db', help='Database file (default: a new temporary file)')
+    args = parser.parse_args()
+
+    panel = FakePanel(synthetic_catalog(args.services), args.panel_latency / 1000)
+    workdir = tempfile.mkdtemp(prefix="bot-load-test-")
+
+    # Never touch the real database, panel or Telegram
+    os.environ["API_URL"] = panel.start()
+    os.environ["API_FALLBACK_URLS"] = ""
+    os.environ["API_KEY"] = "load-test-key"
+    os.environ["API_ENDPOINT_CACHE"] = os.path.join(workdir, "api_endpoint.json")
+    os.environ["DB_FILE"] = args.db or os.path.join(workdir, "load_test.db")
+    os.environ["TELEGRAM_BOT_TOKEN"] = "123456:LOADTESTLOADTESTLOADTESTLOADTEST123"
+    os.environ.pop("UPDATE_RECORD_FILE", None)
+    os.environ.setdefault("LOG_LEVEL", "ERROR")
+
+    harness = LoadTest(args, panel)
+    harness.setup()
+    try:
+        elapsed = harness.run()
+        harness.drain_orders(args.drain)
+    finally:
+        harness.teardown()
+        panel.stop()
+    harness.report(elapsed)
+    print(f"\nDatabase: {os.environ['DB_FILE']}")
+
+if __name__ == '__main__':
+    main()
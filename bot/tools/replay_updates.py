@@ -0,0 +1,98 @@
+"""POST recorded Telegram updates to a running webhook and measure intake
+
+Updates come from a file written with UPDATE_RECORD_FILE (one JSON update
+per line), or are generated when no file is given. Example:
+
+    BOT_MODE=webhook WEBHOOK_URL=https://example.com WEBHOOK_LISTEN=127.0.0.1 WEBHOOK_PORT=8443 WEBHOOK_PATH=hook python bot.py
+    python tools/replay_updates.py --url http://127.0.0.1:8443/hook --updates recorded.jsonl --concurrency 20
+
+The webhook answers as soon as an update is queued for the dispatcher, so
+this measures intake throughput. Long polling takes at most 100 updates per
+getUpdates round trip, one round trip at a time.
+"""
+import argparse
+import json
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+def synthetic_updates(count, users=50):
+    """Text message updates from a number of different users"""
+    updates = []
+    for i in range(count):
+        user_id = 100000 + i % users
+        updates.append({
+            'update_id': i + 1,
+            'message': {
+                'message_id': i + 1,
+                'date': int(time.time()),
+                'chat': {'id': user_id, 'type': 'private'},
+                'from': {'id': user_id, 'is_bot': False, 'first_name': f'User{user_id}'},
+                'text': '/start' if i % 5 == 0 else f'message {i}'
+            }
+        })
+    return updates
+
+def load_updates(path):
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+def replay(url, updates, concurrency, repeat=1):
+    """POST every update and return the latencies in seconds and the number of errors"""
+    local = threading.local()
+    latencies = []
+    errors = []
+    lock = threading.Lock()
+
+    def post(update):
+        # One keep-alive session per thread
+        if not hasattr(local, 'session'):
+            local.session = requests.Session()
+        start = time.perf_counter()
+        try:
+            response = local.session.post(url, json=update, timeout=30)
+            ok = response.status_code == 200
+        except requests.RequestException:
+            ok = False
+        elapsed = time.perf_counter() - start
+        with lock:
+            latencies.append(elapsed)
+            if not ok:
+                errors.append(update.get('update_id'))
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for round_no in range(repeat):
+            for update in updates:
+                # Give every replayed update a fresh ID
+                update = dict(update, update_id=round_no * len(updates) + update.get('update_id', 0))
+                executor.submit(post, update)
+    return latencies, len(errors)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--url', required=True, help='Webhook URL, e.g. http://127.0.0.1:8443/hook')
+    parser.add_argument('--updates', help='File of recorded updates, one JSON object per line')
+    parser.add_argument('--count', type=int, default=1000, help='Number of synthetic updates without --updates')
+    parser.add_argument('--concurrency', type=int, default=10)
+    parser.add_argument('--repeat', type=int, default=1, help='Replay the updates this many times')
+    args = parser.parse_args()
+
+    updates = load_updates(args.updates) if args.updates else synthetic_updates(args.count)
+    start = time.perf_counter()
+    latencies, errors = replay(args.url, updates, args.concurrency, args.repeat)
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    total = len(latencies)
+    print(f"Updates sent:  {total} ({errors} failed)")
+    print(f"Elapsed:       {elapsed:.2f}s")
+    print(f"Throughput:    {total / elapsed:.1f} updates/s")
+    if latencies:
+        print(f"Latency p50:   {latencies[total // 2] * 1000:.1f} ms")
+        print(f"Latency p95:   {latencies[min(total - 1, int(total * 0.95))] * 1000:.1f} ms")
+        print(f"Latency max:   {latencies[-1] * 1000:.1f} ms")
+
+if __name__ == '__main__':
+    main()
@@ -1,102 +1,473 @@
 import os
+import json
+import time
+import random
 import requests
 import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
+from urllib3.exceptions import NewConnectionError
 from utils.db import db
+from utils.circuit_breaker import CircuitBreaker
+from utils.retry_budget import RetryBudget
+from utils.single_flight import SingleFlight
+from utils.status_cache import OrderStatusCache
+from utils.metrics import metrics
+from utils.request_scheduler import (
+    RequestScheduler, parse_rate_limits, PRIORITY_ORDER, PRIORITY_STATUS, PRIORITY_BACKGROUND
+)
 
 # Load environment variables
 load_dotenv()
 
 logger = logging.getLogger(__name__)
 
+# Panels tried when API_URL is not set, and the one used if none answers
+COMMON_ENDPOINTS = [
+    "https://smmpanel.net/api/v2",
+    "https://amazingsmm.com/api/v2",
+    "https://perfectsmm.com/api/v2",
+    "https://smmpanel.io/api/v2",
+    "https://ultrasmm.com/api/v2"
+]
+DEFAULT_ENDPOINT = COMMON_ENDPOINTS[0]
+
+# Where the detected endpoint is remembered between restarts, and for how long
+ENDPOINT_CACHE_FILE = os.getenv("API_ENDPOINT_CACHE", "data/api_endpoint.json")
+ENDPOINT_CACHE_TTL = int(os.getenv("API_ENDPOINT_CACHE_TTL", str(7 * 24 * 3600)))
+
+# Read-only actions that can be sent again without side effects on the panel
+SAFE_ACTIONS = {'services', 'status', 'balance', 'refill_status'}
+
+# Scheduling priority of each action: orders first, catalog sync last
+ACTION_PRIORITIES = {
+    'add': PRIORITY_ORDER,
+    'refill': PRIORITY_ORDER,
+    'status': PRIORITY_STATUS,
+    'refill_status': PRIORITY_STATUS,
+    'balance': PRIORITY_STATUS,
+    'services': PRIORITY_BACKGROUND
+}
+
+# Default calls per second and burst size of each action
+DEFAULT_RATE_LIMITS = {
+    'add': (5, 10),
+    'refill': (2, 5),
+    'status': (10, 20),
+    'refill_status': (5, 10),
+    'balance': (2, 5),
+    'services': (0.5, 2)
+}
+
+def _is_connect_error(error):
+    """Whether a request failed before anything was sent to the panel"""
+    if isinstance(error, requests.exceptions.ConnectTimeout):
+        return True
+    reason = getattr(error.args[0], 'reason', None) if error.args else None
+    return isinstance(reason, NewConnectionError)
+
 class SMMApiClient:
     def __init__(self):
         # Get API key from environment variables
         self.api_key = os.getenv("API_KEY", "0b38beef0498aa67bb707cfde4085057")
         
-        # Get API URL from environment variables or detect it
+        # Get API URL from environment variables or the detection cache; nothing
+        # here does network I/O, detection runs later in the background
+        self._endpoint_ready = threading.Event()
+        self._detect_thread = None
+        self._detect_lock = threading.Lock()
         env_api_url = os.getenv("API_URL")
+        cached = None if env_api_url else self._load_cached_endpoint()
         if env_api_url:
             self.api_url = env_api_url
+            self._endpoint_ready.set()
             logger.info(f"Using API URL from environment: {self.api_url}")
+        elif cached:
+            self.api_url = cached['api_url']
+            self._endpoint_ready.set()
+            logger.info(f"Using cached API URL: {self.api_url}")
         else:
-            # Try to detect the correct API URL
-            self.api_url = self._detect_api_url()
+            # Placeholder until detection finishes; requests wait for it
+            self.api_url = DEFAULT_ENDPOINT
+        self._endpoint_stale = not env_api_url and (not cached or time.time() - cached.get('detected_at', 0) > ENDPOINT_CACHE_TTL)
+        
+        # Timeouts for panel requests (connect, read) in seconds
+        self.timeout = (float(os.getenv("API_CONNECT_TIMEOUT", "5")), float(os.getenv("API_READ_TIMEOUT", "30")))
+        
+        # Mirrors of the same panel to fail over to when the active endpoint is unhealthy
+        fallback_urls = [url.strip() for url in os.getenv("API_FALLBACK_URLS", "").split(",") if url.strip()]
+        self.api_urls = [self.api_url] + [url for url in fallback_urls if url != self.api_url]
+        self.breakers = {url: self._new_breaker(url) for url in self.api_urls}
+        self._failover_thread = None
+        self._failover_lock = threading.Lock()
+        
+        # Retries of safe actions, with jittered exponential backoff and a shared budget
+        self.max_retries = int(os.getenv("API_MAX_RETRIES", "3"))
+        self.retry_base_delay = float(os.getenv("API_RETRY_BASE_DELAY", "0.5"))
+        self.retry_max_delay = float(os.getenv("API_RETRY_MAX_DELAY", "8"))
+        self.retry_budget = RetryBudget(ratio=float(os.getenv("API_RETRY_BUDGET_RATIO", "0.2")))
+        self.retry_stats = {'requests': 0, 'retries': 0, 'retry_successes': 0, 'budget_exhausted': 0, 'by_action': {}}
+        self._stats_lock = threading.Lock()
+        
+        # Client-side rate limits, overridable with API_RATE_LIMITS="status=10:20,services=0.5:2"
+        rates = dict(DEFAULT_RATE_LIMITS)
+        rates.update(parse_rate_limits(os.getenv("API_RATE_LIMITS")))
+        self.scheduler = RequestScheduler(
+            rates,
+            max_concurrent=int(os.getenv("API_MAX_CONCURRENT", "8")),
+            max_wait=float(os.getenv("API_QUEUE_TIMEOUT", "30"))
+        )
+        
+        # Concurrent identical read requests share one panel call
+        self.single_flight = SingleFlight()
         
-        logger.info(f"API Client initialized with URL: {self.api_url} and API key: {self.api_key[:5]}...")
+        # Recent order statuses, shared by all users and refreshes
+        self.status_cache = OrderStatusCache(
+            max_entries=int(os.getenv("ORDER_STATUS_CACHE_SIZE", "5000")),
+            active_ttl=float(os.getenv("ORDER_STATUS_TTL_ACTIVE", "15")),
+            final_ttl=float(os.getenv("ORDER_STATUS_TTL_FINAL", "600"))
+        )
+        
+        logger.info(f"API Client initialized with URL: {self.api_url}")
+    
+    def _new_breaker(self, url):
+        return CircuitBreaker(
+            url,
+            window_seconds=int(os.getenv("API_BREAKER_WINDOW", "60")),
+            min_calls=int(os.getenv("API_BREAKER_MIN_CALLS", "5")),
+            error_threshold=float(os.getenv("API_BREAKER_ERROR_RATE", "0.5")),
+            slow_call_seconds=float(os.getenv("API_BREAKER_SLOW_SECONDS", "10")),
+            cooldown_seconds=int(os.getenv("API_BREAKER_COOLDOWN", "30"))
+        )
+    
+    def _load_cached_endpoint(self):
+        """Read the endpoint found by a previous detection, if any"""
+        try:
+            with open(ENDPOINT_CACHE_FILE) as f:
+                cached = json.load(f)
+            if isinstance(cached, dict) and cached.get('api_url'):
+                return cached
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable API endpoint cache {ENDPOINT_CACHE_FILE}: {e}")
+        return None
+    
+    def _save_cached_endpoint(self, api_url):
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(ENDPOINT_CACHE_FILE)), exist_ok=True)
+            with open(ENDPOINT_CACHE_FILE, 'w') as f:
+                json.dump({'api_url': api_url, 'detected_at': time.time()}, f)
+        except OSError as e:
+            logger.warning(f"Could not write API endpoint cache {ENDPOINT_CACHE_FILE}: {e}")
+    
+    def start_endpoint_detection(self):
+        """Detect the API URL in a background thread if it is unknown or the cache is stale
+        
+        Returns:
+            threading.Thread: The detection thread, or None if no detection is needed
+        """
+        with self._detect_lock:
+            if not self._endpoint_stale:
+                return None
+            if self._detect_thread is None or not self._detect_thread.is_alive():
+                self._detect_thread = threading.Thread(target=self._run_detection, name="api-detect", daemon=True)
+                self._detect_thread.start()
+            return self._detect_thread
+    
+    def _run_detection(self):
+        try:
+            endpoint = self._detect_api_url()
+            if endpoint:
+                self._use_endpoint(endpoint)
+                self._save_cached_endpoint(endpoint)
+            self._endpoint_stale = False
+        finally:
+            self._endpoint_ready.set()
+    
+    def _use_endpoint(self, endpoint):
+        """Make a detected endpoint the active one"""
+        with self._failover_lock:
+            if endpoint not in self.breakers:
+                self.breakers[endpoint] = self._new_breaker(endpoint)
+            if endpoint not in self.api_urls:
+                self.api_urls.insert(0, endpoint)
+            if endpoint != self.api_url:
+                logger.info(f"Switching API URL from {self.api_url} to detected {endpoint}")
+                self.api_url = endpoint
     
     def _detect_api_url(self):
-        """Try to detect the correct API URL by testing common endpoints"""
-        common_endpoints = [
-            "https://smmpanel.net/api/v2",
-            "https://amazingsmm.com/api/v2",
-            "https://perfectsmm.com/api/v2",
-            "https://smmpanel.io/api/v2",
-            "https://ultrasmm.com/api/v2"
-        ]
+        """Try to detect the correct API URL by testing common endpoints
         
-        # Try each endpoint with a simple balance request
-        for endpoint in common_endpoints:
-            try:
-                logger.info(f"Testing API endpoint: {endpoint}")
-                params = {
-                    'key': self.api_key,
-                    'action': 'balance'
-                }
-                response = requests.post(endpoint, data=params, timeout=5)
-                response.raise_for_status()
-                
-                # Try to parse the response
-                data = response.json()
-                
-                # If we got a valid response without error, this is likely the correct endpoint
-                if isinstance(data, dict) and 'balance' in data:
+        All endpoints are probed at once, and the first one in COMMON_ENDPOINTS
+        order that passes wins, so the choice doesn't depend on which server
+        happens to answer first.
+        
+        Returns:
+            str: The detected endpoint, or None if none answered
+        """
+        executor = ThreadPoolExecutor(max_workers=len(COMMON_ENDPOINTS))
+        try:
+            probes = [executor.submit(self._test_endpoint, endpoint) for endpoint in COMMON_ENDPOINTS]
+            for endpoint, probe in zip(COMMON_ENDPOINTS, probes):
+                if probe.result():
                     logger.info(f"Found working API endpoint: {endpoint}")
                     return endpoint
-                # If we got a response with an API error about the key being valid, it's likely the correct endpoint
-                elif isinstance(data, dict) and 'error' in data and 'key' in data['error'].lower():
-                    logger.info(f"Found likely API endpoint (key error): {endpoint}")
-                    return endpoint
-                
-            except Exception as e:
-                logger.warning(f"Endpoint {endpoint} failed: {str(e)}")
-                continue
+        finally:
+            # Probes of the endpoints after the chosen one are not waited for
+            executor.shutdown(wait=False)
         
-        # Default to smmpanel.net if no endpoint worked
-        logger.warning("No working endpoint found, using default endpoint")
-        return "https://smmpanel.net/api/v2"
+        logger.warning(f"No working endpoint found, using {self.api_url}")
+        return None
     
-    def _make_request(self, action, params=None):
-        """Make a request to the API with the given action and parameters"""
+    def _test_endpoint(self, endpoint):
+        """Check whether an endpoint looks like the panel for our API key"""
+        try:
+            logger.info(f"Testing API endpoint: {endpoint}")
+            params = {
+                'key': self.api_key,
+                'action': 'balance'
+            }
+            response = requests.post(endpoint, data=params, timeout=5)
+            response.raise_for_status()
+            
+            # Try to parse the response
+            data = response.json()
+            
+            # If we got a valid response without error, this is likely the correct endpoint
+            if isinstance(data, dict) and 'balance' in data:
+                return True
+            # If we got a response with an API error about the key being valid, it's likely the correct endpoint
+            return isinstance(data, dict) and 'error' in data and 'key' in str(data['error']).lower()
+        except Exception as e:
+            logger.warning(f"Endpoint {endpoint} failed: {str(e)}")
+            return False
+    
+    def _make_request(self, action, params=None, priority=None):
+        """Make a request to the API with the given action and parameters
+        
+        Identical concurrent requests for safe actions are coalesced into one
+        panel call whose result every caller gets.
+        """
         if params is None:
             params = {}
+        if action not in SAFE_ACTIONS:
+            return self._send(action, params, priority)
+        
+        key = (action, tuple(sorted((name, str(value)) for name, value in params.items())))
+        return self.single_flight.do(key, lambda: self._send(action, params, priority))
+    
+    def _send(self, action, params, priority=None):
+        """Send a request, waiting for the scheduler and retrying when allowed
+        
+        Every attempt waits for a slot in the request scheduler, at the priority
+        of the action unless one is given. Transient failures of safe actions are
+        retried with jittered exponential backoff while the retry budget allows.
+        Other actions are sent once; their errors carry 'retryable' only when the
+        request never reached the panel.
+        """
+        if priority is None:
+            priority = ACTION_PRIORITIES.get(action, PRIORITY_STATUS)
+        
+        # Nothing can be sent before the endpoint is known
+        if not self._endpoint_ready.is_set():
+            self.start_endpoint_detection()
+            self._endpoint_ready.wait(self.timeout[0] * 2)
             
         # Add API key and action to parameters
         params['key'] = self.api_key
         params['action'] = action
         
+        self.retry_budget.record_request()
+        self._count(action, 'requests')
+        
+        attempt = 0
+        while True:
+            if not self.scheduler.acquire(action, priority):
+                return {'error': "API busy, request not sent", 'retryable': True}
+            try:
+                result, transient = self._request_once(action, params)
+            finally:
+                self.scheduler.release()
+            
+            if not transient or action not in SAFE_ACTIONS:
+                if attempt:
+                    self._count(action, 'retry_successes' if not transient else 'retry_failures')
+                return result
+            
+            if attempt >= self.max_retries:
+                self._count(action, 'retry_failures')
+                return result
+            if not self.retry_budget.try_spend():
+                logger.warning(f"Retry budget exhausted, not retrying API request {action}")
+                self._count(action, 'budget_exhausted')
+                return result
+            
+            # Full jitter: sleep a random time up to the exponential delay
+            delay = random.uniform(0, min(self.retry_max_delay, self.retry_base_delay * (2 ** attempt)))
+            attempt += 1
+            self._count(action, 'retries')
+            logger.info(f"Retrying API request {action} in {delay:.2f}s (attempt {attempt + 1})")
+            time.sleep(delay)
+    
+    def _count(self, action, counter):
+        """Increment a retry counter, in total and for the action"""
+        with self._stats_lock:
+            self.retry_stats[counter] = self.retry_stats.get(counter, 0) + 1
+            by_action = self.retry_stats['by_action'].setdefault(action, {})
+            by_action[counter] = by_action.get(counter, 0) + 1
+    
+    def get_retry_stats(self):
+        """Get a copy of the retry counters"""
+        with self._stats_lock:
+            stats = dict(self.retry_stats)
+            stats['by_action'] = {action: dict(counters) for action, counters in self.retry_stats['by_action'].items()}
+            stats['budget_tokens'] = self.retry_budget.tokens
+            return stats
+    
+    def get_status_cache_stats(self):
+        """Get size and hit ratio of the order status cache"""
+        return self.status_cache.stats()
+    
+    def get_coalescing_stats(self):
+        """Get calls, coalesced calls and coalescing ratio per action"""
+        return self.single_flight.stats()
+    
+    def get_scheduler_stats(self):
+        """Get queue depth and wait times of the request scheduler"""
+        return self.scheduler.stats()
+    
+    def _request_once(self, action, params):
+        """Send one request to the active endpoint
+        
+        Failures of actions outside SAFE_ACTIONS that the panel may have acted
+        on anyway (read timeout, dropped connection, 5xx, unreadable answer)
+        carry outcome_unknown, so a placed order is not taken for a failed one.
+        
+        Returns:
+            tuple: (response data or error dict, whether the failure is transient)
+        """
+        endpoint = self.api_url
+        breaker = self.breakers[endpoint]
+        if not breaker.allow_request():
+            # Fail fast while the endpoint is unhealthy and look for a healthy one in the background
+            logger.warning(f"API request {action} rejected, circuit open for {endpoint}")
+            self._start_failover()
+            return {'error': "API temporarily unavailable", 'retryable': True}, False
+        
+        unsafe = action not in SAFE_ACTIONS
+        start_time = time.time()
+        healthy = False
+        outcome = 'error'
         try:
-            logger.info(f"Making API request: {action} with params: {params}")
-            response = requests.post(self.api_url, data=params)
+            logger.debug(f"Making API request: {action}")
+            response = requests.post(endpoint, data=params, timeout=self.timeout)
             response.raise_for_status()  # Raise an exception for HTTP errors
             
             # Log response for debugging
-            logger.info(f"API raw response: {response.text[:100]}...")
+            logger.debug(f"API raw response: {response.text[:100]}...")
             
-            return response.json()
+            result = response.json()
+            healthy = True
+            outcome = 'ok'
+            return result, False
+        except requests.exceptions.ConnectionError as e:
+            # Only a failed connect guarantees the panel never saw the request
+            logger.error(f"API connection failed: {e}")
+            if unsafe and not _is_connect_error(e):
+                return {'error': str(e), 'retryable': False, 'outcome_unknown': True}, True
+            return {'error': str(e), 'retryable': True}, True
+        except requests.exceptions.HTTPError as e:
+            logger.error(f"API request failed: {e}")
+            status_code = e.response.status_code if e.response is not None else None
+            # Client errors are answers from a working panel, not endpoint failures
+            healthy = status_code is not None and status_code < 500 and status_code != 429
+            transient = status_code in (429, 502, 503, 504)
+            if unsafe and (status_code is None or status_code >= 500):
+                return {'error': str(e), 'retryable': False, 'outcome_unknown': True}, transient
+            # A rate-limited request was refused before the panel acted on it
+            return {'error': str(e), 'retryable': status_code == 429 or (transient and not unsafe)}, transient
+        except requests.exceptions.Timeout as e:
+            logger.error(f"API request timed out: {e}")
+            if unsafe:
+                return {'error': str(e), 'retryable': False, 'outcome_unknown': True}, True
+            return {'error': str(e), 'retryable': True}, True
         except requests.exceptions.RequestException as e:
             logger.error(f"API request failed: {e}")
-            return {'error': str(e)}
+            if unsafe:
+                return {'error': str(e), 'outcome_unknown': True}, False
+            return {'error': str(e)}, False
         except ValueError as e:  # JSON decode error
             logger.error(f"Failed to parse API response: {e}")
-            return {'error': f"Invalid JSON response: {e}"}
+            if unsafe:
+                return {'error': f"Invalid JSON response: {e}", 'outcome_unknown': True}, True
+            return {'error': f"Invalid JSON response: {e}"}, True
+        finally:
+            elapsed = time.time() - start_time
+            breaker.record(healthy, elapsed)
+            metrics.observe('bot_panel_request_duration_seconds', elapsed, action=action, outcome=outcome)
+            if breaker.state == CircuitBreaker.OPEN:
+                self._start_failover()
+    
+    def _start_failover(self):
+        """Start looking for a healthy endpoint in a background thread"""
+        if len(self.api_urls) < 2:
+            return
+        with self._failover_lock:
+            if self._failover_thread and self._failover_thread.is_alive():
+                return
+            self._failover_thread = threading.Thread(target=self._failover, name="api-failover", daemon=True)
+            self._failover_thread.start()
+    
+    def _failover(self):
+        """Switch to the first other endpoint, in configured order, whose breaker lets a probe pass
+        
+        The active endpoint is left to its own half-open probe, so an endpoint
+        tripped for being slow is not taken back because it still answers.
+        """
+        while self.breakers[self.api_url].state != CircuitBreaker.CLOSED:
+            current = self.api_url
+            for endpoint in self.api_urls:
+                if endpoint == current or not self.breakers[endpoint].allow_request():
+                    continue
+                if self._probe_endpoint(endpoint):
+                    logger.warning(f"Failing over from {current} to {endpoint}")
+                    self.api_url = endpoint
+                    return
+            time.sleep(self.breakers[current].cooldown_seconds)
+    
+    def _probe_endpoint(self, endpoint):
+        """Check whether an endpoint answers a balance request, recording the outcome in its breaker"""
+        breaker = self.breakers[endpoint]
+        start_time = time.time()
+        healthy = False
+        try:
+            response = requests.post(endpoint, data={'key': self.api_key, 'action': 'balance'}, timeout=self.timeout)
+            response.raise_for_status()
+            data = response.json()
+            # An error from the panel itself still means the endpoint is up
+            healthy = isinstance(data, dict) and ('balance' in data or 'error' in data)
+        except Exception as e:
+            logger.warning(f"Health probe for {endpoint} failed: {e}")
+        elapsed = time.time() - start_time
+        breaker.record(healthy, elapsed)
+        return healthy and elapsed < breaker.slow_call_seconds
+    
+    def get_endpoint_health(self):
+        """Get circuit state and rolling statistics for every configured endpoint"""
+        health = {}
+        for url in self.api_urls:
+            health[url] = self.breakers[url].stats()
+            health[url]['active'] = url == self.api_url
+        return health
     
     def get_balance(self):
         """Get account balance"""
         logger.info("Getting account balance")
         # Make real API call to check balance
         response = self._make_request('balance')
-        logger.info(f"Balance response: {response}")
+        logger.debug(f"Balance response: {response}")
         return response
     
     def get_services(self):
@@ -149,19 +520,6 @@ class SMMApiClient:
             return {"error": "Missing required parameters"}
         
         try:
-            # Get original service info to get the real rate
-            services = self._make_request('services')
-            original_rate = None
-            bot_rate = None
-            
-            if isinstance(services, list):
-                for s in services:
-                    if str(s.get('service')) == str(service):
-                        # Store both the original rate and the bot's rate (with markup)
-                        original_rate = float(s.get('rate', 0))
-                        bot_rate = original_rate * 1.5  # 50% markup
-                        break
-            
             params = {
                 'service': service,
                 'link': link,
@@ -172,43 +530,12 @@ class SMMApiClient:
             if comments:
                 params['comments'] = comments
             
-            # Log both the original price and the bot's price
-            if original_rate and bot_rate:
-                original_price = (original_rate * int(quantity)) / 1000
-                bot_price = (bot_rate * int(quantity)) / 1000
-                logger.info(f"Placing order with original price: ${original_price:.2f}, bot price: ${bot_price:.2f}")
-                
-                # Store the bot price in context for later use
-                if 'bot_prices' not in self.__dict__:
-                    self.bot_prices = {}
-                
-                # We'll use this to look up the bot price when checking order status
-                self.bot_prices[str(service)] = bot_rate
-            
-            # Log the parameters being sent to the API
-            logger.info(f"API order parameters: {params}")
-            
             # Make the real API call to place the order
             response = self._make_request('add', params)
-            logger.info(f"API response for order: {response}")
+            logger.debug(f"API response for order: {response}")
             
-            # If the order was successful, store the bot price for this order
-            if isinstance(response, dict) and 'order' in response:
-                order_id = str(response['order'])
-                if bot_rate:
-                    # Store the order with its bot price for future reference
-                    if 'order_prices' not in self.__dict__:
-                        self.order_prices = {}
-                    
-                    self.order_prices[order_id] = bot_price
-                    logger.info(f"Stored bot price ${bot_price:.2f} for order {order_id}")
-            
-            # For testing purposes, if the API call fails, return a mock response
-            if not response or (isinstance(response, dict) and 'error' in response):
-                logger.warning(f"API order failed, returning mock response for testing")
-                import random
-                mock_order_id = random.randint(10000, 99999)
-                return {"order": mock_order_id}
+            if not response:
+                return {"error": "Empty response from API"}
             
             return response
         except Exception as e:
@@ -220,23 +547,31 @@ class SMMApiClient:
         logger.info(f"Checking order status: order_id={order_id}")
         
         try:
-            params = {
-                'order': order_id
-            }
-            
-            # Make real API call to check order status
-            response = self._make_request('status', params)
-            logger.info(f"API status response: {response}")
+            # Serve repeated lookups from the status cache
+            response = self.status_cache.get(order_id)
+            if response is not None:
+                logger.debug(f"Order status for {order_id} served from cache")
+            else:
+                params = {
+                    'order': order_id
+                }
+                
+                # Make real API call to check order status
+                response = self._make_request('status', params)
+                logger.debug(f"API status response: {response}")
+                self.status_cache.put(order_id, response)
             
-            # If we have a valid response, add the bot price if available
+            # If we have a valid response, add the price the user paid
             if isinstance(response, dict) and not response.get('error'):
-                # Check if we have stored the bot price for this order
-                if hasattr(self, 'order_prices') and order_id in self.order_prices:
-                    # Add the bot price to the response
-                    response['bot_price'] = self.order_prices[order_id]
-                    logger.info(f"Added bot price ${response['bot_price']:.2f} to order status response")
+                order = db.get_order_by_id(order_id)
+                if order and order['price'] is not None:
+                    response['bot_price'] = order['price']
+                    
+                    # Keep the panel's charge for the order, written only when it changes
+                    if 'charge' in response and order['panel_charge'] != self._to_float(response['charge']):
+                        db.record_panel_charges([(order_id, response['charge'])])
                 
-                # If we don't have the bot price stored but we have the charge, calculate it
+                # Orders placed outside the bot have no stored price, derive it from the charge
                 elif 'charge' in response:
                     try:
                         # The API charge is the original price, apply our markup
@@ -252,25 +587,6 @@ class SMMApiClient:
                 error_msg = response['error']
                 logger.warning(f"API returned error for order {order_id}: {error_msg}")
                 
-                # For testing purposes, if we're in development mode, return mock data
-                if os.getenv("DEVELOPMENT_MODE") == "1":
-                    logger.info("Development mode enabled, returning mock order status")
-                    import random
-                    statuses = ["pending", "processing", "in progress", "completed", "partial"]
-                    
-                    # Generate both original charge and bot charge
-                    original_charge = round(random.uniform(0.5, 5.0), 2)
-                    bot_charge = original_charge * 1.5
-                    
-                    mock_status = {
-                        "order": order_id,
-                        "status": random.choice(statuses),
-                        "charge": original_charge,
-                        "bot_price": bot_charge,
-                        "start_count": random.randint(0, 100),
-                        "remains": random.randint(0, 1000)
-                    }
-                    return mock_status
             
             return response
         except Exception as e:
@@ -286,7 +602,24 @@ class SMMApiClient:
             'orders': order_ids
         }
         logger.info(f"Checking multiple order statuses: order_ids={order_ids}")
-        return self._make_request('status', params)
+        response = self._make_request('status', params)
+        
+        # Keep the individual statuses for later single lookups, and the panel charges
+        if isinstance(response, dict) and not response.get('error'):
+            charges = []
+            for order_id, status in response.items():
+                self.status_cache.put(order_id, status)
+                if isinstance(status, dict) and 'charge' in status:
+                    charges.append((order_id, status['charge']))
+            db.record_panel_charges(charges)
+        return response
+    
+    @staticmethod
+    def _to_float(value):
+        try:
+            return float(value)
+        except (ValueError, TypeError):
+            return None
     
     def create_refill(self, order_id):
         """Create a refill for an order"""
@@ -0,0 +1,113 @@
+import logging
+import threading
+from collections import Counter
+
+logger = logging.getLogger(__name__)
+
+# Telegram limits callback data to 64 bytes
+MAX_CALLBACK_DATA = 64
+
+class CallbackRouter:
+    """Dispatches callback data to handlers through dict lookups
+
+    Two formats are understood:
+
+    - compact "namespace:action:args", looked up by (namespace, action) in
+      one dict access; args are passed to the handler as context.args
+    - the older underscore names, matched exactly or by the longest
+      registered prefix ending in "_" (one dict access per underscore)
+
+    Every routed callback is counted under the name of its route.
+    """
+
+    # Callback data in the compact format
+    COMPACT_PATTERN = r'^[a-z]+:[a-z_]+(:|$)'
+
+    def __init__(self):
+        self._routes = {}    # (namespace, action) -> (name, handler)
+        self._exact = {}     # callback data -> (name, handler)
+        self._prefixes = {}  # prefix ending in "_" -> (name, handler)
+        self.hits = Counter()
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def add(self, namespace, action, handler, name=None):
+        """Route "namespace:action[:args]" to handler"""
+        self._routes[(namespace, action)] = (name or f"{namespace}:{action}", handler)
+
+    def add_exact(self, data, handler, name=None):
+        """Route one legacy callback value to handler"""
+        self._exact[data] = (name or data, handler)
+
+    def add_prefix(self, prefix, handler, name=None):
+        """Route legacy callbacks starting with prefix (which must end in "_") to handler"""
+        if not prefix.endswith("_"):
+            raise ValueError(f"Callback prefix must end with '_': {prefix}")
+        self._prefixes[prefix] = (name or prefix, handler)
+
+    def resolve(self, data):
+        """Find the route for callback data
+
+        Returns:
+            tuple: (route name, handler, args), or None if nothing matches
+        """
+        if ":" in data:
+            parts = data.split(":", 2)
+            route = self._routes.get((parts[0], parts[1] if len(parts) > 1 else ""))
+            if route:
+                return route[0], route[1], parts[2].split(":") if len(parts) > 2 else []
+            return None
+
+        route = self._exact.get(data)
+        if route:
+            return route[0], route[1], []
+
+        # Longest prefix first, cutting at each underscore from the right
+        end = data.rfind("_")
+        while end != -1:
+            route = self._prefixes.get(data[:end + 1])
+            if route:
+                return route[0], route[1], []
+            end = data.rfind("_", 0, end)
+        return None
+
+    def dispatch(self, update, context):
+        """Call the handler for the update's callback data
+
+        Returns:
+            tuple: (True, handler result) if a route matched, else (False, None)
+        """
+        resolved = self.resolve(update.callback_query.data or "")
+        if resolved is None:
+            with self._lock:
+                self.misses += 1
+            return False, None
+
+        name, handler, args = resolved
+        with self._lock:
+            self.hits[name] += 1
+        context.args = args
+        return True, handler(update, context)
+
+    def handle(self, update, context):
+        """CallbackQueryHandler callback for compact callback data"""
+        matched, result = self.dispatch(update, context)
+        if not matched:
+            logger.warning(f"Unhandled callback data: {update.callback_query.data}")
+            update.callback_query.answer()
+        return result
+
+    def stats(self):
+        """Hit count per route, most used first"""
+        with self._lock:
+            return {'hits': dict(self.hits.most_common()), 'misses': self.misses}
+
+def build_callback_data(namespace, action, *args):
+    """Build compact callback data, checking Telegram's size limit"""
+    data = ":".join([namespace, action] + [str(arg) for arg in args])
+    if len(data.encode("utf-8")) > MAX_CALLBACK_DATA:
+        raise ValueError(f"Callback data longer than {MAX_CALLBACK_DATA} bytes: {data}")
+    return data
+
+# Create a singleton instance
+callback_router = CallbackRouter()
@@ -0,0 +1,105 @@
+import time
+import logging
+import threading
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+class CircuitBreaker:
+    """Circuit breaker over a rolling window of call outcomes and latencies
+
+    The breaker opens when, over the last window_seconds, at least min_calls
+    were made and either the error rate or the share of slow calls reaches
+    its threshold. While open, calls fail fast. After cooldown_seconds one
+    probe call is let through (half-open), and its outcome closes or reopens
+    the breaker.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, name, window_seconds=60, min_calls=5, error_threshold=0.5,
+                 slow_call_seconds=10.0, slow_call_threshold=0.8, cooldown_seconds=30):
+        self.name = name
+        self.window_seconds = window_seconds
+        self.min_calls = min_calls
+        self.error_threshold = error_threshold
+        self.slow_call_seconds = slow_call_seconds
+        self.slow_call_threshold = slow_call_threshold
+        self.cooldown_seconds = cooldown_seconds
+        self.state = self.CLOSED
+        self.opened_at = None
+        self.rejected = 0
+        self._calls = deque()  # (timestamp, ok, latency)
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+    def _trim(self, now):
+        while self._calls and now - self._calls[0][0] > self.window_seconds:
+            self._calls.popleft()
+
+    def allow_request(self):
+        """Whether a call may be made now"""
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and time.time() - self.opened_at >= self.cooldown_seconds:
+                self.state = self.HALF_OPEN
+                self._probe_in_flight = False
+            if self.state == self.HALF_OPEN and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return True
+            self.rejected += 1
+            return False
+
+    def record(self, ok, latency):
+        """Record the outcome of a call"""
+        now = time.time()
+        with self._lock:
+            if self.state == self.HALF_OPEN:
+                self._probe_in_flight = False
+                if ok and latency < self.slow_call_seconds:
+                    self._close()
+                else:
+                    self._open(now, "probe failed")
+                return
+
+            self._calls.append((now, ok, latency))
+            self._trim(now)
+            if self.state != self.CLOSED or len(self._calls) < self.min_calls:
+                return
+
+            errors = sum(1 for _, call_ok, _ in self._calls if not call_ok)
+            slow = sum(1 for _, _, call_latency in self._calls if call_latency >= self.slow_call_seconds)
+            if errors / len(self._calls) >= self.error_threshold:
+                self._open(now, f"error rate {errors}/{len(self._calls)}")
+            elif slow / len(self._calls) >= self.slow_call_threshold:
+                self._open(now, f"slow calls {slow}/{len(self._calls)}")
+
+    def _open(self, now, reason):
+        self.state = self.OPEN
+        self.opened_at = now
+        self._calls.clear()
+        logger.warning(f"Circuit for {self.name} opened: {reason}")
+
+    def _close(self):
+        self.state = self.CLOSED
+        self.opened_at = None
+        self._calls.clear()
+        logger.info(f"Circuit for {self.name} closed")
+
+    def stats(self):
+        """Get the state and rolling window statistics"""
+        with self._lock:
+            self._trim(time.time())
+            latencies = sorted(latency for _, _, latency in self._calls)
+            errors = sum(1 for _, ok, _ in self._calls if not ok)
+            return {
+                'state': self.state,
+                'calls': len(self._calls),
+                'error_rate': errors / len(self._calls) if self._calls else 0.0,
+                'p50_latency': latencies[len(latencies) // 2] if latencies else 0.0,
+                'p95_latency': latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))] if latencies else 0.0,
+                'rejected': self.rejected
+            }
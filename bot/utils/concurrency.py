@@ -0,0 +1,123 @@
+import logging
+import threading
+from collections import deque
+from functools import wraps
+from telegram import Update
+from telegram.ext import ConversationHandler, DispatcherHandlerStop, TypeHandler
+from telegram.ext.utils.promise import Promise
+
+logger = logging.getLogger(__name__)
+
+class UserSerializer:
+    """Runs handlers on the dispatcher's worker pool, one at a time per user
+
+    Updates of different users are handled concurrently, while the queued
+    updates of one user run strictly in arrival order, so a slow panel call
+    only delays the user who made it. Conversations passed through
+    serialize_conversation() also queue the user's other updates behind a
+    running callback, so they never interleave.
+    """
+
+    def __init__(self):
+        self._queues = {}
+        self._lock = threading.Lock()
+
+    def submit(self, dispatcher, key, promise):
+        """Queue a promise behind the user's pending ones"""
+        with self._lock:
+            queue = self._queues.get(key)
+            if queue is not None:
+                queue.append(promise)
+                return
+            self._queues[key] = deque([promise])
+        dispatcher.run_async(self._drain, dispatcher, key)
+
+    def pending(self):
+        """Number of users with queued or running handlers"""
+        with self._lock:
+            return len(self._queues)
+
+    def busy(self, key):
+        """Whether the user has queued or running handlers"""
+        with self._lock:
+            return key in self._queues
+
+    def _drain(self, dispatcher, key):
+        while True:
+            with self._lock:
+                queue = self._queues[key]
+                if not queue:
+                    del self._queues[key]
+                    return
+                promise = queue.popleft()
+
+            promise.run()
+            if promise.exception is None:
+                dispatcher.update_persistence(update=promise.update)
+            else:
+                dispatcher.dispatch_error(promise.update, promise.exception, promise=promise)
+
+# Create a singleton instance
+user_serializer = UserSerializer()
+
+def _user_key(update):
+    """Serialization key of an update: its user, else its chat"""
+    if update.effective_user:
+        return update.effective_user.id
+    if update.effective_chat:
+        return update.effective_chat.id
+    return None
+
+def _redispatch(conversation, update, context):
+    """Offer a deferred update to the conversation, then to the handlers after it in its group"""
+    dispatcher = context.dispatcher
+    candidates = [conversation]
+    for handlers in dispatcher.handlers.values():
+        if conversation in handlers:
+            candidates = handlers[handlers.index(conversation):]
+            break
+
+    for handler in candidates:
+        check = handler.check_update(update)
+        if check is not None and check is not False:
+            try:
+                handler.handle_update(update, dispatcher, check, context)
+            except DispatcherHandlerStop:
+                pass
+            return
+
+def serialize_conversation(conversation):
+    """Queue the updates a conversation receives while a per-user callback of it runs
+
+    While the Promise returned by a run_async_per_user callback is pending,
+    ConversationHandler only offers the user's updates to its WAITING
+    handlers, and without any they fall through to other handlers or are
+    dropped. This adds a WAITING handler that queues them on the user's
+    serializer behind the running callback; each one is then offered to the
+    conversation again, in the state the callback returned.
+
+    Returns:
+        ConversationHandler: The conversation, for use in add_handler()
+    """
+    def defer(update, context):
+        promise = Promise(_redispatch, (conversation, update, context), {}, update=update)
+        user_serializer.submit(context.dispatcher, _user_key(update), promise)
+
+    conversation.states[ConversationHandler.WAITING] = [TypeHandler(Update, defer)]
+    return conversation
+
+def run_async_per_user(callback):
+    """Wrap a handler callback to run on the worker pool, serialized per user
+
+    The wrapper returns a Promise, which ConversationHandler treats like the
+    result of a run_async handler: the conversation moves to the returned
+    state once the callback has finished. Conversations using it must be
+    registered through serialize_conversation().
+    """
+    @wraps(callback)
+    def wrapper(update, context):
+        promise = Promise(callback, (update, context), {}, update=update)
+        user_serializer.submit(context.dispatcher, _user_key(update), promise)
+        return promise
+    wrapper.runs_per_user = True
+    return wrapper
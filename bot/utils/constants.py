@@ -31,7 +31,7 @@ ORDER_STATUS_EMOJIS = {
     "Failed": "❗"
 }
 
-# This will be populated from the database at runtime
+# This will be populated from the database at startup (see load_currency_rates_from_db)
 CURRENCY_RATES = DEFAULT_CURRENCY_RATES.copy()
 
 def load_currency_rates_from_db():
@@ -58,10 +58,3 @@ def reload_currency_rates():
     global CURRENCY_RATES
     CURRENCY_RATES = load_currency_rates_from_db()
     return CURRENCY_RATES
-
-# Load currency rates when the module is imported
-try:
-    load_currency_rates_from_db()
-except Exception as e:
-    import logging
-    logging.getLogger(__name__).error(f"Error loading currency rates from database: {e}") 
\ No newline at end of file
@@ -1,15 +1,102 @@
+import re
 import json
 import os
+import time
 import logging
-from datetime import datetime
+import threading
+from datetime import datetime, timedelta, timezone
 import sqlite3
 from dotenv import load_dotenv
+from utils.metrics import metrics
+from utils.db_profiler import profiler, ProfiledLock
 
 # Load environment variables
 load_dotenv()
 
 logger = logging.getLogger(__name__)
 
+# (operation, table) per statement text; statements are mostly constant strings
+_statement_labels = {}
+_TABLE_PATTERN = re.compile(
+    r'\b(?:FROM|INTO|UPDATE|TABLE(?:\s+IF\s+NOT\s+EXISTS)?|INDEX(?:\s+IF\s+NOT\s+EXISTS)?\s+\w+\s+ON)\s+(?:OR\s+\w+\s+)?["\[]?(\w+)',
+    re.IGNORECASE
+)
+
+def statement_labels(sql):
+    """Operation and main table of a SQL statement, e.g. ("SELECT", "orders")"""
+    labels = _statement_labels.get(sql)
+    if labels is None:
+        words = sql.split(None, 1)
+        operation = words[0].upper() if words else ""
+        match = _TABLE_PATTERN.search(sql)
+        labels = (operation, match.group(1) if match else "")
+        if len(_statement_labels) < 5000:
+            _statement_labels[sql] = labels
+    return labels
+
+def utc_now():
+    """Current UTC time as a naive datetime, comparable with SQLite's CURRENT_TIMESTAMP"""
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+class TimedCursor(sqlite3.Cursor):
+    """Cursor that records the duration of every statement it executes
+    
+    With the query profiler enabled, statements and fetched rows are also
+    recorded there and slow statements are logged with their query plan.
+    """
+    
+    _profiled_sql = None
+    
+    def execute(self, sql, parameters=()):
+        start = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            self._record(sql, parameters, time.perf_counter() - start)
+    
+    def executemany(self, sql, seq_of_parameters):
+        start = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            self._record(sql, None, time.perf_counter() - start)
+    
+    def _record(self, sql, parameters, elapsed):
+        operation, table = statement_labels(sql)
+        metrics.observe('bot_sqlite_query_duration_seconds', elapsed, operation=operation, table=table)
+        if profiler.enabled:
+            self._profiled_sql = sql
+            if profiler.record(sql, elapsed, max(self.rowcount, 0)) and parameters is not None:
+                profiler.log_slow(self.connection, sql, parameters, elapsed)
+    
+    def fetchone(self):
+        row = super().fetchone()
+        if self._profiled_sql is not None and row is not None:
+            profiler.add_rows(self._profiled_sql, 1)
+        return row
+    
+    def fetchmany(self, size=None):
+        rows = super().fetchmany(self.arraysize if size is None else size)
+        if self._profiled_sql is not None:
+            profiler.add_rows(self._profiled_sql, len(rows))
+        return rows
+    
+    def fetchall(self):
+        rows = super().fetchall()
+        if self._profiled_sql is not None:
+            profiler.add_rows(self._profiled_sql, len(rows))
+        return rows
+
+class TimedConnection(sqlite3.Connection):
+    """Connection whose cursors are TimedCursors"""
+    
+    def cursor(self, factory=TimedCursor):
+        return super().cursor(factory)
+    
+    def execute_unprofiled(self, sql, parameters=()):
+        """Run a statement on a plain cursor and return all rows"""
+        return super().cursor().execute(sql, parameters).fetchall()
+
 class Database:
     def __init__(self):
         # Get database path from environment variable or use default
@@ -21,7 +108,15 @@ class Database:
         abs_path = os.path.abspath(db_path)
         logger.info(f"Using database at: {abs_path}")
         
-        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.conn = sqlite3.connect(db_path, check_same_thread=False, factory=TimedConnection)
+        
+        # The connection is shared between threads, so every statement runs
+        # under this lock and write transactions hold it until they commit
+        self.write_lock = ProfiledLock(profiler) if profiler.enabled else threading.RLock()
+        
+        # Users whose activity was already recorded on _active_day (UTC)
+        self._active_day = None
+        self._active_today = set()
         self.create_tables()
         self.migrate_database()
     
@@ -40,6 +135,44 @@ class Database:
             self.conn.commit()
             logger.info("Added currency_preference column to users table")
         
+        if 'command_menu_active' not in column_names:
+            # Whether the reply keyboard command menu was sent to the user
+            cursor.execute("ALTER TABLE users ADD COLUMN command_menu_active INTEGER")
+            self.conn.commit()
+            logger.info("Added command_menu_active column to users table")
+        
+        rebuild_activity_stats = False
+        if 'last_active_day' not in column_names:
+            # UTC day of the user's last activity, the key of the active user rollups
+            cursor.execute("ALTER TABLE users ADD COLUMN last_active_day TEXT")
+            self.conn.commit()
+            logger.info("Added last_active_day column to users table")
+            rebuild_activity_stats = True
+        
+        # Check if paid_amount column exists in orders table
+        cursor.execute("PRAGMA table_info(orders)")
+        order_column_names = [column[1] for column in cursor.fetchall()]
+        
+        if 'paid_amount' not in order_column_names:
+            # Amount actually debited for the order (0 for free admin orders), refunded on release
+            cursor.execute("ALTER TABLE orders ADD COLUMN paid_amount REAL DEFAULT 0.0")
+            self.conn.commit()
+            logger.info("Added paid_amount column to orders table")
+        
+        if 'idempotency_key' not in order_column_names:
+            # Dedup key for order submissions (double taps, Telegram retries)
+            cursor.execute("ALTER TABLE orders ADD COLUMN idempotency_key TEXT")
+            cursor.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_orders_idempotency_key ON orders (idempotency_key)")
+            self.conn.commit()
+            logger.info("Added idempotency_key column to orders table")
+        
+        if 'panel_charge' not in order_column_names:
+            # What the panel charged for the order, and the markup of our price over it
+            cursor.execute("ALTER TABLE orders ADD COLUMN panel_charge REAL")
+            cursor.execute("ALTER TABLE orders ADD COLUMN markup REAL")
+            self.conn.commit()
+            logger.info("Added panel_charge and markup columns to orders table")
+        
         # Check if settings table exists
         cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='settings'")
         if not cursor.fetchone():
@@ -125,6 +258,150 @@ class Database:
             self.conn.commit()
             logger.info("Created tutorial_media table")
         
+        # Check if stats tables exist
+        cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='stats_daily'")
+        if not cursor.fetchone():
+            # Create running counters and daily rollup tables for the admin dashboard
+            cursor.execute('''
+            CREATE TABLE stats_counters (
+                name TEXT PRIMARY KEY,
+                value INTEGER NOT NULL DEFAULT 0
+            )
+            ''')
+            cursor.execute('''
+            CREATE TABLE stats_daily (
+                day TEXT PRIMARY KEY,
+                new_users INTEGER NOT NULL DEFAULT 0,
+                orders INTEGER NOT NULL DEFAULT 0,
+                active_users INTEGER NOT NULL DEFAULT 0,
+                last_active_users INTEGER NOT NULL DEFAULT 0
+            )
+            ''')
+            self.conn.commit()
+            logger.info("Created stats_counters and stats_daily tables")
+            
+            # Backfill counters and rollups from existing data
+            self.rebuild_stats()
+        elif rebuild_activity_stats:
+            # Re-key the activity rollups on last_active_day
+            self.rebuild_stats()
+        
+        # Check if user_totals table exists
+        cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='user_totals'")
+        if not cursor.fetchone():
+            # Create per-user summary of the orders and balance ledger
+            cursor.execute('''
+            CREATE TABLE user_totals (
+                user_id INTEGER PRIMARY KEY,
+                order_count INTEGER NOT NULL DEFAULT 0,
+                total_spent REAL NOT NULL DEFAULT 0.0,
+                total_debited REAL NOT NULL DEFAULT 0.0,
+                total_credited REAL NOT NULL DEFAULT 0.0,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+            ''')
+            self.conn.commit()
+            logger.info("Created user_totals table")
+            
+            # Backfill the summary rows from the raw ledger
+            self.reconcile_user_totals()
+        
+        # Check if order_queue table exists
+        cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='order_queue'")
+        if not cursor.fetchone():
+            # Create persistent queue of reserved orders waiting to be sent to the panel
+            cursor.execute('''
+            CREATE TABLE order_queue (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                reservation_id INTEGER NOT NULL UNIQUE,
+                chat_id INTEGER,
+                message_id INTEGER,
+                language TEXT,
+                comments TEXT,
+                status TEXT NOT NULL DEFAULT 'queued',
+                attempts INTEGER NOT NULL DEFAULT 0,
+                next_attempt_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                last_error TEXT,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+            ''')
+            cursor.execute('CREATE INDEX idx_order_queue_due ON order_queue (status, next_attempt_at)')
+            self.conn.commit()
+            logger.info("Created order_queue table")
+        
+        # Check if batch columns exist in order_queue table
+        cursor.execute("PRAGMA table_info(order_queue)")
+        queue_column_names = [column[1] for column in cursor.fetchall()]
+        
+        if 'batch_id' not in queue_column_names:
+            # Jobs of a mass order share a batch ID and are reported together
+            cursor.execute("ALTER TABLE order_queue ADD COLUMN batch_id TEXT")
+            cursor.execute("ALTER TABLE order_queue ADD COLUMN batch_line INTEGER")
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_order_queue_batch ON order_queue (batch_id)")
+            self.conn.commit()
+            logger.info("Added batch columns to order_queue table")
+        
+        # Check if drip-feed tables exist
+        cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='drip_feeds'")
+        if not cursor.fetchone():
+            # Create drip-feed plans and their scheduled slices (one reserved order per slice)
+            cursor.execute('''
+            CREATE TABLE drip_feeds (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id INTEGER NOT NULL,
+                service_id TEXT NOT NULL,
+                service_name TEXT,
+                link TEXT,
+                total_quantity INTEGER,
+                slice_quantity INTEGER,
+                interval_seconds INTEGER,
+                price REAL,
+                chat_id INTEGER,
+                language TEXT,
+                status TEXT NOT NULL DEFAULT 'active',
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+            ''')
+            cursor.execute('''
+            CREATE TABLE drip_feed_slices (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                drip_feed_id INTEGER NOT NULL,
+                reservation_id INTEGER NOT NULL,
+                slice_no INTEGER,
+                due_at TIMESTAMP NOT NULL,
+                status TEXT NOT NULL DEFAULT 'scheduled'
+            )
+            ''')
+            cursor.execute('CREATE INDEX idx_drip_feed_slices_due ON drip_feed_slices (status, due_at)')
+            cursor.execute('CREATE INDEX idx_drip_feed_slices_plan ON drip_feed_slices (drip_feed_id)')
+            cursor.execute('CREATE INDEX idx_drip_feeds_user ON drip_feeds (user_id, status)')
+            self.conn.commit()
+            logger.info("Created drip_feeds and drip_feed_slices tables")
+        
+        # Check if conversation persistence tables exist
+        cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='persisted_user_data'")
+        if not cursor.fetchone():
+            # Small per-user state (user_data, conversation states) kept across restarts
+            cursor.execute('''
+            CREATE TABLE persisted_user_data (
+                user_id INTEGER PRIMARY KEY,
+                data TEXT NOT NULL,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+            ''')
+            cursor.execute('''
+            CREATE TABLE persisted_conversations (
+                name TEXT NOT NULL,
+                conversation_key TEXT NOT NULL,
+                state TEXT NOT NULL,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (name, conversation_key)
+            )
+            ''')
+            self.conn.commit()
+            logger.info("Created persisted_user_data and persisted_conversations tables")
+        
         # Initialize tutorials with default content
         self.initialize_tutorials()
     
@@ -209,21 +486,35 @@ class Database:
             )
         ''')
         
+        # Index used by the admin order listings (ORDER BY / filter on created_at)
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_orders_created_at ON orders (created_at)')
+        
+        # Index used by order status lookups by panel order ID
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_orders_order_id ON orders (order_id)')
+        
         self.conn.commit()
     
     def get_user(self, user_id):
-        cursor = self.conn.cursor()
-        cursor.execute('SELECT * FROM users WHERE user_id = ?', (user_id,))
-        user = cursor.fetchone()
-        
-        if not user:
-            # Create new user if doesn't exist
-            cursor.execute(
-                'INSERT INTO users (user_id, balance, last_activity, currency_preference, language, referred_by) VALUES (?, 0.0, ?, ?, ?, NULL)',
-                (user_id, datetime.now(), 'USD', 'en')
-            )
-            self.conn.commit()
-            return self.get_user(user_id)
+        with self.write_lock:
+            cursor = self.conn.cursor()
+            cursor.execute('SELECT * FROM users WHERE user_id = ?', (user_id,))
+            user = cursor.fetchone()
+            
+            if not user:
+                # Create new user if doesn't exist
+                now = utc_now()
+                today = now.strftime('%Y-%m-%d')
+                cursor.execute(
+                    'INSERT OR IGNORE INTO users (user_id, balance, last_activity, last_active_day, currency_preference, language, referred_by) VALUES (?, 0.0, ?, ?, ?, ?, NULL)',
+                    (user_id, now, today, 'USD', 'en')
+                )
+                
+                # Update dashboard stats in the same transaction
+                if cursor.rowcount:
+                    self._increment_counter(cursor, 'total_users')
+                    self._increment_daily_stats(cursor, today, new_users=1, active_users=1, last_active_users=1)
+                self.conn.commit()
+                return self.get_user(user_id)
         
         return {
             'user_id': user[0],
@@ -238,18 +529,72 @@ class Database:
             'referred_by': user[9] if len(user) > 9 else None
         }
     
+    def find_user(self, user_id):
+        """Get a user by ID without creating it (read-only, returns None if missing)"""
+        with self.write_lock:
+            cursor = self.conn.cursor()
+            cursor.execute(
+                'SELECT user_id, username, first_name, last_name, balance, last_activity, created_at FROM users WHERE user_id = ?',
+                (user_id,)
+            )
+            row = cursor.fetchone()
+            if not row:
+                return None
+            
+            return {
+                'user_id': row[0],
+                'username': row[1],
+                'first_name': row[2],
+                'last_name': row[3],
+                'balance': row[4],
+                'last_activity': row[5],
+                'created_at': row[6]
+            }
+    
     def update_user_activity(self, user_id):
-        """Update user's last activity timestamp and ensure user exists in database"""
+        """Record that a user is active today and ensure user exists in database
+        
+        Only the first call of a day for a user writes, so last_activity is the
+        user's first activity on their last active day. Later calls return after
+        a check of the in-memory set of users already recorded today.
+        """
+        # Days are UTC like the rest of the rollups
+        now = utc_now()
+        today = now.strftime('%Y-%m-%d')
+        if self._active_day == today and user_id in self._active_today:
+            return
+        
         # First, make sure the user exists
         self.get_user(user_id)
         
-        # Then update the activity timestamp
         cursor = self.conn.cursor()
-        cursor.execute(
-            'UPDATE users SET last_activity = ? WHERE user_id = ?',
-            (datetime.now(), user_id)
-        )
-        self.conn.commit()
+        with self.write_lock:
+            try:
+                cursor.execute('BEGIN IMMEDIATE TRANSACTION')
+                cursor.execute('SELECT last_active_day FROM users WHERE user_id = ?', (user_id,))
+                row = cursor.fetchone()
+                previous_day = row[0] if row else None
+                
+                # Only the update that moves last_active_day to today counts the user
+                cursor.execute(
+                    'UPDATE users SET last_activity = ?, last_active_day = ? WHERE user_id = ? AND last_active_day IS NOT ?',
+                    (now, today, user_id, today)
+                )
+                if cursor.rowcount == 1:
+                    # First activity of the day, move the user to today's rollup row
+                    if previous_day:
+                        self._increment_daily_stats(cursor, previous_day, last_active_users=-1)
+                    self._increment_daily_stats(cursor, today, active_users=1, last_active_users=1)
+                self.conn.commit()
+            except Exception as e:
+                logger.error(f"Error updating user activity: {e}")
+                self.conn.rollback()
+                return
+            
+            if self._active_day != today:
+                self._active_day = today
+                self._active_today = set()
+            self._active_today.add(user_id)
     
     def get_balance(self, user_id):
         """Get user's balance"""
@@ -273,527 +618,1425 @@ class Database:
     
     def set_currency_preference(self, user_id, currency):
         """Set user's currency preference"""
-        cursor = self.conn.cursor()
-        cursor.execute(
-            'UPDATE users SET currency_preference = ? WHERE user_id = ?',
-            (currency, user_id)
-        )
-        self.conn.commit()
-        return True
-    
-    def add_balance(self, user_id, amount, description="Admin balance addition"):
-        cursor = self.conn.cursor()
-        try:
-            # Start transaction
-            cursor.execute('BEGIN TRANSACTION')
-            
-            # Update user balance
-            cursor.execute(
-                'UPDATE users SET balance = balance + ? WHERE user_id = ?',
-                (amount, user_id)
-            )
-            
-            # Record transaction
+        with self.write_lock:
+            cursor = self.conn.cursor()
             cursor.execute(
-                'INSERT INTO balance_transactions (user_id, amount, type, description) VALUES (?, ?, ?, ?)',
-                (user_id, amount, 'credit', description)
+                'UPDATE users SET currency_preference = ? WHERE user_id = ?',
+                (currency, user_id)
             )
-            
-            # Commit transaction
             self.conn.commit()
             return True
-        except Exception as e:
-            logger.error(f"Error adding balance: {e}")
-            cursor.execute('ROLLBACK')
-            return False
     
+    def add_balance(self, user_id, amount, description="Admin balance addition"):
+        with self.write_lock:
+            cursor = self.conn.cursor()
+            try:
+                # Start transaction
+                cursor.execute('BEGIN TRANSACTION')
+                
+                # Update user balance
+                cursor.execute(
+                    'UPDATE users SET balance = balance + ? WHERE user_id = ?',
+                    (amount, user_id)
+                )
+                
+                # Record transaction
+                cursor.execute(
+                    'INSERT INTO balance_transactions (user_id, amount, type, description) VALUES (?, ?, ?, ?)',
+                    (user_id, amount, 'credit', description)
+                )
+                self._add_user_totals(cursor, user_id, total_credited=amount)
+                
+                # Commit transaction
+                self.conn.commit()
+                return True
+            except Exception as e:
+                logger.error(f"Error adding balance: {e}")
+                cursor.execute('ROLLBACK')
+                return False
+        
     def deduct_balance(self, user_id, amount, description="Order payment"):
-        cursor = self.conn.cursor()
-        try:
-            # Start transaction
-            cursor.execute('BEGIN TRANSACTION')
-            
-            # Check if user has sufficient balance
-            current_balance = self.get_balance(user_id)
-            if current_balance < amount:
+        with self.write_lock:
+            cursor = self.conn.cursor()
+            try:
+                # Start transaction
+                cursor.execute('BEGIN IMMEDIATE TRANSACTION')
+                
+                # Deduct only if the user has sufficient balance (single conditional statement)
+                cursor.execute(
+                    'UPDATE users SET balance = balance - ? WHERE user_id = ? AND balance >= ?',
+                    (amount, user_id, amount)
+                )
+                if cursor.rowcount == 0:
+                    cursor.execute('ROLLBACK')
+                    return False
+                
+                # Record transaction
+                cursor.execute(
+                    'INSERT INTO balance_transactions (user_id, amount, type, description) VALUES (?, ?, ?, ?)',
+                    (user_id, amount, 'debit', description)
+                )
+                self._add_user_totals(cursor, user_id, total_debited=amount)
+                
+                # Commit transaction
+                self.conn.commit()
+                return True
+            except Exception as e:
+                logger.error(f"Error deducting balance: {e}")
                 cursor.execute('ROLLBACK')
                 return False
-            
-            # Update user balance
-            cursor.execute(
-                'UPDATE users SET balance = balance - ? WHERE user_id = ?',
-                (amount, user_id)
-            )
-            
-            # Record transaction
+        
+    def get_transactions(self, user_id, limit=10):
+        with self.write_lock:
+            cursor = self.conn.cursor()
             cursor.execute(
-                'INSERT INTO balance_transactions (user_id, amount, type, description) VALUES (?, ?, ?, ?)',
-                (user_id, amount, 'debit', description)
+                'SELECT * FROM balance_transactions WHERE user_id = ? ORDER BY created_at DESC LIMIT ?',
+                (user_id, limit)
             )
-            
-            # Commit transaction
-            self.conn.commit()
-            return True
-        except Exception as e:
-            logger.error(f"Error deducting balance: {e}")
-            cursor.execute('ROLLBACK')
-            return False
-    
-    def get_transactions(self, user_id, limit=10):
-        cursor = self.conn.cursor()
-        cursor.execute(
-            'SELECT * FROM balance_transactions WHERE user_id = ? ORDER BY created_at DESC LIMIT ?',
-            (user_id, limit)
-        )
-        transactions = cursor.fetchall()
-        return [{
-            'id': t[0],
-            'user_id': t[1],
-            'amount': t[2],
-            'type': t[3],
-            'description': t[4],
-            'created_at': t[5]
-        } for t in transactions]
+            transactions = cursor.fetchall()
+            return [{
+                'id': t[0],
+                'user_id': t[1],
+                'amount': t[2],
+                'type': t[3],
+                'description': t[4],
+                'created_at': t[5]
+            } for t in transactions]
     
     def add_order(self, user_id, order_id, service_id, service_name, quantity, link, price):
-        cursor = self.conn.cursor()
-        try:
+        with self.write_lock:
+            cursor = self.conn.cursor()
+            try:
+                cursor.execute(
+                    '''INSERT INTO orders 
+                       (user_id, order_id, service_id, service_name, quantity, link, price)
+                       VALUES (?, ?, ?, ?, ?, ?, ?)''',
+                    (user_id, order_id, service_id, service_name, quantity, link, price)
+                )
+                order_row_id = cursor.lastrowid
+                
+                # Update per-user totals and dashboard stats in the same transaction
+                self._add_user_totals(cursor, user_id, order_count=1, total_spent=price or 0.0)
+                self._increment_counter(cursor, 'total_orders')
+                self._increment_daily_stats(cursor, utc_now().strftime('%Y-%m-%d'), orders=1)
+                self.conn.commit()
+                return order_row_id
+            except Exception as e:
+                logger.error(f"Error adding order: {e}")
+                self.conn.rollback()
+                return None
+    
+    def get_order_by_idempotency_key(self, idempotency_key, dedup_window=600):
+        """Get the live order submitted with a dedup key in the last dedup_window seconds
+        
+        Returns:
+            dict: 'id', 'status', 'order_id', 'service_name', 'quantity' and 'price', or None
+        """
+        with self.write_lock:
+            cursor = self.conn.cursor()
             cursor.execute(
-                '''INSERT INTO orders 
-                   (user_id, order_id, service_id, service_name, quantity, link, price)
-                   VALUES (?, ?, ?, ?, ?, ?, ?)''',
-                (user_id, order_id, service_id, service_name, quantity, link, price)
+                '''SELECT id, status, order_id, service_name, quantity, price FROM orders
+                   WHERE idempotency_key = ? AND status != 'released'
+                   AND created_at >= datetime('now', ?)''',
+                (idempotency_key, f'-{dedup_window} seconds')
             )
-            self.conn.commit()
-            return cursor.lastrowid
-        except Exception as e:
-            logger.error(f"Error adding order: {e}")
-            return None
-    
-    def get_user_orders(self, user_id, limit=5):
-        cursor = self.conn.cursor()
-        cursor.execute(
-            'SELECT * FROM orders WHERE user_id = ? ORDER BY created_at DESC LIMIT ?',
-            (user_id, limit)
-        )
-        orders = cursor.fetchall()
-        return [{
-            'id': o[2],  # order_id from the API
-            'user_id': o[1],
-            'service_id': o[3],
-            'service_name': o[4],
-            'quantity': o[5],
-            'link': o[6],
-            'price': o[7],
-            'status': o[8],
-            'created_at': o[9]
-        } for o in orders] if orders else []
+            row = cursor.fetchone()
+            if not row:
+                return None
+            return {
+                'id': row[0],
+                'status': row[1],
+                'order_id': row[2],
+                'service_name': row[3],
+                'quantity': row[4],
+                'price': row[5]
+            }
     
-    def get_user_total_spending(self, user_id):
-        """Get the total amount a user has spent on orders and other transactions"""
-        cursor = self.conn.cursor()
+    def reserve_order(self, user_id, service_id, service_name, quantity, link, price, charge=True,
+                      idempotency_key=None, dedup_window=600, enqueue=None):
+        """Reserve the balance for an order before it is sent to the panel
         
-        # First get total from orders
-        cursor.execute(
-            'SELECT SUM(price) FROM orders WHERE user_id = ?',
-            (user_id,)
-        )
-        result = cursor.fetchone()
-        orders_total = result[0] if result and result[0] is not None else 0.0
+        Debits the user with a single conditional UPDATE and inserts the order
+        row in 'reserved' state, all in one writer transaction.
         
-        # Then get total from balance_transactions with debit type (spending)
-        cursor.execute(
-            'SELECT SUM(amount) FROM balance_transactions WHERE user_id = ? AND type = "debit"',
-            (user_id,)
-        )
-        result = cursor.fetchone()
-        transactions_total = result[0] if result and result[0] is not None else 0.0
+        Args:
+            charge (bool): Whether to debit the balance (False for admin orders)
+            idempotency_key (str, optional): Dedup key for this submission
+            dedup_window (int): Seconds during which a repeated key returns the original order
+            enqueue (dict, optional): chat_id, message_id, language and comments for
+                a job in order_queue, created in the same transaction
         
-        # Combine both totals
-        total_spending = orders_total + transactions_total
+        Returns:
+            dict: The reservation ('id', 'status', 'order_id', 'duplicate'),
+            {'error': ...} if the transaction failed, or None if the balance
+            is insufficient
+        """
+        with self.write_lock:
+            cursor = self.conn.cursor()
+            try:
+                cursor.execute('BEGIN IMMEDIATE TRANSACTION')
+                
+                if idempotency_key:
+                    # Short-circuit to the original order if this key was already submitted
+                    cursor.execute(
+                        '''SELECT id, status, order_id FROM orders
+                           WHERE idempotency_key = ? AND status != 'released'
+                           AND created_at >= datetime('now', ?)''',
+                        (idempotency_key, f'-{dedup_window} seconds')
+                    )
+                    existing = cursor.fetchone()
+                    if existing:
+                        cursor.execute('ROLLBACK')
+                        return {'id': existing[0], 'status': existing[1], 'order_id': existing[2], 'duplicate': True}
+                    
+                    # Free the key if it belongs to an expired or released submission
+                    cursor.execute(
+                        'UPDATE orders SET idempotency_key = NULL WHERE idempotency_key = ?',
+                        (idempotency_key,)
+                    )
+                
+                if charge:
+                    cursor.execute(
+                        'UPDATE users SET balance = balance - ? WHERE user_id = ? AND balance >= ?',
+                        (price, user_id, price)
+                    )
+                    if cursor.rowcount == 0:
+                        cursor.execute('ROLLBACK')
+                        return None
+                
+                cursor.execute(
+                    '''INSERT INTO orders 
+                       (user_id, order_id, service_id, service_name, quantity, link, price, status, paid_amount, idempotency_key)
+                       VALUES (?, NULL, ?, ?, ?, ?, ?, 'reserved', ?, ?)''',
+                    (user_id, service_id, service_name, quantity, link, price, price if charge else 0.0, idempotency_key)
+                )
+                reservation_id = cursor.lastrowid
+                
+                if charge:
+                    cursor.execute(
+                        'INSERT INTO balance_transactions (user_id, amount, type, description) VALUES (?, ?, ?, ?)',
+                        (user_id, price, 'debit', f"Payment for order reservation #{reservation_id}")
+                    )
+                    self._add_user_totals(cursor, user_id, total_debited=price)
+                
+                if enqueue is not None:
+                    cursor.execute(
+                        '''INSERT INTO order_queue (reservation_id, chat_id, message_id, language, comments)
+                           VALUES (?, ?, ?, ?, ?)''',
+                        (reservation_id, enqueue.get('chat_id'), enqueue.get('message_id'),
+                         enqueue.get('language'), enqueue.get('comments'))
+                    )
+                
+                self.conn.commit()
+                return {'id': reservation_id, 'status': 'reserved', 'order_id': None, 'duplicate': False}
+            except Exception as e:
+                logger.error(f"Error reserving order: {e}")
+                self.conn.rollback()
+                return {'error': str(e)}
         
-        return total_spending
-    
-    def get_order_by_id(self, order_id):
-        """Get order details by order_id"""
-        cursor = self.conn.cursor()
-        cursor.execute(
-            'SELECT * FROM orders WHERE order_id = ? LIMIT 1',
-            (order_id,)
-        )
-        order = cursor.fetchone()
-        if order:
-            return {
-                'id': order[2],  # order_id from the API
-                'user_id': order[1],
-                'service_id': order[3],
-                'service_name': order[4],
-                'quantity': order[5],
-                'link': order[6],
-                'price': order[7],
-                'status': order[8],
-                'created_at': order[9]
-            }
-        return None
+    def reserve_order_batch(self, user_id, batch_id, items, charge=True, enqueue=None):
+        """Reserve the balance for a mass order and queue every line
+        
+        The whole batch is debited with one conditional UPDATE and one ledger
+        entry, and each line gets its own reserved order row and queue job.
+        
+        Args:
+            batch_id (str): Dedup key of the batch
+            items (list): dicts with line, service_id, service_name, quantity, link and price
+            charge (bool): Whether to debit the balance (False for admin orders)
+            enqueue (dict, optional): chat_id, message_id and language used for the report
+        
+        Returns:
+            dict: 'reservation_ids', 'total' and 'duplicate', {'error': ...} if
+            the transaction failed, or None if the balance is insufficient
+        """
+        total = sum(item['price'] for item in items)
+        enqueue = enqueue or {}
+        with self.write_lock:
+            cursor = self.conn.cursor()
+            try:
+                cursor.execute('BEGIN IMMEDIATE TRANSACTION')
+                
+                # A batch is only ever queued once
+                cursor.execute('SELECT 1 FROM order_queue WHERE batch_id = ? LIMIT 1', (batch_id,))
+                if cursor.fetchone():
+                    cursor.execute('ROLLBACK')
+                    return {'reservation_ids': [], 'total': total, 'duplicate': True}
+                
+                if charge:
+                    cursor.execute(
+                        'UPDATE users SET balance = balance - ? WHERE user_id = ? AND balance >= ?',
+                        (total, user_id, total)
+                    )
+                    if cursor.rowcount == 0:
+                        cursor.execute('ROLLBACK')
+                        return None
+                
+                reservation_ids = []
+                for item in items:
+                    cursor.execute(
+                        '''INSERT INTO orders 
+                           (user_id, order_id, service_id, service_name, quantity, link, price, status, paid_amount)
+                           VALUES (?, NULL, ?, ?, ?, ?, ?, 'reserved', ?)''',
+                        (user_id, item['service_id'], item['service_name'], item['quantity'], item['link'],
+                         item['price'], item['price'] if charge else 0.0)
+                    )
+                    reservation_id = cursor.lastrowid
+                    reservation_ids.append(reservation_id)
+                    cursor.execute(
+                        '''INSERT INTO order_queue (reservation_id, chat_id, message_id, language, batch_id, batch_line)
+                           VALUES (?, ?, ?, ?, ?, ?)''',
+                        (reservation_id, enqueue.get('chat_id'), enqueue.get('message_id'),
+                         enqueue.get('language'), batch_id, item['line'])
+                    )
+                
+                if charge:
+                    cursor.execute(
+                        'INSERT INTO balance_transactions (user_id, amount, type, description) VALUES (?, ?, ?, ?)',
+                        (user_id, total, 'debit', f"Payment for mass order {batch_id[:8]} ({len(items)} orders)")
+                    )
+                    self._add_user_totals(cursor, user_id, total_debited=total)
+                
+                self.conn.commit()
+                return {'reservation_ids': reservation_ids, 'total': total, 'duplicate': False}
+            except Exception as e:
+                logger.error(f"Error reserving mass order {batch_id}: {e}")
+                self.conn.rollback()
+                return {'error': str(e)}
     
-    def is_admin(self, user_id):
-        """Check if a user is an admin"""
-        admin_ids_str = os.getenv("ADMIN_USER_ID", "")
-        admin_ids = [id.strip() for id in admin_ids_str.split(",")]
-        return str(user_id) in admin_ids
+    def create_drip_feed(self, user_id, service_id, service_name, link, slices, interval_seconds,
+                         charge=True, chat_id=None, language=None):
+        """Reserve the balance for a drip-feed plan and schedule its slices
+        
+        Every slice gets a reserved order row up front, so the plan is paid
+        for once and failed or cancelled slices are refunded individually.
+        
+        Args:
+            slices (list): (quantity, price) of every run, in order
+            interval_seconds (int): Time between two runs; the first run is due now
+            charge (bool): Whether to debit the balance (False for admin orders)
+        
+        Returns:
+            dict: 'id' and 'total' of the plan, {'error': ...} if the transaction
+            failed, or None if the balance is insufficient
+        """
+        total = sum(price for _, price in slices)
+        with self.write_lock:
+            cursor = self.conn.cursor()
+            try:
+                cursor.execute('BEGIN IMMEDIATE TRANSACTION')
+                
+                if charge:
+                    cursor.execute(
+                        'UPDATE users SET balance = balance - ? WHERE user_id = ? AND balance >= ?',
+                        (total, user_id, total)
+                    )
+                    if cursor.rowcount == 0:
+                        cursor.execute('ROLLBACK')
+                        return None
+                
+                cursor.execute(
+                    '''INSERT INTO drip_feeds 
+                       (user_id, service_id, service_name, link, total_quantity, slice_quantity,
+                        interval_seconds, price, chat_id, language)
+                       VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''',
+                    (user_id, service_id, service_name, link, sum(quantity for quantity, _ in slices),
+                     slices[0][0], interval_seconds, total, chat_id, language)
+                )
+                drip_feed_id = cursor.lastrowid
+                
+                for slice_no, (quantity, price) in enumerate(slices):
+                    cursor.execute(
+                        '''INSERT INTO orders 
+                           (user_id, order_id, service_id, service_name, quantity, link, price, status, paid_amount)
+                           VALUES (?, NULL, ?, ?, ?, ?, ?, 'reserved', ?)''',
+                        (user_id, service_id, service_name, quantity, link, price, price if charge else 0.0)
+                    )
+                    cursor.execute(
+                        '''INSERT INTO drip_feed_slices (drip_feed_id, reservation_id, slice_no, due_at)
+                           VALUES (?, ?, ?, datetime('now', ?))''',
+                        (drip_feed_id, cursor.lastrowid, slice_no + 1, f'+{slice_no * interval_seconds} seconds')
+                    )
+                
+                if charge:
+                    cursor.execute(
+                        'INSERT INTO balance_transactions (user_id, amount, type, description) VALUES (?, ?, ?, ?)',
+                        (user_id, total, 'debit', f"Payment for drip-feed #{drip_feed_id} ({len(slices)} runs)")
+                    )
+                    self._add_user_totals(cursor, user_id, total_debited=total)
+                
+                self.conn.commit()
+                return {'id': drip_feed_id, 'total': total}
+            except Exception as e:
+                logger.error(f"Error creating drip-feed for user {user_id}: {e}")
+                self.conn.rollback()
+                return {'error': str(e)}
     
-    def get_language(self, user_id):
-        """Get user's language preference"""
-        try:
-            conn = sqlite3.connect(os.getenv('DB_FILE', 'data/smm_bot.db'), check_same_thread=False)
-            cursor = conn.cursor()
-            cursor.execute("SELECT language FROM users WHERE user_id = ?", (user_id,))
-            result = cursor.fetchone()
-            conn.close()
-            
-            if result and result[0]:
-                return result[0]
-            return 'en'  # Default to English
-        except Exception as e:
-            logger.error(f"Error getting language: {e}")
-            return 'en'  # Default to English if there's an error
+    def enqueue_due_drip_slices(self, limit=200):
+        """Move due drip-feed slices into order_queue
+        
+        At most one slice per plan is queued per call. When a plan is behind
+        (e.g. after downtime), its later slices are pushed back so they keep
+        the plan's interval from now instead of all being placed at once.
+        
+        Returns:
+            int: Number of slices queued
+        """
+        with self.write_lock:
+            cursor = self.conn.cursor()
+            try:
+                cursor.execute('BEGIN IMMEDIATE TRANSACTION')
+                cursor.execute(
+                    '''SELECT s.id, s.reservation_id, d.language, s.drip_feed_id, s.slice_no, d.interval_seconds
+                       FROM drip_feed_slices s JOIN drip_feeds d ON d.id = s.drip_feed_id
+                       WHERE s.status = 'scheduled' AND s.due_at <= datetime('now')
+                       AND s.slice_no = (SELECT MIN(slice_no) FROM drip_feed_slices
+                                         WHERE drip_feed_id = s.drip_feed_id AND status = 'scheduled')
+                       ORDER BY s.due_at LIMIT ?''',
+                    (limit,)
+                )
+                due = cursor.fetchall()
+                if not due:
+                    cursor.execute('ROLLBACK')
+                    return 0
+                
+                # Slices have no message of their own; the plan reports once it is complete
+                cursor.executemany(
+                    'INSERT OR IGNORE INTO order_queue (reservation_id, language) VALUES (?, ?)',
+                    [(row[1], row[2]) for row in due]
+                )
+                cursor.executemany(
+                    "UPDATE drip_feed_slices SET status = 'queued' WHERE id = ?",
+                    [(row[0],) for row in due]
+                )
+                # The n-th remaining slice of a plan is due no earlier than n intervals from now
+                cursor.executemany(
+                    '''UPDATE drip_feed_slices
+                       SET due_at = MAX(due_at, datetime('now', '+' || ((slice_no - ?) * ?) || ' seconds'))
+                       WHERE status = 'scheduled' AND drip_feed_id = ?''',
+                    [(slice_no, interval_seconds, drip_feed_id) for _, _, _, drip_feed_id, slice_no, interval_seconds in due]
+                )
+                self.conn.commit()
+                return len(due)
+            except Exception as e:
+                logger.error(f"Error queueing drip-feed slices: {e}")
+                cursor.execute('ROLLBACK')
+                return 0
     
-    def set_language(self, user_id, language):
-        """Set user's language preference"""
-        cursor = self.conn.cursor()
-        cursor.execute(
-            'UPDATE users SET language = ? WHERE user_id = ?',
-            (language, user_id)
-        )
-        self.conn.commit()
-        return True
-
-    def update_user_data(self, user_id, data_dict):
-        """Update user data with key-value pairs from data_dict"""
-        if not data_dict:
-            return False
-            
-        cursor = self.conn.cursor()
-        try:
-            # Get column names from users table
-            cursor.execute('PRAGMA table_info(users)')
-            valid_columns = [column[1] for column in cursor.fetchall()]
-            
-            # Filter out invalid keys
-            valid_data = {k: v for k, v in data_dict.items() if k in valid_columns}
-            
-            if not valid_data:
-                logger.warning(f"No valid columns to update for user {user_id}")
-                return False
+    def complete_drip_feeds(self):
+        """Mark active drip-feeds whose slices have all been placed or refunded as completed
+        
+        Returns:
+            list: The completed plans with the number of placed runs
+        """
+        with self.write_lock:
+            cursor = self.conn.cursor()
+            cursor.execute(
+                '''SELECT d.id, d.user_id, d.chat_id, d.language, d.service_name,
+                          SUM(CASE WHEN o.status NOT IN ('reserved', 'released') THEN 1 ELSE 0 END), COUNT(*)
+                   FROM drip_feeds d
+                   JOIN drip_feed_slices s ON s.drip_feed_id = d.id
+                   JOIN orders o ON o.id = s.reservation_id
+                   WHERE d.status = 'active'
+                   GROUP BY d.id
+                   HAVING SUM(CASE WHEN o.status = 'reserved' THEN 1 ELSE 0 END) = 0'''
+            )
+            completed = [
+                {
+                    'id': row[0],
+                    'user_id': row[1],
+                    'chat_id': row[2],
+                    'language': row[3],
+                    'service_name': row[4],
+                    'placed': row[5],
+                    'runs': row[6]
+                }
+                for row in cursor.fetchall()
+            ]
+            if completed:
+                cursor.executemany(
+                    "UPDATE drip_feeds SET status = 'completed' WHERE id = ?",
+                    [(plan['id'],) for plan in completed]
+                )
+                self.conn.commit()
+            return completed
+    
+    def cancel_drip_feed(self, drip_feed_id, user_id):
+        """Cancel a drip-feed and refund its slices that have not been queued yet
+        
+        Returns:
+            float: The refunded amount, or None if the plan is not active
+        """
+        with self.write_lock:
+            cursor = self.conn.cursor()
+            try:
+                cursor.execute('BEGIN IMMEDIATE TRANSACTION')
+                cursor.execute(
+                    "UPDATE drip_feeds SET status = 'cancelled' WHERE id = ? AND user_id = ? AND status = 'active'",
+                    (drip_feed_id, user_id)
+                )
+                if cursor.rowcount == 0:
+                    cursor.execute('ROLLBACK')
+                    return None
                 
-            # Build the SQL query
-            set_clause = ', '.join([f"{key} = ?" for key in valid_data.keys()])
-            values = list(valid_data.values())
-            values.append(user_id)
-            
-            # Execute the update
+                cursor.execute(
+                    """SELECT s.reservation_id, o.paid_amount
+                       FROM drip_feed_slices s JOIN orders o ON o.id = s.reservation_id
+                       WHERE s.drip_feed_id = ? AND s.status = 'scheduled' AND o.status = 'reserved'""",
+                    (drip_feed_id,)
+                )
+                pending = cursor.fetchall()
+                refund = sum(amount or 0.0 for _, amount in pending)
+                
+                cursor.execute(
+                    "UPDATE drip_feed_slices SET status = 'cancelled' WHERE drip_feed_id = ? AND status = 'scheduled'",
+                    (drip_feed_id,)
+                )
+                cursor.executemany(
+                    "UPDATE orders SET status = 'released' WHERE id = ? AND status = 'reserved'",
+                    [(reservation_id,) for reservation_id, _ in pending]
+                )
+                
+                if refund:
+                    cursor.execute(
+                        'UPDATE users SET balance = balance + ? WHERE user_id = ?',
+                        (refund, user_id)
+                    )
+                    cursor.execute(
+                        'INSERT INTO balance_transactions (user_id, amount, type, description) VALUES (?, ?, ?, ?)',
+                        (user_id, refund, 'credit', f"Refund for cancelled drip-feed #{drip_feed_id} ({len(pending)} runs)")
+                    )
+                    self._add_user_totals(cursor, user_id, total_credited=refund)
+                
+                self.conn.commit()
+                return refund
+            except Exception as e:
+                logger.error(f"Error cancelling drip-feed {drip_feed_id}: {e}")
+                cursor.execute('ROLLBACK')
+                return None
+    
+    def get_drip_feeds(self, user_id, status='active'):
+        """Get a user's drip-feeds with the number of runs already sent to the panel"""
+        with self.write_lock:
+            cursor = self.conn.cursor()
             cursor.execute(
-                f'UPDATE users SET {set_clause} WHERE user_id = ?',
-                values
+                '''SELECT d.id, d.service_id, d.service_name, d.link, d.total_quantity, d.slice_quantity,
+                          d.interval_seconds, d.price, d.status, d.created_at,
+                          SUM(CASE WHEN s.status != 'scheduled' THEN 1 ELSE 0 END), COUNT(s.id)
+                   FROM drip_feeds d LEFT JOIN drip_feed_slices s ON s.drip_feed_id = d.id
+                   WHERE d.user_id = ? AND d.status = ?
+                   GROUP BY d.id
+                   ORDER BY d.created_at DESC''',
+                (user_id, status)
             )
-            self.conn.commit()
-            logger.info(f"Updated user data for user {user_id}: {valid_data}")
-            return True
-        except Exception as e:
-            logger.error(f"Error updating user data: {e}")
-            return False
-
-    # Add referral methods
-    def add_referral(self, referrer_id, referred_id):
-        """Record a new referral"""
-        cursor = self.conn.cursor()
-        transaction_active = False
-        try:
-            # Check if the referred user already has a referrer
-            user = self.get_user(referred_id)
-            if user.get('referred_by'):
-                logger.info(f"User {referred_id} already has a referrer: {user.get('referred_by')}")
+            return [
+                {
+                    'id': row[0],
+                    'service_id': row[1],
+                    'service_name': row[2],
+                    'link': row[3],
+                    'total_quantity': row[4],
+                    'slice_quantity': row[5],
+                    'interval_seconds': row[6],
+                    'price': row[7],
+                    'status': row[8],
+                    'created_at': row[9],
+                    'runs_started': row[10],
+                    'runs': row[11]
+                }
+                for row in cursor.fetchall()
+            ]
+    
+    def capture_order(self, reservation_id, order_id):
+        """Attach the panel order ID to a reserved order and count it as placed"""
+        with self.write_lock:
+            cursor = self.conn.cursor()
+            try:
+                cursor.execute('BEGIN IMMEDIATE TRANSACTION')
+                cursor.execute(
+                    "UPDATE orders SET order_id = ?, status = 'pending' WHERE id = ? AND status = 'reserved'",
+                    (str(order_id), reservation_id)
+                )
+                if cursor.rowcount == 0:
+                    cursor.execute('ROLLBACK')
+                    return False
+                
+                cursor.execute('SELECT user_id, price FROM orders WHERE id = ?', (reservation_id,))
+                user_id, price = cursor.fetchone()
+                self._add_user_totals(cursor, user_id, order_count=1, total_spent=price or 0.0)
+                self._increment_counter(cursor, 'total_orders')
+                self._increment_daily_stats(cursor, utc_now().strftime('%Y-%m-%d'), orders=1)
+                
+                self.conn.commit()
+                return True
+            except Exception as e:
+                logger.error(f"Error capturing order {reservation_id}: {e}")
+                cursor.execute('ROLLBACK')
+                return False
+        
+    def release_order(self, reservation_id, reason="Order failed"):
+        """Release a reserved order and refund any reserved balance"""
+        with self.write_lock:
+            cursor = self.conn.cursor()
+            try:
+                cursor.execute('BEGIN IMMEDIATE TRANSACTION')
+                cursor.execute(
+                    "UPDATE orders SET status = 'released' WHERE id = ? AND status = 'reserved'",
+                    (reservation_id,)
+                )
+                if cursor.rowcount == 0:
+                    cursor.execute('ROLLBACK')
+                    return False
+                
+                # Refund only if the reservation was charged
+                cursor.execute('SELECT user_id, paid_amount FROM orders WHERE id = ?', (reservation_id,))
+                user_id, amount = cursor.fetchone()
+                if amount:
+                    cursor.execute(
+                        'UPDATE users SET balance = balance + ? WHERE user_id = ?',
+                        (amount, user_id)
+                    )
+                    cursor.execute(
+                        'INSERT INTO balance_transactions (user_id, amount, type, description) VALUES (?, ?, ?, ?)',
+                        (user_id, amount, 'credit', f"Refund for order reservation #{reservation_id}: {reason}")
+                    )
+                    self._add_user_totals(cursor, user_id, total_credited=amount)
+                
+                self.conn.commit()
+                return True
+            except Exception as e:
+                logger.error(f"Error releasing order {reservation_id}: {e}")
+                cursor.execute('ROLLBACK')
                 return False
+        
+    def claim_order_job(self):
+        """Claim the next due job from order_queue for a worker
+        
+        Returns:
+            dict: The job joined with its reserved order, or None if nothing is due
+        """
+        with self.write_lock:
+            cursor = self.conn.cursor()
+            try:
+                cursor.execute('BEGIN IMMEDIATE TRANSACTION')
+                cursor.execute(
+                    '''SELECT id FROM order_queue
+                       WHERE status = 'queued' AND next_attempt_at <= datetime('now')
+                       ORDER BY next_attempt_at, id LIMIT 1'''
+                )
+                row = cursor.fetchone()
+                if not row:
+                    cursor.execute('ROLLBACK')
+                    return None
                 
-            # Start transaction
-            cursor.execute('BEGIN TRANSACTION')
-            transaction_active = True
+                cursor.execute(
+                    '''UPDATE order_queue SET status = 'processing', attempts = attempts + 1,
+                       updated_at = CURRENT_TIMESTAMP WHERE id = ?''',
+                    (row[0],)
+                )
+                cursor.execute(
+                    '''SELECT q.id, q.reservation_id, q.chat_id, q.message_id, q.language, q.comments, q.attempts,
+                              o.user_id, o.service_id, o.service_name, o.quantity, o.link, o.price, o.status, o.order_id,
+                              q.batch_id, q.batch_line
+                       FROM order_queue q JOIN orders o ON o.id = q.reservation_id
+                       WHERE q.id = ?''',
+                    (row[0],)
+                )
+                job = cursor.fetchone()
+                self.conn.commit()
+                
+                if not job:
+                    return None
+                return {
+                    'id': job[0],
+                    'reservation_id': job[1],
+                    'chat_id': job[2],
+                    'message_id': job[3],
+                    'language': job[4],
+                    'comments': job[5],
+                    'attempts': job[6],
+                    'user_id': job[7],
+                    'service_id': job[8],
+                    'service_name': job[9],
+                    'quantity': job[10],
+                    'link': job[11],
+                    'price': job[12],
+                    'order_status': job[13],
+                    'order_id': job[14],
+                    'batch_id': job[15],
+                    'batch_line': job[16]
+                }
+            except Exception as e:
+                logger.error(f"Error claiming order job: {e}")
+                cursor.execute('ROLLBACK')
+                return None
+    
+    def retry_order_job(self, job_id, error, delay):
+        """Put a job back in the queue to be retried after delay seconds"""
+        with self.write_lock:
+            cursor = self.conn.cursor()
+            cursor.execute(
+                '''UPDATE order_queue SET status = 'queued', last_error = ?,
+                   next_attempt_at = datetime('now', ?), updated_at = CURRENT_TIMESTAMP
+                   WHERE id = ?''',
+                (error, f'+{int(delay)} seconds', job_id)
+            )
+            self.conn.commit()
+    
+    def finish_order_job(self, job_id, status, error=None):
+        """Mark a job as 'done', 'failed' or 'needs_reconciliation'
+        
+        Returns:
+            int: Unfinished jobs left in the job's batch, or None for single orders
+        """
+        with self.write_lock:
+            cursor = self.conn.cursor()
+            cursor.execute(
+                'UPDATE order_queue SET status = ?, last_error = ?, updated_at = CURRENT_TIMESTAMP WHERE id = ?',
+                (status, error, job_id)
+            )
+            
+            remaining = None
+            cursor.execute('SELECT batch_id FROM order_queue WHERE id = ?', (job_id,))
+            row = cursor.fetchone()
+            if row and row[0]:
+                cursor.execute(
+                    "SELECT COUNT(*) FROM order_queue WHERE batch_id = ? AND status IN ('queued', 'processing')",
+                    (row[0],)
+                )
+                remaining = cursor.fetchone()[0]
             
-            # Update the referred user's record
+            self.conn.commit()
+            return remaining
+    
+    def get_order_batch(self, batch_id):
+        """Get the jobs of a mass order with their order results, in line order"""
+        with self.write_lock:
+            cursor = self.conn.cursor()
             cursor.execute(
-                'UPDATE users SET referred_by = ? WHERE user_id = ?',
-                (referrer_id, referred_id)
+                '''SELECT q.batch_line, o.service_id, o.service_name, o.quantity, o.link, o.price,
+                          q.status, o.order_id, q.last_error, q.chat_id, q.message_id, q.language
+                   FROM order_queue q JOIN orders o ON o.id = q.reservation_id
+                   WHERE q.batch_id = ?
+                   ORDER BY q.batch_line''',
+                (batch_id,)
             )
+            return [
+                {
+                    'batch_line': row[0],
+                    'service_id': row[1],
+                    'service_name': row[2],
+                    'quantity': row[3],
+                    'link': row[4],
+                    'price': row[5],
+                    'status': row[6],
+                    'order_id': row[7],
+                    'last_error': row[8],
+                    'chat_id': row[9],
+                    'message_id': row[10],
+                    'language': row[11]
+                }
+                for row in cursor.fetchall()
+            ]
+    
+    def flag_stale_order_jobs(self):
+        """Move jobs left in 'processing' by a previous run to 'needs_reconciliation'
+        
+        The run may have stopped after the panel accepted the order, so the
+        jobs are not replayed; their reservations stay held until an admin
+        checks them against the panel.
+        
+        Returns:
+            list: (job ID, reservation ID) of the flagged jobs
+        """
+        with self.write_lock:
+            cursor = self.conn.cursor()
+            try:
+                cursor.execute('BEGIN IMMEDIATE TRANSACTION')
+                cursor.execute("SELECT id, reservation_id FROM order_queue WHERE status = 'processing'")
+                jobs = cursor.fetchall()
+                cursor.execute(
+                    """UPDATE order_queue SET status = 'needs_reconciliation',
+                       last_error = 'Interrupted while processing, check the panel before retrying or refunding',
+                       updated_at = CURRENT_TIMESTAMP WHERE status = 'processing'"""
+                )
+                self.conn.commit()
+                return jobs
+            except Exception as e:
+                logger.error(f"Error flagging stale order jobs: {e}")
+                self.conn.rollback()
+                return []
+    
+    def get_order_queue_stats(self):
+        """Get job counts per status and the age of the oldest waiting job"""
+        with self.write_lock:
+            cursor = self.conn.cursor()
+            cursor.execute('SELECT status, COUNT(*) FROM order_queue GROUP BY status')
+            stats = {'queued': 0, 'processing': 0, 'done': 0, 'failed': 0, 'needs_reconciliation': 0}
+            for status, count in cursor.fetchall():
+                stats[status] = count
             
-            # Add entry to referrals table
             cursor.execute(
-                'INSERT INTO referrals (referrer_id, referred_id) VALUES (?, ?)',
-                (referrer_id, referred_id)
+                '''SELECT (julianday('now') - julianday(MIN(created_at))) * 86400
+                   FROM order_queue WHERE status IN ('queued', 'processing')'''
+            )
+            oldest = cursor.fetchone()[0]
+            stats['oldest_waiting_seconds'] = oldest or 0.0
+            return stats
+    
+    def get_user_orders(self, user_id, limit=5):
+        with self.write_lock:
+            cursor = self.conn.cursor()
+            cursor.execute(
+                "SELECT * FROM orders WHERE user_id = ? AND status NOT IN ('reserved', 'released') ORDER BY created_at DESC LIMIT ?",
+                (user_id, limit)
             )
+            orders = cursor.fetchall()
+            return [{
+                'id': o[2],  # order_id from the API
+                'user_id': o[1],
+                'service_id': o[3],
+                'service_name': o[4],
+                'quantity': o[5],
+                'link': o[6],
+                'price': o[7],
+                'status': o[8],
+                'created_at': o[9]
+            } for o in orders] if orders else []
+    
+    def get_user_total_spending(self, user_id):
+        """Get the total amount a user has spent on orders
+        
+        Order payments are recorded both as an order and as a debit transaction,
+        so only the order side is counted. Reads a single user_totals row.
+        """
+        return self.get_user_totals(user_id)['total_spent']
+    
+    def get_user_totals(self, user_id):
+        """Get the materialized order and balance ledger summary for a user"""
+        with self.write_lock:
+            cursor = self.conn.cursor()
+            cursor.execute(
+                'SELECT order_count, total_spent, total_debited, total_credited FROM user_totals WHERE user_id = ?',
+                (user_id,)
+            )
+            row = cursor.fetchone()
+            if not row:
+                return {'order_count': 0, 'total_spent': 0.0, 'total_debited': 0.0, 'total_credited': 0.0}
             
-            # Commit transaction
+            return {
+                'order_count': row[0],
+                'total_spent': row[1],
+                'total_debited': row[2],
+                'total_credited': row[3]
+            }
+    
+    def _add_user_totals(self, cursor, user_id, order_count=0, total_spent=0.0, total_debited=0.0, total_credited=0.0):
+        """Add deltas to a user's summary row (caller commits)"""
+        cursor.execute('''
+            INSERT INTO user_totals (user_id, order_count, total_spent, total_debited, total_credited, updated_at)
+            VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT(user_id) DO UPDATE SET
+                order_count = order_count + excluded.order_count,
+                total_spent = total_spent + excluded.total_spent,
+                total_debited = total_debited + excluded.total_debited,
+                total_credited = total_credited + excluded.total_credited,
+                updated_at = excluded.updated_at
+        ''', (user_id, order_count, total_spent, total_debited, total_credited, datetime.now()))
+    
+    def reconcile_user_totals(self, tolerance=1e-6):
+        """Verify user_totals against the raw orders and balance_transactions tables
+        
+        Rows that drift from the ledger are rewritten with the recomputed values.
+        The ledger is read, compared and rewritten in one write transaction, so
+        an order or balance change can't land between the read and the rewrite.
+        
+        Returns:
+            list: The user IDs whose summary row was missing or wrong
+        """
+        cursor = self.conn.cursor()
+        with self.write_lock:
+            try:
+                cursor.execute('BEGIN IMMEDIATE TRANSACTION')
+                cursor.execute('''
+                    SELECT user_id, SUM(order_count), SUM(total_spent), SUM(total_debited), SUM(total_credited)
+                    FROM (
+                        SELECT user_id, COUNT(*) AS order_count, COALESCE(SUM(price), 0) AS total_spent,
+                               0 AS total_debited, 0 AS total_credited
+                        FROM orders WHERE status NOT IN ('reserved', 'released') GROUP BY user_id
+                        UNION ALL
+                        SELECT user_id, 0, 0,
+                               COALESCE(SUM(CASE WHEN type = 'debit' THEN amount END), 0),
+                               COALESCE(SUM(CASE WHEN type = 'credit' THEN amount END), 0)
+                        FROM balance_transactions GROUP BY user_id
+                    )
+                    WHERE user_id IS NOT NULL
+                    GROUP BY user_id
+                ''')
+                expected = {row[0]: row[1:] for row in cursor.fetchall()}
+                
+                cursor.execute('SELECT user_id, order_count, total_spent, total_debited, total_credited FROM user_totals')
+                actual = {row[0]: row[1:] for row in cursor.fetchall()}
+                
+                mismatched = []
+                for user_id in set(expected) | set(actual):
+                    want = expected.get(user_id, (0, 0.0, 0.0, 0.0))
+                    have = actual.get(user_id)
+                    if have is None or have[0] != want[0] or any(abs(h - w) > tolerance for h, w in zip(have[1:], want[1:])):
+                        mismatched.append(user_id)
+                
+                if mismatched:
+                    cursor.executemany('''
+                        INSERT OR REPLACE INTO user_totals
+                        (user_id, order_count, total_spent, total_debited, total_credited, updated_at)
+                        VALUES (?, ?, ?, ?, ?, ?)
+                    ''', [(user_id, *expected.get(user_id, (0, 0.0, 0.0, 0.0)), datetime.now()) for user_id in mismatched])
+                self.conn.commit()
+                if mismatched:
+                    logger.warning(f"Reconciled user_totals for {len(mismatched)} users")
+                return mismatched
+            except Exception as e:
+                logger.error(f"Error reconciling user totals: {e}")
+                self.conn.rollback()
+                return []
+    
+    def get_order_by_id(self, order_id):
+        """Get order details by order_id"""
+        with self.write_lock:
+            cursor = self.conn.cursor()
+            cursor.execute(
+                '''SELECT order_id, user_id, service_id, service_name, quantity, link, price, status, created_at,
+                          panel_charge, markup
+                   FROM orders WHERE order_id = ? LIMIT 1''',
+                (str(order_id),)
+            )
+            order = cursor.fetchone()
+            if order:
+                return {
+                    'id': order[0],  # order_id from the API
+                    'user_id': order[1],
+                    'service_id': order[2],
+                    'service_name': order[3],
+                    'quantity': order[4],
+                    'link': order[5],
+                    'price': order[6],
+                    'status': order[7],
+                    'created_at': order[8],
+                    'panel_charge': order[9],
+                    'markup': order[10]
+                }
+            return None
+    
+    def record_panel_charges(self, charges):
+        """Store the charge reported by the panel for orders and the resulting markup
+        
+        Args:
+            charges (list): (order_id, panel charge) pairs
+        
+        Returns:
+            int: Number of orders updated
+        """
+        rows = []
+        for order_id, charge in charges:
+            try:
+                charge = float(charge)
+            except (ValueError, TypeError):
+                continue
+            rows.append((charge, charge, charge, str(order_id), charge))
+        if not rows:
+            return 0
+        
+        with self.write_lock:
+            cursor = self.conn.cursor()
+            try:
+                cursor.executemany(
+                    '''UPDATE orders SET panel_charge = ?, markup = CASE WHEN ? > 0 THEN price / ? END
+                       WHERE order_id = ? AND panel_charge IS NOT ?''',
+                    rows
+                )
+                self.conn.commit()
+                return cursor.rowcount
+            except Exception as e:
+                logger.error(f"Error recording panel charges: {e}")
+                self.conn.rollback()
+                return 0
+    
+    def is_admin(self, user_id):
+        """Check if a user is an admin"""
+        admin_ids_str = os.getenv("ADMIN_USER_ID", "")
+        admin_ids = [id.strip() for id in admin_ids_str.split(",")]
+        return str(user_id) in admin_ids
+    
+    def get_language(self, user_id):
+        """Get user's language preference"""
+        with self.write_lock:
+            try:
+                cursor = self.conn.cursor()
+                cursor.execute("SELECT language FROM users WHERE user_id = ?", (user_id,))
+                result = cursor.fetchone()
+                
+                if result and result[0]:
+                    return result[0]
+                return 'en'  # Default to English
+            except Exception as e:
+                logger.error(f"Error getting language: {e}")
+                return 'en'  # Default to English if there's an error
+    
+    def set_language(self, user_id, language):
+        """Set user's language preference"""
+        with self.write_lock:
+            cursor = self.conn.cursor()
+            cursor.execute(
+                'UPDATE users SET language = ? WHERE user_id = ?',
+                (language, user_id)
+            )
             self.conn.commit()
-            transaction_active = False
-            logger.info(f"Successfully recorded referral: {referrer_id} referred {referred_id}")
             return True
-        except Exception as e:
-            logger.error(f"Error adding referral: {e}")
-            if transaction_active:
-                try:
-                    cursor.execute('ROLLBACK')
-                except sqlite3.Error as rollback_error:
-                    logger.error(f"Error during rollback: {rollback_error}")
-            return False
+
+    def get_persisted_user_data(self, user_id):
+        """Get the stored user_data of one user as a JSON string, or None"""
+        with self.write_lock:
+            try:
+                cursor = self.conn.cursor()
+                cursor.execute("SELECT data FROM persisted_user_data WHERE user_id = ?", (user_id,))
+                result = cursor.fetchone()
+                return result[0] if result else None
+            except Exception as e:
+                logger.error(f"Error getting persisted user data for {user_id}: {e}")
+                return None
+    
+    def get_persisted_conversations(self, name):
+        """Get the stored states of a conversation handler
+        
+        Returns:
+            list: (conversation key JSON, state JSON) rows
+        """
+        with self.write_lock:
+            try:
+                cursor = self.conn.cursor()
+                cursor.execute(
+                    "SELECT conversation_key, state FROM persisted_conversations WHERE name = ?",
+                    (name,)
+                )
+                return cursor.fetchall()
+            except Exception as e:
+                logger.error(f"Error getting persisted conversations for {name}: {e}")
+                return []
+    
+    def save_persisted_state(self, user_data_rows, conversation_rows, ended_conversations):
+        """Write a batch of persistence changes in one transaction
+        
+        Args:
+            user_data_rows (list): (user_id, data JSON) pairs; empty data deletes the row
+            conversation_rows (list): (name, conversation key JSON, state JSON) rows
+            ended_conversations (list): (name, conversation key JSON) pairs to delete
+        
+        Returns:
+            bool: True if the batch was written
+        """
+        with self.write_lock:
+            cursor = self.conn.cursor()
+            try:
+                cursor.executemany(
+                    '''INSERT INTO persisted_user_data (user_id, data, updated_at) VALUES (?, ?, CURRENT_TIMESTAMP)
+                       ON CONFLICT (user_id) DO UPDATE SET data = excluded.data, updated_at = excluded.updated_at''',
+                    [row for row in user_data_rows if row[1] != '{}']
+                )
+                cursor.executemany(
+                    "DELETE FROM persisted_user_data WHERE user_id = ?",
+                    [(user_id,) for user_id, data in user_data_rows if data == '{}']
+                )
+                cursor.executemany(
+                    '''INSERT INTO persisted_conversations (name, conversation_key, state, updated_at)
+                       VALUES (?, ?, ?, CURRENT_TIMESTAMP)
+                       ON CONFLICT (name, conversation_key) DO UPDATE SET state = excluded.state,
+                       updated_at = excluded.updated_at''',
+                    conversation_rows
+                )
+                cursor.executemany(
+                    "DELETE FROM persisted_conversations WHERE name = ? AND conversation_key = ?",
+                    ended_conversations
+                )
+                self.conn.commit()
+                return True
+            except Exception as e:
+                logger.error(f"Error saving persisted state: {e}")
+                self.conn.rollback()
+                return False
+    
+    def get_command_menu_state(self, user_id):
+        """Get whether the command menu keyboard is shown to the user
+        
+        Returns:
+            bool: The stored state, or None if the menu was never sent
+        """
+        with self.write_lock:
+            try:
+                cursor = self.conn.cursor()
+                cursor.execute("SELECT command_menu_active FROM users WHERE user_id = ?", (user_id,))
+                result = cursor.fetchone()
+                if result is None or result[0] is None:
+                    return None
+                return bool(result[0])
+            except Exception as e:
+                logger.error(f"Error getting command menu state: {e}")
+                return None
+    
+    def set_command_menu_state(self, user_id, active):
+        """Store whether the command menu keyboard is shown to the user"""
+        with self.write_lock:
+            cursor = self.conn.cursor()
+            try:
+                cursor.execute(
+                    'UPDATE users SET command_menu_active = ? WHERE user_id = ?',
+                    (1 if active else 0, user_id)
+                )
+                self.conn.commit()
+                return True
+            except Exception as e:
+                logger.error(f"Error setting command menu state: {e}")
+                self.conn.rollback()
+                return False
+
+    def update_user_data(self, user_id, data_dict):
+        """Update user data with key-value pairs from data_dict"""
+        with self.write_lock:
+            if not data_dict:
+                return False
+                
+            cursor = self.conn.cursor()
+            try:
+                # Get column names from users table
+                cursor.execute('PRAGMA table_info(users)')
+                valid_columns = [column[1] for column in cursor.fetchall()]
+                
+                # Filter out invalid keys
+                valid_data = {k: v for k, v in data_dict.items() if k in valid_columns}
+                
+                if not valid_data:
+                    logger.warning(f"No valid columns to update for user {user_id}")
+                    return False
+                    
+                # Build the SQL query
+                set_clause = ', '.join([f"{key} = ?" for key in valid_data.keys()])
+                values = list(valid_data.values())
+                values.append(user_id)
+                
+                # Execute the update
+                cursor.execute(
+                    f'UPDATE users SET {set_clause} WHERE user_id = ?',
+                    values
+                )
+                self.conn.commit()
+                logger.info(f"Updated user data for user {user_id}: {valid_data}")
+                return True
+            except Exception as e:
+                logger.error(f"Error updating user data: {e}")
+                self.conn.rollback()
+                return False
+
+    # Add referral methods
+    def add_referral(self, referrer_id, referred_id):
+        """Record a new referral"""
+        with self.write_lock:
+            cursor = self.conn.cursor()
+            transaction_active = False
+            try:
+                # Check if the referred user already has a referrer
+                user = self.get_user(referred_id)
+                if user.get('referred_by'):
+                    logger.info(f"User {referred_id} already has a referrer: {user.get('referred_by')}")
+                    return False
+                    
+                # Start transaction
+                cursor.execute('BEGIN TRANSACTION')
+                transaction_active = True
+                
+                # Update the referred user's record
+                cursor.execute(
+                    'UPDATE users SET referred_by = ? WHERE user_id = ?',
+                    (referrer_id, referred_id)
+                )
+                
+                # Add entry to referrals table
+                cursor.execute(
+                    'INSERT INTO referrals (referrer_id, referred_id) VALUES (?, ?)',
+                    (referrer_id, referred_id)
+                )
+                
+                # Commit transaction
+                self.conn.commit()
+                transaction_active = False
+                logger.info(f"Successfully recorded referral: {referrer_id} referred {referred_id}")
+                return True
+            except Exception as e:
+                logger.error(f"Error adding referral: {e}")
+                if transaction_active:
+                    try:
+                        cursor.execute('ROLLBACK')
+                    except sqlite3.Error as rollback_error:
+                        logger.error(f"Error during rollback: {rollback_error}")
+                return False
     
     def get_referrals(self, user_id):
         """Get list of users referred by the given user"""
-        cursor = self.conn.cursor()
-        cursor.execute('''
-            SELECT u.user_id, u.username, u.first_name, u.last_name, r.created_at
-            FROM referrals r
-            JOIN users u ON r.referred_id = u.user_id
-            WHERE r.referrer_id = ?
-            ORDER BY r.created_at DESC
-        ''', (user_id,))
-        
-        referrals = []
-        for row in cursor.fetchall():
-            referrals.append({
-                'user_id': row[0],
-                'username': row[1],
-                'first_name': row[2],
-                'last_name': row[3],
-                'created_at': row[4]
-            })
-        
-        return referrals
+        with self.write_lock:
+            cursor = self.conn.cursor()
+            cursor.execute('''
+                SELECT u.user_id, u.username, u.first_name, u.last_name, r.created_at
+                FROM referrals r
+                JOIN users u ON r.referred_id = u.user_id
+                WHERE r.referrer_id = ?
+                ORDER BY r.created_at DESC
+            ''', (user_id,))
+            
+            referrals = []
+            for row in cursor.fetchall():
+                referrals.append({
+                    'user_id': row[0],
+                    'username': row[1],
+                    'first_name': row[2],
+                    'last_name': row[3],
+                    'created_at': row[4]
+                })
+            
+            return referrals
     
     def get_referral_count(self, user_id):
         """Get the number of users referred by the given user"""
-        cursor = self.conn.cursor()
-        cursor.execute('SELECT COUNT(*) FROM referrals WHERE referrer_id = ?', (user_id,))
-        return cursor.fetchone()[0]
+        with self.write_lock:
+            cursor = self.conn.cursor()
+            cursor.execute('SELECT COUNT(*) FROM referrals WHERE referrer_id = ?', (user_id,))
+            return cursor.fetchone()[0]
     
     def get_valid_referral_count(self, user_id):
         """Get the number of valid users (with username) referred by the given user"""
-        cursor = self.conn.cursor()
-        cursor.execute('''
-            SELECT COUNT(*) 
-            FROM referrals r
-            JOIN users u ON r.referred_id = u.user_id
-            WHERE r.referrer_id = ? AND u.username IS NOT NULL AND u.username != ''
-        ''', (user_id,))
-        return cursor.fetchone()[0]
+        with self.write_lock:
+            cursor = self.conn.cursor()
+            cursor.execute('''
+                SELECT COUNT(*) 
+                FROM referrals r
+                JOIN users u ON r.referred_id = u.user_id
+                WHERE r.referrer_id = ? AND u.username IS NOT NULL AND u.username != ''
+            ''', (user_id,))
+            return cursor.fetchone()[0]
     
     def check_and_create_referral_bonus(self, user_id):
         """Check if user has reached the referral threshold and create a bonus if needed"""
-        cursor = self.conn.cursor()
-        transaction_active = False
-        try:
-            # Get referral threshold from settings
-            referral_threshold_str = self.get_setting("referral_threshold", "50")
+        with self.write_lock:
+            cursor = self.conn.cursor()
+            transaction_active = False
             try:
-                referral_threshold = int(referral_threshold_str)
-            except (ValueError, TypeError):
-                # Default to 50 if conversion fails
-                referral_threshold = 50
-                logger.warning(f"Failed to convert referral_threshold to integer. Using default value: {referral_threshold}")
+                # Get referral threshold from settings
+                referral_threshold_str = self.get_setting("referral_threshold", "50")
+                try:
+                    referral_threshold = int(referral_threshold_str)
+                except (ValueError, TypeError):
+                    # Default to 50 if conversion fails
+                    referral_threshold = 50
+                    logger.warning(f"Failed to convert referral_threshold to integer. Using default value: {referral_threshold}")
+                
+                # Get total valid referral count (only users with username)
+                referral_count = self.get_valid_referral_count(user_id)
+                
+                # Get already processed referrals
+                cursor.execute('''
+                    SELECT SUM(referral_count)
+                    FROM referral_bonuses
+                    WHERE user_id = ?
+                ''', (user_id,))
+                
+                processed_count = cursor.fetchone()[0] or 0
+                
+                # Calculate how many new bonuses to create
+                new_bonus_count = (referral_count // referral_threshold) - (processed_count // referral_threshold)
+                
+                if new_bonus_count <= 0:
+                    # No new bonuses
+                    return None
+                
+                # Create new bonus
+                bonus_amount = 50.0  # ETB 50 for each bonus
+                
+                # Start transaction
+                cursor.execute('BEGIN TRANSACTION')
+                transaction_active = True
+                
+                # Insert bonus record
+                cursor.execute('''
+                    INSERT INTO referral_bonuses
+                    (user_id, referral_count, bonus_amount, status)
+                    VALUES (?, ?, ?, 'pending')
+                ''', (user_id, referral_threshold, bonus_amount))
+                
+                bonus_id = cursor.lastrowid
+                
+                # Commit transaction
+                self.conn.commit()
+                transaction_active = False
+                
+                # Return bonus info
+                return {
+                    'id': bonus_id,
+                    'user_id': user_id,
+                    'referral_count': referral_count,
+                    'processed_count': processed_count,
+                    'new_bonus_count': new_bonus_count,
+                    'bonus_amount': bonus_amount,
+                    'referral_threshold': referral_threshold
+                }
+            except Exception as e:
+                logger.error(f"Error checking referral bonus: {e}")
+                if transaction_active:
+                    try:
+                        cursor.execute('ROLLBACK')
+                    except sqlite3.Error as rollback_error:
+                        logger.error(f"Error during rollback: {rollback_error}")
+                return None
+    
+    def get_pending_referral_bonuses(self, user_id=None):
+        """Get pending referral bonuses for a user or all users"""
+        with self.write_lock:
+            cursor = self.conn.cursor()
+            
+            if user_id:
+                cursor.execute('''
+                    SELECT rb.id, rb.user_id, u.username, u.first_name, u.last_name, 
+                           rb.referral_count, rb.bonus_amount, rb.status, rb.created_at
+                    FROM referral_bonuses rb
+                    JOIN users u ON rb.user_id = u.user_id
+                    WHERE rb.user_id = ? AND rb.status = 'pending'
+                    ORDER BY rb.created_at DESC
+                ''', (user_id,))
+            else:
+                cursor.execute('''
+                    SELECT rb.id, rb.user_id, u.username, u.first_name, u.last_name, 
+                           rb.referral_count, rb.bonus_amount, rb.status, rb.created_at
+                    FROM referral_bonuses rb
+                    JOIN users u ON rb.user_id = u.user_id
+                    WHERE rb.status = 'pending'
+                    ORDER BY rb.created_at DESC
+                ''')
             
-            # Get total valid referral count (only users with username)
-            referral_count = self.get_valid_referral_count(user_id)
+            bonuses = []
+            for row in cursor.fetchall():
+                bonuses.append({
+                    'id': row[0],
+                    'user_id': row[1],
+                    'username': row[2],
+                    'first_name': row[3],
+                    'last_name': row[4],
+                    'referral_count': row[5],
+                    'bonus_amount': row[6],
+                    'status': row[7],
+                    'created_at': row[8]
+                })
             
-            # Get already processed referrals
+            return bonuses
+    
+    def get_all_referral_bonuses(self, user_id):
+        """Get all referral bonuses for a user"""
+        with self.write_lock:
+            cursor = self.conn.cursor()
             cursor.execute('''
-                SELECT SUM(referral_count)
+                SELECT id, referral_count, bonus_amount, status, created_at, processed_at
                 FROM referral_bonuses
                 WHERE user_id = ?
+                ORDER BY created_at DESC
             ''', (user_id,))
             
-            processed_count = cursor.fetchone()[0] or 0
-            
-            # Calculate how many new bonuses to create
-            new_bonus_count = (referral_count // referral_threshold) - (processed_count // referral_threshold)
-            
-            if new_bonus_count <= 0:
-                # No new bonuses
-                return None
-            
-            # Create new bonus
-            bonus_amount = 50.0  # ETB 50 for each bonus
-            
-            # Start transaction
-            cursor.execute('BEGIN TRANSACTION')
-            transaction_active = True
-            
-            # Insert bonus record
-            cursor.execute('''
-                INSERT INTO referral_bonuses
-                (user_id, referral_count, bonus_amount, status)
-                VALUES (?, ?, ?, 'pending')
-            ''', (user_id, referral_threshold, bonus_amount))
-            
-            bonus_id = cursor.lastrowid
-            
-            # Commit transaction
-            self.conn.commit()
-            transaction_active = False
+            bonuses = []
+            for row in cursor.fetchall():
+                bonuses.append({
+                    'id': row[0],
+                    'referral_count': row[1],
+                    'bonus_amount': row[2],
+                    'status': row[3],
+                    'created_at': row[4],
+                    'processed_at': row[5]
+                })
             
-            # Return bonus info
-            return {
-                'id': bonus_id,
-                'user_id': user_id,
-                'referral_count': referral_count,
-                'processed_count': processed_count,
-                'new_bonus_count': new_bonus_count,
-                'bonus_amount': bonus_amount,
-                'referral_threshold': referral_threshold
-            }
-        except Exception as e:
-            logger.error(f"Error checking referral bonus: {e}")
-            if transaction_active:
-                try:
-                    cursor.execute('ROLLBACK')
-                except sqlite3.Error as rollback_error:
-                    logger.error(f"Error during rollback: {rollback_error}")
-            return None
-    
-    def get_pending_referral_bonuses(self, user_id=None):
-        """Get pending referral bonuses for a user or all users"""
-        cursor = self.conn.cursor()
-        
-        if user_id:
-            cursor.execute('''
-                SELECT rb.id, rb.user_id, u.username, u.first_name, u.last_name, 
-                       rb.referral_count, rb.bonus_amount, rb.status, rb.created_at
-                FROM referral_bonuses rb
-                JOIN users u ON rb.user_id = u.user_id
-                WHERE rb.user_id = ? AND rb.status = 'pending'
-                ORDER BY rb.created_at DESC
-            ''', (user_id,))
-        else:
-            cursor.execute('''
-                SELECT rb.id, rb.user_id, u.username, u.first_name, u.last_name, 
-                       rb.referral_count, rb.bonus_amount, rb.status, rb.created_at
-                FROM referral_bonuses rb
-                JOIN users u ON rb.user_id = u.user_id
-                WHERE rb.status = 'pending'
-                ORDER BY rb.created_at DESC
-            ''')
-        
-        bonuses = []
-        for row in cursor.fetchall():
-            bonuses.append({
-                'id': row[0],
-                'user_id': row[1],
-                'username': row[2],
-                'first_name': row[3],
-                'last_name': row[4],
-                'referral_count': row[5],
-                'bonus_amount': row[6],
-                'status': row[7],
-                'created_at': row[8]
-            })
-        
-        return bonuses
-    
-    def get_all_referral_bonuses(self, user_id):
-        """Get all referral bonuses for a user"""
-        cursor = self.conn.cursor()
-        cursor.execute('''
-            SELECT id, referral_count, bonus_amount, status, created_at, processed_at
-            FROM referral_bonuses
-            WHERE user_id = ?
-            ORDER BY created_at DESC
-        ''', (user_id,))
-        
-        bonuses = []
-        for row in cursor.fetchall():
-            bonuses.append({
-                'id': row[0],
-                'referral_count': row[1],
-                'bonus_amount': row[2],
-                'status': row[3],
-                'created_at': row[4],
-                'processed_at': row[5]
-            })
-        
-        return bonuses
+            return bonuses
     
     def process_referral_bonus(self, bonus_id, status, admin_id):
         """Process a referral bonus (approve or decline)"""
-        cursor = self.conn.cursor()
-        transaction_active = False
-        try:
-            # Start transaction
-            cursor.execute('BEGIN TRANSACTION')
-            transaction_active = True
-            
-            # Get bonus details
-            cursor.execute('SELECT user_id, bonus_amount FROM referral_bonuses WHERE id = ?', (bonus_id,))
-            bonus = cursor.fetchone()
-            
-            if not bonus:
-                cursor.execute('ROLLBACK')
-                transaction_active = False
-                return False
-            
-            user_id, bonus_amount = bonus
-            
-            # Update bonus status
-            cursor.execute('''
-                UPDATE referral_bonuses 
-                SET status = ?, processed_at = CURRENT_TIMESTAMP, processed_by = ? 
-                WHERE id = ?
-            ''', (status, admin_id, bonus_id))
-            
-            # If approved, add balance to user
-            if status == 'approved':
-                # Add balance
-                cursor.execute('''
-                    UPDATE users 
-                    SET balance = balance + ? 
-                    WHERE user_id = ?
-                ''', (bonus_amount, user_id))
-                
-                # Add transaction record
-                cursor.execute('''
-                    INSERT INTO balance_transactions 
-                    (user_id, amount, type, description) 
-                    VALUES (?, ?, 'credit', 'Referral bonus for 50 referrals')
-                ''', (user_id, bonus_amount))
-            
-            # Commit transaction
-            self.conn.commit()
+        with self.write_lock:
+            cursor = self.conn.cursor()
             transaction_active = False
-            return True
-        except Exception as e:
-            logger.error(f"Error processing referral bonus: {e}")
-            if transaction_active:
-                try:
+            try:
+                # Start transaction
+                cursor.execute('BEGIN IMMEDIATE TRANSACTION')
+                transaction_active = True
+                
+                # Get bonus details
+                cursor.execute('SELECT user_id, bonus_amount FROM referral_bonuses WHERE id = ?', (bonus_id,))
+                bonus = cursor.fetchone()
+                
+                if not bonus:
                     cursor.execute('ROLLBACK')
-                except sqlite3.Error as rollback_error:
-                    logger.error(f"Error during rollback: {rollback_error}")
-            return False
+                    transaction_active = False
+                    return False
+                
+                user_id, bonus_amount = bonus
+                
+                # Update bonus status
+                cursor.execute('''
+                    UPDATE referral_bonuses 
+                    SET status = ?, processed_at = CURRENT_TIMESTAMP, processed_by = ? 
+                    WHERE id = ?
+                ''', (status, admin_id, bonus_id))
+                
+                # If approved, add balance to user
+                if status == 'approved':
+                    # Add balance
+                    cursor.execute('''
+                        UPDATE users 
+                        SET balance = balance + ? 
+                        WHERE user_id = ?
+                    ''', (bonus_amount, user_id))
+                    
+                    # Add transaction record
+                    cursor.execute('''
+                        INSERT INTO balance_transactions 
+                        (user_id, amount, type, description) 
+                        VALUES (?, ?, 'credit', 'Referral bonus for 50 referrals')
+                    ''', (user_id, bonus_amount))
+                    self._add_user_totals(cursor, user_id, total_credited=bonus_amount)
+                
+                # Commit transaction
+                self.conn.commit()
+                transaction_active = False
+                return True
+            except Exception as e:
+                logger.error(f"Error processing referral bonus: {e}")
+                if transaction_active:
+                    try:
+                        cursor.execute('ROLLBACK')
+                    except sqlite3.Error as rollback_error:
+                        logger.error(f"Error during rollback: {rollback_error}")
+                return False
 
     def get_setting(self, key, default=None):
         """Get a setting value from the database"""
-        cursor = self.conn.cursor()
-        cursor.execute('SELECT value FROM settings WHERE key = ?', (key,))
-        result = cursor.fetchone()
-        
-        if result:
-            return result[0]
-        return default
+        with self.write_lock:
+            cursor = self.conn.cursor()
+            cursor.execute('SELECT value FROM settings WHERE key = ?', (key,))
+            result = cursor.fetchone()
+            
+            if result:
+                return result[0]
+            return default
     
     def set_setting(self, key, value):
         """Set a setting value in the database"""
-        cursor = self.conn.cursor()
-        cursor.execute(
-            'INSERT OR REPLACE INTO settings (key, value, updated_at) VALUES (?, ?, ?)',
-            (key, str(value), datetime.now())
-        )
-        self.conn.commit()
-        return True
+        with self.write_lock:
+            cursor = self.conn.cursor()
+            cursor.execute(
+                'INSERT OR REPLACE INTO settings (key, value, updated_at) VALUES (?, ?, ?)',
+                (key, str(value), datetime.now())
+            )
+            self.conn.commit()
+            return True
     
     def update_currency_rate(self, currency, rate):
         """Update the exchange rate for a currency"""
@@ -816,250 +2059,424 @@ class Database:
     
     def get_all_currency_rates(self):
         """Get all currency exchange rates"""
-        cursor = self.conn.cursor()
-        cursor.execute('SELECT key, value FROM settings WHERE key LIKE ?', ('currency_rate_%',))
-        results = cursor.fetchall()
-        
-        rates = {}
-        for key, value in results:
-            currency = key.replace('currency_rate_', '')
-            try:
-                rates[currency] = float(value)
-            except (ValueError, TypeError):
-                continue
-        
-        return rates
+        with self.write_lock:
+            cursor = self.conn.cursor()
+            cursor.execute('SELECT key, value FROM settings WHERE key LIKE ?', ('currency_rate_%',))
+            results = cursor.fetchall()
+            
+            rates = {}
+            for key, value in results:
+                currency = key.replace('currency_rate_', '')
+                try:
+                    rates[currency] = float(value)
+                except (ValueError, TypeError):
+                    continue
+            
+            return rates
 
     # Add statistics methods
     def get_total_users(self):
         """Get the total number of users"""
-        cursor = self.conn.cursor()
-        cursor.execute('SELECT COUNT(*) FROM users')
-        return cursor.fetchone()[0]
+        with self.write_lock:
+            cursor = self.conn.cursor()
+            cursor.execute('SELECT COUNT(*) FROM users')
+            return cursor.fetchone()[0]
     
     def get_active_users(self, days=7):
         """Get the number of active users in the last X days"""
-        cursor = self.conn.cursor()
-        cursor.execute('''
-            SELECT COUNT(*) FROM users 
-            WHERE last_activity >= datetime('now', ?) AND last_activity IS NOT NULL
-        ''', (f'-{days} days',))
-        return cursor.fetchone()[0]
+        with self.write_lock:
+            cursor = self.conn.cursor()
+            cursor.execute('''
+                SELECT COUNT(*) FROM users 
+                WHERE last_active_day >= date('now', ?)
+            ''', (f'-{days} days',))
+            return cursor.fetchone()[0]
     
     def get_total_orders(self):
-        """Get the total number of orders"""
-        cursor = self.conn.cursor()
-        cursor.execute('SELECT COUNT(*) FROM orders')
-        return cursor.fetchone()[0]
+        """Get the total number of orders (reservations not yet placed are left out)"""
+        with self.write_lock:
+            cursor = self.conn.cursor()
+            cursor.execute("SELECT COUNT(*) FROM orders WHERE status NOT IN ('reserved', 'released')")
+            return cursor.fetchone()[0]
     
     def get_recent_orders(self, days=7):
         """Get the number of orders in the last X days"""
-        cursor = self.conn.cursor()
+        with self.write_lock:
+            cursor = self.conn.cursor()
+            cursor.execute('''
+                SELECT COUNT(*) FROM orders 
+                WHERE created_at >= datetime('now', ?) AND status NOT IN ('reserved', 'released')
+            ''', (f'-{days} days',))
+            return cursor.fetchone()[0]
+    
+    # Incrementally maintained dashboard stats
+    def _increment_counter(self, cursor, name, delta=1):
+        """Add delta to a running counter (caller commits)"""
         cursor.execute('''
-            SELECT COUNT(*) FROM orders 
-            WHERE created_at >= datetime('now', ?)
-        ''', (f'-{days} days',))
-        return cursor.fetchone()[0]
+            INSERT INTO stats_counters (name, value) VALUES (?, ?)
+            ON CONFLICT(name) DO UPDATE SET value = value + excluded.value
+        ''', (name, delta))
+    
+    def _increment_daily_stats(self, cursor, day, **deltas):
+        """Add deltas to the rollup row for a day (caller commits)"""
+        columns = [column for column in deltas if column in ('new_users', 'orders', 'active_users', 'last_active_users')]
+        if not columns:
+            return
+        cursor.execute('INSERT OR IGNORE INTO stats_daily (day) VALUES (?)', (day,))
+        set_clause = ', '.join([f"{column} = {column} + ?" for column in columns])
+        cursor.execute(
+            f'UPDATE stats_daily SET {set_clause} WHERE day = ?',
+            [deltas[column] for column in columns] + [day]
+        )
+    
+    def rebuild_stats(self):
+        """Recompute the stats counters and daily rollups (UTC days) from the raw tables"""
+        with self.write_lock:
+            cursor = self.conn.cursor()
+            try:
+                cursor.execute('BEGIN TRANSACTION')
+                cursor.execute('DELETE FROM stats_counters')
+                cursor.execute('DELETE FROM stats_daily')
+                
+                cursor.execute("INSERT INTO stats_counters (name, value) SELECT 'total_users', COUNT(*) FROM users")
+                cursor.execute('''
+                    INSERT INTO stats_counters (name, value)
+                    SELECT 'total_orders', COUNT(*) FROM orders WHERE status NOT IN ('reserved', 'released')
+                ''')
+                
+                cursor.execute('''
+                    SELECT date(created_at), COUNT(*) FROM users
+                    WHERE created_at IS NOT NULL GROUP BY date(created_at)
+                ''')
+                for day, count in cursor.fetchall():
+                    self._increment_daily_stats(cursor, day, new_users=count)
+                
+                cursor.execute('''
+                    SELECT date(created_at), COUNT(*) FROM orders
+                    WHERE created_at IS NOT NULL AND status NOT IN ('reserved', 'released')
+                    GROUP BY date(created_at)
+                ''')
+                for day, count in cursor.fetchall():
+                    self._increment_daily_stats(cursor, day, orders=count)
+                
+                # Per-day distinct activity is not stored historically, so the
+                # last activity day is the best available estimate for old days
+                cursor.execute('UPDATE users SET last_active_day = date(last_activity)')
+                cursor.execute('''
+                    SELECT last_active_day, COUNT(*) FROM users
+                    WHERE last_active_day IS NOT NULL GROUP BY last_active_day
+                ''')
+                for day, count in cursor.fetchall():
+                    self._increment_daily_stats(cursor, day, active_users=count, last_active_users=count)
+                
+                self.conn.commit()
+                logger.info("Rebuilt dashboard stats from raw tables")
+                return True
+            except Exception as e:
+                logger.error(f"Error rebuilding stats: {e}")
+                cursor.execute('ROLLBACK')
+                return False
+    
+    def get_dashboard_stats(self, days=7):
+        """Get dashboard totals from the running counters and the last X daily rollups"""
+        with self.write_lock:
+            cursor = self.conn.cursor()
+            cursor.execute('SELECT name, value FROM stats_counters')
+            counters = dict(cursor.fetchall())
+            
+            since = (utc_now() - timedelta(days=days - 1)).strftime('%Y-%m-%d')
+            cursor.execute(
+                'SELECT SUM(orders), SUM(last_active_users) FROM stats_daily WHERE day >= ?',
+                (since,)
+            )
+            recent_orders, active_users = cursor.fetchone()
+            
+            return {
+                'total_users': counters.get('total_users', 0),
+                'total_orders': counters.get('total_orders', 0),
+                'active_users': active_users or 0,
+                'recent_orders': recent_orders or 0
+            }
+    
+    def get_daily_stats(self, days=30):
+        """Get one rollup row per day for the last X days (oldest first, missing days as zeros)"""
+        with self.write_lock:
+            today = utc_now()
+            since = (today - timedelta(days=days - 1)).strftime('%Y-%m-%d')
+            
+            cursor = self.conn.cursor()
+            cursor.execute(
+                'SELECT day, new_users, orders, active_users FROM stats_daily WHERE day >= ? ORDER BY day',
+                (since,)
+            )
+            rows = {row[0]: row for row in cursor.fetchall()}
+            
+            daily_stats = []
+            for offset in range(days - 1, -1, -1):
+                day = (today - timedelta(days=offset)).strftime('%Y-%m-%d')
+                row = rows.get(day)
+                daily_stats.append({
+                    'day': day,
+                    'new_users': row[1] if row else 0,
+                    'orders': row[2] if row else 0,
+                    'active_users': row[3] if row else 0
+                })
+            
+            return daily_stats
     
     def get_all_users_list(self, limit=1000):
         """Get a list of all users with details"""
-        cursor = self.conn.cursor()
-        cursor.execute('''
-            SELECT user_id, username, first_name, last_name, balance, last_activity, created_at
-            FROM users
-            ORDER BY created_at DESC
-            LIMIT ?
-        ''', (limit,))
-        
-        users = []
-        for row in cursor.fetchall():
-            users.append({
-                'user_id': row[0],
-                'username': row[1],
-                'first_name': row[2],
-                'last_name': row[3],
-                'balance': row[4],
-                'last_activity': row[5],
-                'created_at': row[6]
-            })
-        
-        return users
+        with self.write_lock:
+            cursor = self.conn.cursor()
+            cursor.execute('''
+                SELECT user_id, username, first_name, last_name, balance, last_activity, created_at
+                FROM users
+                ORDER BY created_at DESC
+                LIMIT ?
+            ''', (limit,))
+            
+            users = []
+            for row in cursor.fetchall():
+                users.append({
+                    'user_id': row[0],
+                    'username': row[1],
+                    'first_name': row[2],
+                    'last_name': row[3],
+                    'balance': row[4],
+                    'last_activity': row[5],
+                    'created_at': row[6]
+                })
+            
+            return users
     
     def get_active_users_list(self, days=7, limit=1000):
         """Get a list of active users in the last X days"""
-        cursor = self.conn.cursor()
-        cursor.execute('''
-            SELECT user_id, username, first_name, last_name, balance, last_activity, created_at
-            FROM users
-            WHERE last_activity >= datetime('now', ?) AND last_activity IS NOT NULL
-            ORDER BY last_activity DESC
-            LIMIT ?
-        ''', (f'-{days} days', limit))
-        
-        users = []
-        for row in cursor.fetchall():
-            users.append({
-                'user_id': row[0],
-                'username': row[1],
-                'first_name': row[2],
-                'last_name': row[3],
-                'balance': row[4],
-                'last_activity': row[5],
-                'created_at': row[6]
-            })
-        
-        return users
+        with self.write_lock:
+            cursor = self.conn.cursor()
+            cursor.execute('''
+                SELECT user_id, username, first_name, last_name, balance, last_activity, created_at
+                FROM users
+                WHERE last_active_day >= date('now', ?)
+                ORDER BY last_activity DESC
+                LIMIT ?
+            ''', (f'-{days} days', limit))
+            
+            users = []
+            for row in cursor.fetchall():
+                users.append({
+                    'user_id': row[0],
+                    'username': row[1],
+                    'first_name': row[2],
+                    'last_name': row[3],
+                    'balance': row[4],
+                    'last_activity': row[5],
+                    'created_at': row[6]
+                })
+            
+            return users
     
     def get_all_orders(self, limit=1000):
         """Get a list of all orders with details"""
-        cursor = self.conn.cursor()
-        cursor.execute('''
-            SELECT id, user_id, order_id, service_id, service_name, quantity, link, price, status, created_at
-            FROM orders
-            ORDER BY created_at DESC
-            LIMIT ?
-        ''', (limit,))
-        
-        orders = []
-        for row in cursor.fetchall():
-            orders.append({
-                'id': row[0],
-                'user_id': row[1],
-                'order_id': row[2],
-                'service_id': row[3],
-                'service_name': row[4],
-                'quantity': row[5],
-                'link': row[6],
-                'price': row[7],
-                'status': row[8],
-                'created_at': row[9]
-            })
-        
-        return orders
+        with self.write_lock:
+            cursor = self.conn.cursor()
+            cursor.execute('''
+                SELECT id, user_id, order_id, service_id, service_name, quantity, link, price, status, created_at
+                FROM orders
+                ORDER BY created_at DESC
+                LIMIT ?
+            ''', (limit,))
+            
+            orders = []
+            for row in cursor.fetchall():
+                orders.append({
+                    'id': row[0],
+                    'user_id': row[1],
+                    'order_id': row[2],
+                    'service_id': row[3],
+                    'service_name': row[4],
+                    'quantity': row[5],
+                    'link': row[6],
+                    'price': row[7],
+                    'status': row[8],
+                    'created_at': row[9]
+                })
+            
+            return orders
     
     def get_recent_orders_list(self, days=7, limit=1000):
         """Get a list of orders in the last X days"""
-        cursor = self.conn.cursor()
-        cursor.execute('''
-            SELECT id, user_id, order_id, service_id, service_name, quantity, link, price, status, created_at
-            FROM orders
-            WHERE created_at >= datetime('now', ?)
-            ORDER BY created_at DESC
-            LIMIT ?
-        ''', (f'-{days} days', limit))
-        
-        orders = []
-        for row in cursor.fetchall():
-            orders.append({
-                'id': row[0],
-                'user_id': row[1],
-                'order_id': row[2],
-                'service_id': row[3],
-                'service_name': row[4],
-                'quantity': row[5],
-                'link': row[6],
-                'price': row[7],
-                'status': row[8],
-                'created_at': row[9]
-            })
-        
-        return orders
+        with self.write_lock:
+            cursor = self.conn.cursor()
+            cursor.execute('''
+                SELECT id, user_id, order_id, service_id, service_name, quantity, link, price, status, created_at
+                FROM orders
+                WHERE created_at >= datetime('now', ?)
+                ORDER BY created_at DESC
+                LIMIT ?
+            ''', (f'-{days} days', limit))
+            
+            orders = []
+            for row in cursor.fetchall():
+                orders.append({
+                    'id': row[0],
+                    'user_id': row[1],
+                    'order_id': row[2],
+                    'service_id': row[3],
+                    'service_name': row[4],
+                    'quantity': row[5],
+                    'link': row[6],
+                    'price': row[7],
+                    'status': row[8],
+                    'created_at': row[9]
+                })
+            
+            return orders
 
-    def set_service_price_override(self, service_id, original_price, custom_price, admin_id):
-        """Set a custom price for a service"""
-        cursor = self.conn.cursor()
-        try:
-            cursor.execute(
-                '''INSERT OR REPLACE INTO service_price_overrides 
-                   (service_id, original_price, custom_price, updated_at, updated_by)
-                   VALUES (?, ?, ?, ?, ?)''',
-                (service_id, original_price, custom_price, datetime.now(), admin_id)
-            )
-            self.conn.commit()
+    def get_orders_with_users(self, days=None, limit=10, offset=0):
+        """Get a page of orders joined with the ordering user's details in a single query
+        
+        Args:
+            days (int, optional): Only include orders from the last X days
+            limit (int): Page size
+            offset (int): Number of orders to skip
+        """
+        with self.write_lock:
+            cursor = self.conn.cursor()
+            query = '''
+                SELECT o.id, o.user_id, o.order_id, o.service_id, o.service_name, o.quantity, o.link,
+                       o.price, o.status, o.created_at, u.username, u.first_name, u.last_name
+                FROM orders o
+                LEFT JOIN users u ON u.user_id = o.user_id
+                WHERE o.status NOT IN ('reserved', 'released')
+            '''
+            params = []
+            if days is not None:
+                query += " AND o.created_at >= datetime('now', ?)"
+                params.append(f'-{days} days')
+            query += ' ORDER BY o.created_at DESC LIMIT ? OFFSET ?'
+            params.extend([limit, offset])
+            cursor.execute(query, params)
             
-            # Invalidate services cache
-            self.invalidate_services_cache()
+            orders = []
+            for row in cursor.fetchall():
+                orders.append({
+                    'id': row[0],
+                    'user_id': row[1],
+                    'order_id': row[2],
+                    'service_id': row[3],
+                    'service_name': row[4],
+                    'quantity': row[5],
+                    'link': row[6],
+                    'price': row[7],
+                    'status': row[8],
+                    'created_at': row[9],
+                    'username': row[10],
+                    'first_name': row[11],
+                    'last_name': row[12]
+                })
             
-            return True
-        except Exception as e:
-            logger.error(f"Error setting service price override: {e}")
-            return False
+            return orders
+
+    def set_service_price_override(self, service_id, original_price, custom_price, admin_id):
+        """Set a custom price for a service"""
+        with self.write_lock:
+            cursor = self.conn.cursor()
+            try:
+                cursor.execute(
+                    '''INSERT OR REPLACE INTO service_price_overrides 
+                       (service_id, original_price, custom_price, updated_at, updated_by)
+                       VALUES (?, ?, ?, ?, ?)''',
+                    (service_id, original_price, custom_price, datetime.now(), admin_id)
+                )
+                self.conn.commit()
+                
+                # Invalidate services cache
+                self.invalidate_services_cache()
+                
+                return True
+            except Exception as e:
+                logger.error(f"Error setting service price override: {e}")
+                return False
     
     def get_service_price_override(self, service_id):
         """Get the custom price for a service if it exists"""
-        cursor = self.conn.cursor()
-        cursor.execute(
-            'SELECT custom_price FROM service_price_overrides WHERE service_id = ?',
-            (service_id,)
-        )
-        result = cursor.fetchone()
-        return result[0] if result else None
+        with self.write_lock:
+            cursor = self.conn.cursor()
+            cursor.execute(
+                'SELECT custom_price FROM service_price_overrides WHERE service_id = ?',
+                (service_id,)
+            )
+            result = cursor.fetchone()
+            return result[0] if result else None
     
     def get_all_service_price_overrides(self):
         """Get all service price overrides"""
-        cursor = self.conn.cursor()
-        cursor.execute(
-            '''SELECT service_id, original_price, custom_price, updated_at, updated_by 
-               FROM service_price_overrides
-               ORDER BY updated_at DESC'''
-        )
-        overrides = cursor.fetchall()
-        return [{
-            'service_id': o[0],
-            'original_price': o[1],
-            'custom_price': o[2],
-            'updated_at': o[3],
-            'updated_by': o[4]
-        } for o in overrides]
+        with self.write_lock:
+            cursor = self.conn.cursor()
+            cursor.execute(
+                '''SELECT service_id, original_price, custom_price, updated_at, updated_by 
+                   FROM service_price_overrides
+                   ORDER BY updated_at DESC'''
+            )
+            overrides = cursor.fetchall()
+            return [{
+                'service_id': o[0],
+                'original_price': o[1],
+                'custom_price': o[2],
+                'updated_at': o[3],
+                'updated_by': o[4]
+            } for o in overrides]
     
     def delete_service_price_override(self, service_id):
         """Delete a service price override"""
-        cursor = self.conn.cursor()
-        try:
-            cursor.execute(
-                'DELETE FROM service_price_overrides WHERE service_id = ?',
-                (service_id,)
-            )
-            self.conn.commit()
-            
-            # Invalidate services cache
-            self.invalidate_services_cache()
-            
-            return True
-        except Exception as e:
-            logger.error(f"Error deleting service price override: {e}")
-            return False
+        with self.write_lock:
+            cursor = self.conn.cursor()
+            try:
+                cursor.execute(
+                    'DELETE FROM service_price_overrides WHERE service_id = ?',
+                    (service_id,)
+                )
+                self.conn.commit()
+                
+                # Invalidate services cache
+                self.invalidate_services_cache()
+                
+                return True
+            except Exception as e:
+                logger.error(f"Error deleting service price override: {e}")
+                return False
     
     def update_service_prices_by_range(self, min_price, max_price, percentage, admin_id):
         """Update prices for services within a price range by a percentage"""
-        # This will be implemented in the API client
-        # We'll just record the range adjustment in the database for reference
-        cursor = self.conn.cursor()
-        try:
-            # Create a record of the bulk update
-            cursor.execute(
-                '''INSERT INTO settings 
-                   (key, value, updated_at) 
-                   VALUES (?, ?, ?)''',
-                (f"price_range_update_{datetime.now().strftime('%Y%m%d%H%M%S')}", 
-                 json.dumps({
-                     'min_price': min_price,
-                     'max_price': max_price,
-                     'percentage': percentage,
-                     'admin_id': admin_id,
-                     'timestamp': datetime.now().isoformat()
-                 }),
-                 datetime.now())
-            )
-            self.conn.commit()
-            
-            # Invalidate services cache
-            self.invalidate_services_cache()
-            
-            return True
-        except Exception as e:
-            logger.error(f"Error recording price range update: {e}")
-            return False
+        with self.write_lock:
+            # This will be implemented in the API client
+            # We'll just record the range adjustment in the database for reference
+            cursor = self.conn.cursor()
+            try:
+                # Create a record of the bulk update
+                cursor.execute(
+                    '''INSERT INTO settings 
+                       (key, value, updated_at) 
+                       VALUES (?, ?, ?)''',
+                    (f"price_range_update_{datetime.now().strftime('%Y%m%d%H%M%S')}", 
+                     json.dumps({
+                         'min_price': min_price,
+                         'max_price': max_price,
+                         'percentage': percentage,
+                         'admin_id': admin_id,
+                         'timestamp': datetime.now().isoformat()
+                     }),
+                     datetime.now())
+                )
+                self.conn.commit()
+                
+                # Invalidate services cache
+                self.invalidate_services_cache()
+                
+                return True
+            except Exception as e:
+                logger.error(f"Error recording price range update: {e}")
+                return False
     
     def invalidate_services_cache(self):
         """Invalidate the services cache to ensure fresh data is fetched"""
@@ -1076,100 +2493,98 @@ class Database:
     # Tutorial system functions
     def get_tutorial_content(self, tutorial_id):
         """Get tutorial content from database"""
-        try:
-            conn = sqlite3.connect(os.getenv('DB_FILE', 'data/smm_bot.db'), check_same_thread=False)
-            cursor = conn.cursor()
-            cursor.execute("SELECT text FROM tutorials WHERE tutorial_id = ?", (tutorial_id,))
-            result = cursor.fetchone()
-            conn.close()
-            
-            if result:
-                return {'text': result[0]}
-            return None
-        except Exception as e:
-            logger.error(f"Error getting tutorial content: {e}")
-            return None
+        with self.write_lock:
+            try:
+                cursor = self.conn.cursor()
+                cursor.execute("SELECT text FROM tutorials WHERE tutorial_id = ?", (tutorial_id,))
+                result = cursor.fetchone()
+                
+                if result:
+                    return {'text': result[0]}
+                return None
+            except Exception as e:
+                logger.error(f"Error getting tutorial content: {e}")
+                return None
     
     def update_tutorial_text(self, tutorial_id, new_text):
         """Update the text content of a tutorial"""
-        try:
-            conn = sqlite3.connect(os.getenv('DB_FILE', 'data/smm_bot.db'), check_same_thread=False)
-            cursor = conn.cursor()
-            cursor.execute("UPDATE tutorials SET text = ? WHERE tutorial_id = ?", (new_text, tutorial_id))
-            conn.commit()
-            conn.close()
-            logger.info(f"Updated tutorial {tutorial_id} with new text")
-            return True
-        except Exception as e:
-            logger.error(f"Error updating tutorial content: {e}")
-            return False
+        with self.write_lock:
+            try:
+                cursor = self.conn.cursor()
+                cursor.execute("UPDATE tutorials SET text = ? WHERE tutorial_id = ?", (new_text, tutorial_id))
+                self.conn.commit()
+                logger.info(f"Updated tutorial {tutorial_id} with new text")
+                return True
+            except Exception as e:
+                logger.error(f"Error updating tutorial content: {e}")
+                self.conn.rollback()
+                return False
     
     def get_tutorial_media(self, tutorial_id):
         """Get all media files associated with a tutorial"""
-        try:
-            conn = sqlite3.connect(os.getenv('DB_FILE', 'data/smm_bot.db'), check_same_thread=False)
-            cursor = conn.cursor()
-            cursor.execute("SELECT type, file_id, caption, id FROM tutorial_media WHERE tutorial_id = ? ORDER BY id ASC", (tutorial_id,))
-            results = cursor.fetchall()
-            conn.close()
-            
-            media_files = []
-            for row in results:
-                media_files.append({
-                    'type': row[0],
-                    'file_id': row[1],
-                    'caption': row[2] if row[2] else '',
-                    'id': row[3]
-                })
-            
-            return media_files
-        except Exception as e:
-            logger.error(f"Error getting tutorial media: {e}")
-            return []
+        with self.write_lock:
+            try:
+                cursor = self.conn.cursor()
+                cursor.execute("SELECT type, file_id, caption, id FROM tutorial_media WHERE tutorial_id = ? ORDER BY id ASC", (tutorial_id,))
+                results = cursor.fetchall()
+                
+                media_files = []
+                for row in results:
+                    media_files.append({
+                        'type': row[0],
+                        'file_id': row[1],
+                        'caption': row[2] if row[2] else '',
+                        'id': row[3]
+                    })
+                
+                return media_files
+            except Exception as e:
+                logger.error(f"Error getting tutorial media: {e}")
+                return []
     
     def add_tutorial_media(self, tutorial_id, media_type, file_id, caption=""):
         """Add a media file to a tutorial"""
-        try:
-            conn = sqlite3.connect(os.getenv('DB_FILE', 'data/smm_bot.db'), check_same_thread=False)
-            cursor = conn.cursor()
-            cursor.execute(
-                "INSERT INTO tutorial_media (tutorial_id, type, file_id, caption) VALUES (?, ?, ?, ?)",
-                (tutorial_id, media_type, file_id, caption)
-            )
-            conn.commit()
-            conn.close()
-            logger.info(f"Added {media_type} media to tutorial {tutorial_id}")
-            return True
-        except Exception as e:
-            logger.error(f"Error adding tutorial media: {e}")
-            return False
+        with self.write_lock:
+            try:
+                cursor = self.conn.cursor()
+                cursor.execute(
+                    "INSERT INTO tutorial_media (tutorial_id, type, file_id, caption) VALUES (?, ?, ?, ?)",
+                    (tutorial_id, media_type, file_id, caption)
+                )
+                self.conn.commit()
+                logger.info(f"Added {media_type} media to tutorial {tutorial_id}")
+                return True
+            except Exception as e:
+                logger.error(f"Error adding tutorial media: {e}")
+                self.conn.rollback()
+                return False
     
     def delete_tutorial_media(self, tutorial_id, media_index):
         """Delete a media file from a tutorial by index"""
-        try:
-            conn = sqlite3.connect(os.getenv('DB_FILE', 'data/smm_bot.db'), check_same_thread=False)
-            cursor = conn.cursor()
-            
-            # Get all media for this tutorial
-            cursor.execute("SELECT id FROM tutorial_media WHERE tutorial_id = ? ORDER BY id ASC", (tutorial_id,))
-            media_ids = cursor.fetchall()
-            
-            if media_index < 0 or media_index >= len(media_ids):
+        with self.write_lock:
+            try:
+                cursor = self.conn.cursor()
+                
+                # Get all media for this tutorial
+                cursor.execute("SELECT id FROM tutorial_media WHERE tutorial_id = ? ORDER BY id ASC", (tutorial_id,))
+                media_ids = cursor.fetchall()
+                
+                if media_index < 0 or media_index >= len(media_ids):
+                    return False
+                
+                # Get the actual media ID
+                media_id = media_ids[media_index][0]
+                
+                # Delete the media
+                cursor.execute("DELETE FROM tutorial_media WHERE id = ?", (media_id,))
+                self.conn.commit()
+                
+                logger.info(f"Deleted media from tutorial {tutorial_id}")
+                return True
+            except Exception as e:
+                logger.error(f"Error deleting tutorial media: {e}")
+                self.conn.rollback()
                 return False
-            
-            # Get the actual media ID
-            media_id = media_ids[media_index][0]
-            
-            # Delete the media
-            cursor.execute("DELETE FROM tutorial_media WHERE id = ?", (media_id,))
-            conn.commit()
-            conn.close()
-            
-            logger.info(f"Deleted media from tutorial {tutorial_id}")
-            return True
-        except Exception as e:
-            logger.error(f"Error deleting tutorial media: {e}")
-            return False
     
     def initialize_tutorials(self):
         """Initialize tutorials with default content"""
@@ -1374,29 +2789,30 @@ This tutorial will show you how to contact our support team.
 
     def get_user_by_username(self, username):
         """Get user by username"""
-        if not username:
-            return None
-            
-        cursor = self.conn.cursor()
-        # Case-insensitive search to be more user-friendly
-        cursor.execute('SELECT * FROM users WHERE LOWER(username) = LOWER(?)', (username,))
-        user = cursor.fetchone()
-        
-        if not user:
-            return None
+        with self.write_lock:
+            if not username:
+                return None
+                
+            cursor = self.conn.cursor()
+            # Case-insensitive search to be more user-friendly
+            cursor.execute('SELECT * FROM users WHERE LOWER(username) = LOWER(?)', (username,))
+            user = cursor.fetchone()
             
-        return {
-            'user_id': user[0],
-            'username': user[1],
-            'first_name': user[2],
-            'last_name': user[3],
-            'balance': user[4],
-            'last_activity': user[5],
-            'created_at': user[6],
-            'currency_preference': user[7] if len(user) > 7 else 'USD',
-            'language': user[8] if len(user) > 8 else 'en',
-            'referred_by': user[9] if len(user) > 9 else None
-        }
+            if not user:
+                return None
+                
+            return {
+                'user_id': user[0],
+                'username': user[1],
+                'first_name': user[2],
+                'last_name': user[3],
+                'balance': user[4],
+                'last_activity': user[5],
+                'created_at': user[6],
+                'currency_preference': user[7] if len(user) > 7 else 'USD',
+                'language': user[8] if len(user) > 8 else 'en',
+                'referred_by': user[9] if len(user) > 9 else None
+            }
 
 # Create global database instance
 db = Database() 
\ No newline at end of file
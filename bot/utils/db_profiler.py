@@ -0,0 +1,172 @@
+import os
+import re
+import sys
+import time
+import logging
+import threading
+from functools import lru_cache
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Literals and whitespace are folded so the same statement is counted once
+_NUMBER_PATTERN = re.compile(r'\b\d+(\.\d+)?\b')
+_WHITESPACE_PATTERN = re.compile(r'\s+')
+
+@lru_cache(maxsize=4096)
+def normalize_statement(sql):
+    """Statement text with numbers replaced by ? and whitespace collapsed"""
+    return _WHITESPACE_PATTERN.sub(' ', _NUMBER_PATTERN.sub('?', sql)).strip()
+
+class QueryProfiler:
+    """Per-statement and per-lock-holder timings of the Database
+
+    Disabled unless SQLITE_PROFILE is set. While enabled, every statement
+    run through the database cursors is recorded (calls, total and max
+    time, rows), the write lock records how long each Database method
+    waited for and held it, and statements slower than slow_threshold
+    seconds are logged with their EXPLAIN QUERY PLAN (once per statement).
+    """
+
+    def __init__(self, enabled=False, slow_threshold=0.1):
+        self.enabled = enabled
+        self.slow_threshold = slow_threshold
+        self._statements = {}  # normalized SQL -> stats dict
+        self._locks = {}       # Database method -> stats dict
+        self._explained = set()
+        self._lock = threading.Lock()
+
+    def record(self, sql, elapsed, rows=0):
+        """Record one execution of a statement
+
+        Returns:
+            bool: True if the statement was slow and has not been explained yet
+        """
+        key = normalize_statement(sql)
+        with self._lock:
+            stats = self._statements.get(key)
+            if stats is None:
+                stats = self._statements[key] = {'calls': 0, 'total': 0.0, 'max': 0.0, 'rows': 0}
+            stats['calls'] += 1
+            stats['total'] += elapsed
+            stats['max'] = max(stats['max'], elapsed)
+            stats['rows'] += rows
+            if elapsed < self.slow_threshold or key in self._explained:
+                return False
+            self._explained.add(key)
+            return True
+
+    def add_rows(self, sql, rows):
+        """Count rows fetched after the statement was recorded"""
+        key = normalize_statement(sql)
+        with self._lock:
+            stats = self._statements.get(key)
+            if stats is not None:
+                stats['rows'] += rows
+
+    def record_lock(self, method, wait, hold):
+        """Record a write lock acquisition by a Database method"""
+        with self._lock:
+            stats = self._locks.get(method)
+            if stats is None:
+                stats = self._locks[method] = {'acquired': 0, 'wait': 0.0, 'max_wait': 0.0, 'hold': 0.0, 'max_hold': 0.0}
+            stats['acquired'] += 1
+            stats['wait'] += wait
+            stats['max_wait'] = max(stats['max_wait'], wait)
+            stats['hold'] += hold
+            stats['max_hold'] = max(stats['max_hold'], hold)
+
+    def log_slow(self, connection, sql, parameters, elapsed):
+        """Log a slow statement with its query plan"""
+        plan = ""
+        if sql.lstrip().split(None, 1)[0].upper() in ('SELECT', 'UPDATE', 'DELETE', 'INSERT', 'WITH'):
+            try:
+                # A plain cursor, so explaining is not profiled itself
+                rows = connection.execute_unprofiled("EXPLAIN QUERY PLAN " + sql, parameters)
+                plan = "\n".join(f"  {row[-1]}" for row in rows)
+            except Exception as e:
+                plan = f"  (no plan: {e})"
+        logger.warning(f"Slow query ({elapsed * 1000:.1f} ms): {normalize_statement(sql)}\n{plan}")
+
+    def top(self, n=10, sort_by='total'):
+        """The n statements with the highest total (or max, calls, rows)"""
+        with self._lock:
+            items = [dict(stats, sql=sql) for sql, stats in self._statements.items()]
+        items.sort(key=lambda stats: stats[sort_by], reverse=True)
+        return items[:n]
+
+    def lock_holders(self):
+        """Write lock wait and hold time per Database method, longest hold first"""
+        with self._lock:
+            items = [dict(stats, method=method) for method, stats in self._locks.items()]
+        items.sort(key=lambda stats: stats['hold'], reverse=True)
+        return items
+
+    def reset(self):
+        with self._lock:
+            self._statements.clear()
+            self._locks.clear()
+            self._explained.clear()
+
+    def report(self, n=10):
+        """Plain-text report of the top statements and write lock holders"""
+        lines = [f"Top {n} statements by total time:"]
+        for stats in self.top(n):
+            average = stats['total'] / stats['calls'] * 1000
+            lines.append(
+                f"{stats['total'] * 1000:9.1f} ms  {stats['calls']:6d}x  avg {average:7.2f} ms  "
+                f"max {stats['max'] * 1000:7.1f} ms  rows {stats['rows']}\n    {stats['sql'][:200]}"
+            )
+        holders = self.lock_holders()
+        if holders:
+            lines.append("")
+            lines.append("Write lock by method (hold / wait):")
+            for stats in holders[:n]:
+                lines.append(
+                    f"{stats['method']:<32} {stats['acquired']:6d}x  hold {stats['hold'] * 1000:9.1f} ms "
+                    f"(max {stats['max_hold'] * 1000:.1f})  wait {stats['wait'] * 1000:9.1f} ms "
+                    f"(max {stats['max_wait'] * 1000:.1f})"
+                )
+        return "\n".join(lines)
+
+class ProfiledLock:
+    """Re-entrant lock that reports wait and hold time per calling method to the profiler"""
+
+    def __init__(self, profiler):
+        self.profiler = profiler
+        self._lock = threading.RLock()
+        self._local = threading.local()
+
+    def __enter__(self):
+        depth = getattr(self._local, 'depth', 0)
+        start = time.perf_counter()
+        self._lock.acquire()
+        if depth == 0:
+            # Only the outermost acquisition is attributed
+            self._local.method = sys._getframe(1).f_code.co_name
+            self._local.wait = time.perf_counter() - start
+            self._local.acquired_at = time.perf_counter()
+        self._local.depth = depth + 1
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._local.depth -= 1
+        if self._local.depth == 0:
+            hold = time.perf_counter() - self._local.acquired_at
+            self.profiler.record_lock(self._local.method, self._local.wait, hold)
+        self._lock.release()
+
+    def acquire(self, blocking=True, timeout=-1):
+        return self._lock.acquire(blocking, timeout)
+
+    def release(self):
+        self._lock.release()
+
+# Create a singleton instance
+profiler = QueryProfiler(
+    enabled=os.getenv("SQLITE_PROFILE", "false").lower() in ("1", "true", "yes"),
+    slow_threshold=float(os.getenv("SQLITE_SLOW_QUERY_MS", "100")) / 1000
+)
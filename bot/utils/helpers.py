@@ -17,6 +17,21 @@ def chunk_list(lst, chunk_size):
     """Split a list into chunks of the specified size"""
     return [lst[i:i + chunk_size] for i in range(0, len(lst), chunk_size)]
 
+def format_sparkline(values, max_width=30):
+    """Render a list of numbers as a unicode sparkline, merging buckets to fit max_width"""
+    if not values:
+        return ""
+    
+    # Sum adjacent values so long series fit in max_width characters
+    bucket_size = max(1, -(-len(values) // max_width))  # Ceiling division
+    buckets = [sum(values[i:i + bucket_size]) for i in range(0, len(values), bucket_size)]
+    
+    bars = "▁▂▃▄▅▆▇█"
+    highest = max(buckets)
+    if highest <= 0:
+        return bars[0] * len(buckets)
+    return "".join(bars[min(len(bars) - 1, int(value * (len(bars) - 1) / highest + 0.5))] for value in buckets)
+
 def create_service_keyboard(services, page=0, items_per_page=10, include_back=False, user_id=None):
     """Create a keyboard with services for the specified page"""
     keyboard = []
@@ -192,6 +207,78 @@ def format_service_details(service, user_id=None, language='en'):
     
     return service_text
 
+def calculate_order_price(service, quantity):
+    """Calculate the USD price the user pays for quantity units of a service"""
+    if "increased_rate" in service:
+        rate = service.get("increased_rate", 0)
+    else:
+        rate = service.get("rate", 0)
+        # Convert rate to float if it's a string
+        if isinstance(rate, str):
+            try:
+                rate = float(rate)
+            except (ValueError, TypeError):
+                rate = 0
+        
+        # Custom prices are used as-is, everything else gets the standard markup
+        if not (service.get('skip_markup', False) or service.get('has_custom_price', False)):
+            original_price_per_1k = rate/1000
+            if original_price_per_1k < 1:
+                increased_price = original_price_per_1k * 2  # 100% increase
+            else:
+                increased_price = original_price_per_1k * 1.5  # 50% increase
+            
+            rate = increased_price * 1000
+    
+    return (rate * quantity) / 1000
+
+def format_mass_order_report(rows, language='en', max_length=3500):
+    """Format the per-line result of a mass order
+    
+    Args:
+        rows (list): Jobs of the batch as returned by db.get_order_batch
+        language (str): The user's language
+        max_length (int): Maximum length of the line list before it is cut off
+    
+    Returns:
+        tuple: (message text, number of lines left out of the message)
+    """
+    placed = [row for row in rows if row['order_id']]
+    failed = [row for row in rows if not row['order_id'] and row['status'] == 'failed']
+    refunded = sum(row['price'] or 0.0 for row in failed)
+    etb_refunded = refunded * CURRENCY_RATES["ETB"]
+    
+    lines = []
+    for row in rows:
+        if row['order_id']:
+            lines.append(f"{row['batch_line']}. ✅ <code>{row['order_id']}</code> - {row['service_name']} x{row['quantity']}")
+        elif row['status'] == 'needs_reconciliation':
+            # Not refunded, the panel may have placed it
+            lines.append(f"{row['batch_line']}. ⚠️ {row['service_name']} x{row['quantity']}: {row['last_error'] or 'Being checked'}")
+        else:
+            lines.append(f"{row['batch_line']}. ❌ {row['service_name']} x{row['quantity']}: {row['last_error'] or 'Unknown error'}")
+    
+    # Keep the message under Telegram's limit
+    shown = []
+    length = 0
+    for line in lines:
+        if length + len(line) + 1 > max_length:
+            break
+        shown.append(line)
+        length += len(line) + 1
+    omitted = len(lines) - len(shown)
+    
+    text = get_message(language, 'mass_order', 'report').format(
+        placed=len(placed),
+        total=len(rows),
+        failed=len(failed),
+        refund_display=f"${refunded:.6f} / ETB {etb_refunded:.2f}",
+        lines="\n".join(shown)
+    )
+    if omitted:
+        text += get_message(language, 'mass_order', 'report_truncated').format(count=omitted)
+    return text, omitted
+
 def format_order_details(order, service_info=None, user_id=None):
     """Format order details for display"""
     # Get user's currency preference if user_id is provided
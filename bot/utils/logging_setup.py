@@ -0,0 +1,247 @@
+import os
+import re
+import json
+import time
+import queue
+import atexit
+import random
+import logging
+import threading
+import traceback
+from logging.handlers import QueueHandler, QueueListener
+
+# Attributes every LogRecord has; anything else was passed in extra= and is kept as a field
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+# Secrets that can end up in logged params, responses or URLs
+_REDACT_PATTERNS = [
+    # 'key': 'abc' / "key": "abc" in logged dicts
+    (re.compile(r"""(['"](?:key|api_key|token|password)['"]\s*:\s*)(['"])[^'"]*\2""", re.IGNORECASE), r"\1\2[REDACTED]\2"),
+    # key=abc in query strings and form bodies
+    (re.compile(r"\b(key|api_key|token|password)=[^&\s'\"]+", re.IGNORECASE), r"\1=[REDACTED]"),
+    # Telegram bot tokens, e.g. in api.telegram.org/bot<token>/ URLs
+    (re.compile(r"(?<![0-9])\d{6,12}:[A-Za-z0-9_-]{30,}"), "[REDACTED]"),
+]
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line with the time, level, logger, message and extra fields"""
+
+    def format(self, record):
+        entry = {
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(record.created)) + f".{int(record.msecs):03d}",
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            'thread': record.threadName,
+            'location': f"{record.module}:{record.lineno}"
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRIBUTES and key not in entry:
+                entry[key] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry['exception'] = record.exc_text
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+class RedactingFilter(logging.Filter):
+    """Masks API keys, bot tokens and key=... values in messages and tracebacks"""
+
+    def __init__(self, secrets=()):
+        super().__init__()
+        # Longest first so a secret containing another is masked whole
+        self.secrets = sorted({secret for secret in secrets if secret and len(secret) >= 6}, key=len, reverse=True)
+
+    def redact(self, text):
+        for secret in self.secrets:
+            if secret in text:
+                text = text.replace(secret, "[REDACTED]")
+        for pattern, replacement in _REDACT_PATTERNS:
+            text = pattern.sub(replacement, text)
+        return text
+
+    def filter(self, record):
+        record.msg = self.redact(record.getMessage())
+        record.args = None
+        if record.exc_text:
+            record.exc_text = self.redact(record.exc_text)
+        return True
+
+class SamplingFilter(logging.Filter):
+    """Drops part of the repetitive records below WARNING before they are queued
+
+    Two rules apply to DEBUG and INFO records, warnings and errors always pass:
+    - sample_rates maps a logger name (or a parent like "handlers") to the
+      share of its records that are kept, e.g. {"utils.api_client": 0.1}
+    - rate_limit caps the records per second from one call site (file and
+      line); the number suppressed is added to the next record that passes
+    """
+
+    def __init__(self, sample_rates=None, rate_limit=0):
+        super().__init__()
+        self.sample_rates = dict(sample_rates or {})
+        self.rate_limit = rate_limit
+        self.sampled_out = 0
+        self.rate_limited = 0
+        self._rates = {}  # logger name -> rate, resolved once per name
+        self._sites = {}  # (pathname, lineno) -> [window start, count, suppressed]
+        self._lock = threading.Lock()
+
+    def _sample_rate(self, name):
+        rate = self._rates.get(name)
+        if rate is None:
+            rate = 1.0
+            parts = name.split(".")
+            for i in range(len(parts), 0, -1):
+                prefix = ".".join(parts[:i])
+                if prefix in self.sample_rates:
+                    rate = self.sample_rates[prefix]
+                    break
+            self._rates[name] = rate
+        return rate
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING:
+            return True
+
+        rate = self._sample_rate(record.name)
+        if rate < 1.0 and random.random() >= rate:
+            self.sampled_out += 1
+            return False
+
+        if self.rate_limit:
+            site = (record.pathname, record.lineno)
+            now = record.created
+            with self._lock:
+                window = self._sites.get(site)
+                if window is None or now - window[0] >= 1.0:
+                    suppressed = window[2] if window else 0
+                    window = self._sites[site] = [now, 0, 0]
+                    if suppressed:
+                        record.suppressed = suppressed
+                if window[1] >= self.rate_limit:
+                    window[2] += 1
+                    self.rate_limited += 1
+                    return False
+                window[1] += 1
+        return True
+
+class DroppingQueueHandler(QueueHandler):
+    """QueueHandler on a bounded queue that drops records instead of blocking when it is full"""
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+        self.queued = 0
+
+    def handle(self, record):
+        # Queue.put is thread-safe, so records are queued without taking the handler lock
+        if self.filter(record):
+            self.emit(record)
+            return True
+        return False
+
+    def prepare(self, record):
+        # Merge the arguments now, they may change before the listener formats the record;
+        # the traceback is rendered here too since exc_info can't be kept for later
+        record.message = record.getMessage()
+        if record.exc_info:
+            record.exc_text = "".join(traceback.format_exception(*record.exc_info)).rstrip()
+        record.msg = record.message
+        record.args = None
+        record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+            self.queued += 1
+        except queue.Full:
+            self.dropped += 1
+
+class DrainingQueueListener(QueueListener):
+    """QueueListener whose stop waits for room in a full queue instead of failing"""
+
+    def enqueue_sentinel(self):
+        self.queue.put(self._sentinel)
+
+# The pipeline installed by setup_logging()
+_pipeline = {'handler': None, 'sampler': None, 'listener': None}
+
+def _parse_sample_rates(value):
+    """Parse "utils.api_client=0.1,handlers=0.5" into a dict"""
+    rates = {}
+    for item in (value or "").split(","):
+        if "=" not in item:
+            continue
+        name, rate = item.split("=", 1)
+        try:
+            rates[name.strip()] = min(max(float(rate), 0.0), 1.0)
+        except ValueError:
+            continue
+    return rates
+
+def setup_logging():
+    """Route all logging through a bounded queue to a background writer thread
+
+    Handlers only pay for the level check, sampling and a queue put; the
+    listener thread redacts, formats (JSON unless LOG_FORMAT=text) and writes
+    to stderr. Configured with LOG_LEVEL, LOG_FORMAT, LOG_QUEUE_SIZE,
+    LOG_SAMPLE and LOG_RATE_LIMIT.
+
+    Returns:
+        DrainingQueueListener: The running listener, stopped at exit by stop_logging()
+    """
+    if _pipeline['listener'] is not None:
+        return _pipeline['listener']
+
+    if os.getenv("LOG_FORMAT", "json").lower() == "text":
+        formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    else:
+        formatter = JsonFormatter()
+
+    stream_handler = logging.StreamHandler()
+    stream_handler.setFormatter(formatter)
+    stream_handler.addFilter(RedactingFilter([os.getenv("API_KEY"), os.getenv("TELEGRAM_BOT_TOKEN")]))
+
+    sampler = SamplingFilter(
+        sample_rates=_parse_sample_rates(os.getenv("LOG_SAMPLE", "")),
+        rate_limit=int(os.getenv("LOG_RATE_LIMIT", "20"))
+    )
+    queue_handler = DroppingQueueHandler(queue.Queue(maxsize=int(os.getenv("LOG_QUEUE_SIZE", "10000"))))
+    queue_handler.addFilter(sampler)
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(os.getenv("LOG_LEVEL", "INFO").upper())
+
+    listener = DrainingQueueListener(queue_handler.queue, stream_handler)
+    listener.start()
+    atexit.register(stop_logging)
+
+    _pipeline.update(handler=queue_handler, sampler=sampler, listener=listener)
+    return listener
+
+def stop_logging():
+    """Write the queued records and stop the listener thread"""
+    listener = _pipeline['listener']
+    if listener is None:
+        return
+    _pipeline['listener'] = None
+    listener.stop()
+
+def get_logging_stats():
+    """Records queued, dropped on a full queue, sampled out and rate limited"""
+    handler = _pipeline['handler']
+    sampler = _pipeline['sampler']
+    if handler is None:
+        return {}
+    return {
+        'queued': handler.queued,
+        'dropped': handler.dropped,
+        'queue_size': handler.queue.qsize(),
+        'sampled_out': sampler.sampled_out,
+        'rate_limited': sampler.rate_limited
+    }
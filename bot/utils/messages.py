@@ -122,6 +122,7 @@ MESSAGES = {
         },
         'order': {
             'processing': "⏳ <b>Processing Order...</b>\n\nYour order is being placed on the website. Please wait...",
+            'queued': "🕒 <b>Order Queued</b>\n\nService: {service_name}\nQuantity: {quantity}\nPrice: {price_display}\n\nYour order has been queued and will be submitted to the website shortly. This message will be updated with the order ID.",
             'success': "✅ <b>Order Placed Successfully!{admin_note}</b>\n\nOrder ID: <code>{order_id}</code>\nService: {service_name}\nQuantity: {quantity}\nPrice: {price_display}\n\nYour order has been submitted to the website and is being processed.\nYou can check the status of your order with /status command.",
             'failed': "❌ <b>Order Failed</b>\n\nError: {error_message}\n\nYour order could not be placed on the website. Please try again later or contact support.",
             'error': "❌ <b>Order Failed</b>\n\nAn unexpected error occurred: {error}\n\nPlease try again later or contact support.",
@@ -188,6 +189,39 @@ MESSAGES = {
             'add_media': "🖼️ Add Media",
             'delete_media': "🗑️ Delete Media",
             'no_content': "This tutorial is currently being updated. Please check back later."
+        },
+        'mass_order': {
+            'instructions': "📦 <b>Mass Order</b>\n\nSend one order per line in the format:\n<code>service_id | link | quantity</code>\n\nYou can also upload a .csv or .txt file with the same columns. Up to {max_lines} lines per batch.\n\nSend /cancel to stop.",
+            'empty': "⚠️ No order lines found. Please send lines in the format <code>service_id | link | quantity</code>.",
+            'too_many_lines': "⚠️ Too many lines ({count}). The maximum per batch is {max_lines}.",
+            'invalid_file': "⚠️ Please upload a .csv or .txt file smaller than {max_kb} KB.",
+            'summary': "📋 <b>Mass Order Summary</b>\n\nValid lines: {valid}\nRejected lines: {rejected}\nTotal price: {price_display}\nYour balance: {balance_display}\n\n{rejected_details}Please confirm to place the valid orders:",
+            'no_valid_lines': "❌ <b>No valid order lines</b>\n\n{rejected_details}",
+            'confirm_button': "✅ Confirm {count} Orders",
+            'cancel_button': "❌ Cancel",
+            'cancelled': "Mass order cancelled.",
+            'expired': "⚠️ This mass order has expired. Please send it again with /massorder.",
+            'already_submitted': "ℹ️ This batch has already been submitted.",
+            'queued': "🕒 <b>{count} Orders Queued</b>\n\nTotal: {price_display}\n\nThe orders are being submitted to the website. This message will be updated with a report for every line.",
+            'report': "📦 <b>Mass Order Report</b>\n\nPlaced: {placed}/{total}\nFailed: {failed} (refunded {refund_display})\n\n{lines}",
+            'report_truncated': "\n\n... {count} more lines, see the attached file."
+        },
+        'drip_feed': {
+            'instructions': "⏱ <b>Drip-feed Order</b>\n\nSpread a large order over time. Send one line in the format:\n<code>service_id | link | total quantity | quantity per run | minutes between runs</code>\n\nExample: <code>123 | https://t.me/channel | 10000 | 1000 | 60</code>\n\nSend /cancel to stop.",
+            'active_header': "📅 <b>Your active drip-feeds</b>\n\n",
+            'active_item': "#{id} {service_name}: {started}/{runs} runs of {slice_quantity} every {interval} min\n",
+            'invalid_format': "⚠️ Please send: <code>service_id | link | total quantity | quantity per run | minutes between runs</code>",
+            'invalid_plan': "⚠️ {reason}",
+            'summary': "📋 <b>Drip-feed Summary</b>\n\nService: {service_name}\nLink: {link}\nTotal: {total_quantity} in {runs} runs of {slice_quantity}\nEvery: {interval} minutes\nPrice: {price_display}\nYour balance: {balance_display}\n\nThe full price is reserved now. Runs that fail or are cancelled are refunded.",
+            'confirm_button': "✅ Schedule",
+            'cancel_button': "❌ Cancel",
+            'cancel_plan_button': "🛑 Cancel #{id}",
+            'cancelled': "Drip-feed cancelled.",
+            'expired': "⚠️ This drip-feed request has expired. Please send it again with /dripfeed.",
+            'scheduled': "✅ <b>Drip-feed #{id} scheduled</b>\n\n{runs} runs of {slice_quantity}, every {interval} minutes. The first run starts now.",
+            'plan_cancelled': "🛑 Drip-feed #{id} cancelled. {refund_display} refunded for the remaining runs.",
+            'not_found': "⚠️ Drip-feed not found or already finished.",
+            'completed': "✅ <b>Drip-feed #{id} completed</b>\n\n{service_name}: {placed}/{runs} runs placed. Failed runs were refunded."
         }
     },
     'en_uk': {  # English (UK)
@@ -305,6 +339,7 @@ MESSAGES = {
         },
         'order': {
             'processing': "⏳ <b>Processing Order...</b>\n\nYour order is being placed on the website. Please wait...",
+            'queued': "🕒 <b>Order Queued</b>\n\nService: {service_name}\nQuantity: {quantity}\nPrice: {price_display}\n\nYour order has been queued and will be submitted to the website shortly. This message will be updated with the order ID.",
             'success': "✅ <b>Order Placed Successfully!{admin_note}</b>\n\nOrder ID: <code>{order_id}</code>\nService: {service_name}\nQuantity: {quantity}\nPrice: {price_display}\n\nYour order has been submitted to the website and is being processed.\nYou can check the status of your order with /status command.",
             'failed': "❌ <b>Order Failed</b>\n\nError: {error_message}\n\nYour order could not be placed on the website. Please try again later or contact support.",
             'error': "❌ <b>Order Failed</b>\n\nAn unexpected error occurred: {error}\n\nPlease try again later or contact support.",
@@ -490,6 +525,7 @@ MESSAGES = {
         },
         'order': {
             'processing': "⏳ <b>ትዕዛዝ በማስኬድ ላይ...</b>\n\nትዕዛዝዎ በድህረ ገጹ ላይ እየተቀመጠ ነው። እባክዎ ይጠብቁ...",
+            'queued': "🕒 <b>ትዕዛዝ ተሰልፏል</b>\n\nአገልግሎት: {service_name}\nብዛት: {quantity}\nዋጋ: {price_display}\n\nትዕዛዝዎ ተሰልፏል እና በቅርቡ ለድህረ ገጹ ይላካል። ይህ መልእክት በትዕዛዝ መታወቂያው ይዘመናል።",
             'success': "✅ <b>ትዕዛዝ በተሳካ ሁኔታ ተቀምጧል!{admin_note}</b>\n\nየትዕዛዝ መታወቂያ: <code>{order_id}</code>\nአገልግሎት: {service_name}\nብዛት: {quantity}\nዋጋ: {price_display}\n\nትዕዛዝዎ ለድህረ ገጹ ተልኳል እና እየተካሄደ ነው።\nየትዕዛዝዎን ሁኔታ በ /status ትዕዛዝ መፈተሽ ይችላሉ።",
             'failed': "❌ <b>ትዕዛዝ አልተሳካም</b>\n\nስህተት: {error_message}\n\nትዕዛዝዎ በድህረ ገጹ ላይ ሊቀመጥ አልቻለም። እባክዎ ቆይተው እንደገና ይሞክሩ ወይም ድጋፍን ያግኙ።",
             'error': "❌ <b>ትዕዛዝ አልተሳካም</b>\n\nያልተጠበቀ ስህተት ተከስቷል: {error}\n\nእባክዎ ቆይተው እንደገና ይሞክሩ ወይም ድጋፍን ያግኙ።",
@@ -675,6 +711,7 @@ MESSAGES = {
         },
         'order': {
             'processing': "⏳ <b>جاري معالجة الطلب...</b>\n\nيتم وضع طلبك على الموقع. يرجى الانتظار...",
+            'queued': "🕒 <b>تمت إضافة الطلب إلى قائمة الانتظار</b>\n\nالخدمة: {service_name}\nالكمية: {quantity}\nالسعر: {price_display}\n\nسيتم إرسال طلبك إلى الموقع قريبًا. سيتم تحديث هذه الرسالة بمعرف الطلب.",
             'success': "✅ <b>تم وضع الطلب بنجاح!{admin_note}</b>\n\nمعرف الطلب: <code>{order_id}</code>\nالخدمة: {service_name}\nالكمية: {quantity}\nالسعر: {price_display}\n\nتم إرسال طلبك إلى الموقع وهو قيد المعالجة.\nيمكنك التحقق من حالة طلبك باستخدام أمر /status.",
             'failed': "❌ <b>فشل الطلب</b>\n\nخطأ: {error_message}\n\nتعذر وضع طلبك على الموقع. يرجى المحاولة مرة أخرى لاحقًا أو الاتصال بالدعم.",
             'error': "❌ <b>فشل الطلب</b>\n\nحدث خطأ غير متوقع: {error}\n\nيرجى المحاولة مرة أخرى لاحقًا أو الاتصال بالدعم.",
@@ -860,6 +897,7 @@ MESSAGES = {
         },
         'order': {
             'processing': "⏳ <b>ऑर्डर प्रोसेस हो रहा है...</b>\n\nआपका ऑर्डर वेबसाइट पर रखा जा रहा है। कृपया प्रतीक्षा करें...",
+            'queued': "🕒 <b>ऑर्डर कतार में है</b>\n\nसेवा: {service_name}\nमात्रा: {quantity}\nकीमत: {price_display}\n\nआपका ऑर्डर कतार में है और जल्द ही वेबसाइट पर भेजा जाएगा। यह संदेश ऑर्डर आईडी के साथ अपडेट किया जाएगा।",
             'success': "✅ <b>ऑर्डर सफलतापूर्वक रखा गया!{admin_note}</b>\n\nऑर्डर आईडी: <code>{order_id}</code>\nसेवा: {service_name}\nमात्रा: {quantity}\nकीमत: {price_display}\n\nआपका ऑर्डर वेबसाइट पर भेज दिया गया है और प्रोसेस किया जा रहा है।\nआप /status कमांड से अपने ऑर्डर की स्थिति जांच सकते हैं।",
             'failed': "❌ <b>ऑर्डर विफल</b>\n\nत्रुटि: {error_message}\n\nआपका ऑर्डर वेबसाइट पर नहीं रखा जा सका। कृपया बाद में पुनः प्रयास करें या सपोर्ट से संपर्क करें।",
             'error': "❌ <b>ऑर्डर विफल</b>\n\nएक अप्रत्याशित त्रुटि हुई: {error}\n\nकृपया बाद में पुनः प्रयास करें या सपोर्ट से संपर्क करें।",
@@ -1045,6 +1083,7 @@ MESSAGES = {
         },
         'order': {
             'processing': "⏳ <b>Procesando Pedido...</b>\n\nSu pedido está siendo colocado en el sitio web. Por favor espere...",
+            'queued': "🕒 <b>Pedido en Cola</b>\n\nServicio: {service_name}\nCantidad: {quantity}\nPrecio: {price_display}\n\nSu pedido está en cola y se enviará al sitio web en breve. Este mensaje se actualizará con el ID del pedido.",
             'success': "✅ <b>¡Pedido Realizado con Éxito!{admin_note}</b>\n\nID del Pedido: <code>{order_id}</code>\nServicio: {service_name}\nCantidad: {quantity}\nPrecio: {price_display}\n\nSu pedido ha sido enviado al sitio web y está siendo procesado.\nPuede verificar el estado de su pedido con el comando /status.",
             'failed': "❌ <b>Pedido Fallido</b>\n\nError: {error_message}\n\nSu pedido no pudo ser colocado en el sitio web. Por favor intente nuevamente más tarde o contacte a soporte.",
             'error': "❌ <b>Pedido Fallido</b>\n\nOcurrió un error inesperado: {error}\n\nPor favor intente nuevamente más tarde o contacte a soporte.",
@@ -1224,6 +1263,7 @@ MESSAGES = {
         },
         'order': {
             'processing': "⏳ <b>处理订单中...</b>\n\n您的订单正在网站上处理。请稍等...",
+            'queued': "🕒 <b>订单已排队</b>\n\n服务: {service_name}\n数量: {quantity}\n价格: {price_display}\n\n您的订单已进入队列，即将提交到网站。此消息将更新为订单ID。",
             'success': "✅ <b>订单成功提交！{admin_note}</b>\n\n订单ID: <code>{order_id}</code>\n服务: {service_name}\n数量: {quantity}\n价格: {price_display}\n\n您的订单已提交到网站，正在处理中。您可以使用 /status 命令检查订单状态。",
             'failed': "❌ <b>订单失败</b>\n\n错误: {error_message}\n\n您的订单无法在网站上提交。请稍后再试或联系支持。",
             'error': "❌ <b>订单失败</b>\n\n发生了意外错误: {error}\n\n请稍后再试或联系支持。",
@@ -1382,6 +1422,7 @@ MESSAGES = {
         },
         'order': {
             'processing': "⏳ <b>Sipariş İşleniyor...</b>\n\nSiparişiniz web sitesine yerleştiriliyor. Lütfen bekleyin...",
+            'queued': "🕒 <b>Sipariş Sıraya Alındı</b>\n\nHizmet: {service_name}\nMiktar: {quantity}\nFiyat: {price_display}\n\nSiparişiniz sıraya alındı ve kısa süre içinde web sitesine gönderilecek. Bu mesaj sipariş kimliği ile güncellenecektir.",
             'success': "✅ <b>Sipariş Başarıyla Verildi!{admin_note}</b>\n\nSipariş ID: <code>{order_id}</code>\nHizmet: {service_name}\nMiktar: {quantity}\nFiyat: {price_display}\n\nSiparişiniz web sitesine gönderildi ve işleniyor.\nSiparişinizin durumunu /status komutuyla kontrol edebilirsiniz.",
             'failed': "❌ <b>Sipariş Başarısız</b>\n\nHata: {error_message}\n\nSiparişiniz web sitesine yerleştirilemedi. Lütfen daha sonra tekrar deneyin veya destek ile iletişime geçin.",
             'error': "❌ <b>Sipariş Başarısız</b>\n\nBeklenmeyen bir hata oluştu: {error}\n\nLütfen daha sonra tekrar deneyin veya destek ile iletişime geçin.",
@@ -1463,21 +1504,17 @@ def get_message(language, key, subkey=None, default=None):
     Returns:
         str: The message in the specified language
     """
-    logger.info(f"get_message called with language={language}, key={key}, subkey={subkey}")
-    
     if language not in MESSAGES:
         logger.warning(f"Language {language} not found in MESSAGES, defaulting to 'en'")
         language = 'en'  # Default to English if language not found
     
     if subkey is None:
         result = MESSAGES[language].get(key, MESSAGES['en'].get(key, default or ''))
-        logger.info(f"Returning message for {language}.{key}: {result}")
         return result
     
     # Handle nested keys
     if key in MESSAGES[language] and isinstance(MESSAGES[language][key], dict) and subkey in MESSAGES[language][key]:
         result = MESSAGES[language][key][subkey]
-        logger.info(f"Returning message for {language}.{key}.{subkey}: {result}")
         return result
     
     # Fallback to English if the key/subkey combination is not found
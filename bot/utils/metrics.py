@@ -0,0 +1,264 @@
+import time
+import bisect
+import logging
+import threading
+from functools import wraps
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger(__name__)
+
+# Latency histogram buckets in seconds
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+class Histogram:
+    """Cumulative latency histogram in the Prometheus layout"""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.buckets, value)
+        if index < len(self.counts):
+            self.counts[index] += 1
+        self.count += 1
+        self.sum += value
+
+class MetricsRegistry:
+    """Counters and latency histograms, rendered in the Prometheus text format
+
+    Besides its own metrics, the registry renders the stats() dicts of other
+    components on every scrape (see register_stats).
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self._histograms = {}  # name -> {labels: Histogram}
+        self._counters = {}    # name -> {labels: value}
+        self._help = {}
+        self._collectors = []  # (prefix, stats function, keyed)
+        self._lock = threading.Lock()
+
+    def describe(self, name, text):
+        """Set the HELP text of a metric"""
+        self._help[name] = text
+
+    def observe(self, name, seconds, **labels):
+        """Record a duration in the histogram of name"""
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            histogram = series.get(key)
+            if histogram is None:
+                histogram = series[key] = Histogram(self.buckets)
+            histogram.observe(seconds)
+
+    def inc(self, name, amount=1, **labels):
+        """Increase the counter name"""
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + amount
+
+    def register_stats(self, prefix, func, keyed=False):
+        """Export the dict returned by func as gauges named <prefix>_<key>
+
+        Nested dicts become a "key" label. With keyed=True the top-level keys
+        are label values themselves (e.g. one entry per endpoint or action).
+        """
+        self._collectors.append((prefix, func, keyed))
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format"""
+        lines = []
+        with self._lock:
+            counters = {name: dict(series) for name, series in self._counters.items()}
+            histograms = {
+                name: {key: (list(h.counts), h.count, h.sum) for key, h in series.items()}
+                for name, series in self._histograms.items()
+            }
+
+        for name, series in sorted(counters.items()):
+            self._header(lines, name, 'counter')
+            for key, value in sorted(series.items()):
+                lines.append(f"{name}{_labels(key)} {value}")
+
+        for name, series in sorted(histograms.items()):
+            self._header(lines, name, 'histogram')
+            for key, (counts, count, total) in sorted(series.items()):
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets, counts):
+                    cumulative += bucket_count
+                    lines.append(f"{name}_bucket{_labels(key + (('le', repr(bound)),))} {cumulative}")
+                lines.append(f"{name}_bucket{_labels(key + (('le', '+Inf'),))} {count}")
+                lines.append(f"{name}_sum{_labels(key)} {total}")
+                lines.append(f"{name}_count{_labels(key)} {count}")
+
+        for prefix, func, keyed in self._collectors:
+            try:
+                stats = func()
+            except Exception as e:
+                logger.error(f"Error collecting {prefix} metrics: {e}")
+                continue
+            gauges = {}
+            for name, key, value in _flatten(prefix, stats, keyed):
+                gauges.setdefault(name, []).append((key, value))
+            for name, samples in gauges.items():
+                self._header(lines, name, 'gauge')
+                for key, value in samples:
+                    lines.append(f"{name}{_labels(key)} {value}")
+        return "\n".join(lines) + "\n"
+
+    def _header(self, lines, name, kind):
+        if name in self._help:
+            lines.append(f"# HELP {name} {self._help[name]}")
+        lines.append(f"# TYPE {name} {kind}")
+
+    def start_server(self, port, host="127.0.0.1"):
+        """Serve /metrics on host:port from a daemon thread
+
+        Returns:
+            ThreadingHTTPServer: The running server
+        """
+        registry = self
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = registry.render().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        server = ThreadingHTTPServer((host, port), MetricsHandler)
+        server.daemon_threads = True
+        thread = threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True)
+        thread.start()
+        logger.info(f"Serving metrics on http://{host}:{port}/metrics")
+        return server
+
+def _labels(key):
+    if not key:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in key)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(key, escaped)) + "}"
+
+def _metric_name(text):
+    return "".join(c if c.isalnum() else "_" for c in str(text)).strip("_").lower()
+
+def _flatten(prefix, stats, keyed):
+    """(metric name, label key, value) for the numbers and strings of a stats dict"""
+    for key, value in stats.items():
+        if isinstance(value, dict):
+            for sub, sub_value in value.items():
+                if keyed:
+                    yield from _sample(f"{prefix}_{_metric_name(sub)}", (('key', key),), sub_value)
+                elif isinstance(sub_value, dict):
+                    for leaf, leaf_value in sub_value.items():
+                        yield from _sample(f"{prefix}_{_metric_name(key)}_{_metric_name(leaf)}", (('key', sub),), leaf_value)
+                else:
+                    yield from _sample(f"{prefix}_{_metric_name(key)}", (('key', sub),), sub_value)
+        else:
+            yield from _sample(f"{prefix}_{_metric_name(key)}", (), value)
+
+def _sample(name, key, value):
+    if isinstance(value, bool):
+        yield name, key, int(value)
+    elif isinstance(value, (int, float)):
+        yield name, key, value
+    elif isinstance(value, str):
+        # States like "closed" or "open" as a labelled 1
+        yield name, key + (('value', value),), 1
+
+def callback_namespace(update):
+    """Namespace of a callback query: "order" for "order:qty:100", "service" for "service_123" """
+    query = getattr(update, 'callback_query', None)
+    if query is None or not query.data:
+        return None
+    if ":" in query.data:
+        return query.data.split(":", 1)[0]
+    return query.data.split("_", 1)[0]
+
+def callback_name(callback):
+    """Readable name of a handler callback, with the line number for lambdas"""
+    name = getattr(callback, '__qualname__', None) or getattr(callback, '__name__', None) or type(callback).__name__
+    if name.endswith("<lambda>") and hasattr(callback, '__code__'):
+        return f"{callback.__module__}:lambda@{callback.__code__.co_firstlineno}"
+    return name
+
+def timed_callback(callback, name=None):
+    """Wrap a handler callback to record its latency and errors"""
+    name = name or callback_name(callback)
+
+    @wraps(callback)
+    def wrapper(update, context):
+        start = time.perf_counter()
+        namespace = callback_namespace(update)
+        failed = False
+        try:
+            return callback(update, context)
+        except Exception:
+            failed = True
+            raise
+        finally:
+            elapsed = time.perf_counter() - start
+            metrics.observe('bot_handler_duration_seconds', elapsed, handler=name)
+            if failed:
+                metrics.inc('bot_handler_errors_total', handler=name)
+            if namespace is not None:
+                metrics.observe('bot_callback_duration_seconds', elapsed, namespace=namespace)
+                if failed:
+                    metrics.inc('bot_callback_errors_total', namespace=namespace)
+    wrapper.timed = True
+    return wrapper
+
+def instrument_handlers(dispatcher):
+    """Time the callback of every registered handler, including conversation states
+
+    Returns:
+        int: Number of callbacks wrapped
+    """
+    from telegram.ext import ConversationHandler
+    from utils.concurrency import run_async_per_user
+
+    def instrument(handler):
+        if isinstance(handler, ConversationHandler):
+            nested = list(handler.entry_points) + list(handler.fallbacks)
+            for state_handlers in handler.states.values():
+                nested.extend(state_handlers)
+            return sum(instrument(h) for h in nested)
+
+        callback = handler.callback
+        if getattr(callback, 'timed', False):
+            return 0
+        if getattr(callback, 'runs_per_user', False):
+            # Time the handler itself on the worker, not the hand-off to the queue
+            handler.callback = run_async_per_user(timed_callback(callback.__wrapped__))
+        else:
+            handler.callback = timed_callback(callback)
+        return 1
+
+    wrapped = 0
+    for handlers in dispatcher.handlers.values():
+        for handler in handlers:
+            wrapped += instrument(handler)
+    logger.info(f"Instrumented {wrapped} handler callbacks")
+    return wrapped
+
+# Create a singleton instance
+metrics = MetricsRegistry()
+metrics.describe('bot_handler_duration_seconds', "Time spent in a handler callback")
+metrics.describe('bot_handler_errors_total', "Handler callbacks that raised an exception")
+metrics.describe('bot_callback_duration_seconds', "Time spent handling callback queries per namespace")
+metrics.describe('bot_callback_errors_total', "Callback queries whose handler raised, per namespace")
+metrics.describe('bot_panel_request_duration_seconds', "Duration of single panel API requests")
+metrics.describe('bot_sqlite_query_duration_seconds', "Duration of SQLite statements by operation and table")
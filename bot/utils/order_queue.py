@@ -0,0 +1,218 @@
+import io
+import os
+import csv
+import time
+import random
+import logging
+import threading
+from utils.db import db
+from utils.api_client import api_client
+from utils.constants import CURRENCY_RATES
+from utils.helpers import format_mass_order_report
+from utils.messages import get_message
+
+logger = logging.getLogger(__name__)
+
+class OrderWorkerPool:
+    """Fixed-size pool of threads that sends queued orders to the panel"""
+
+    def __init__(self, workers=4, max_attempts=5, base_delay=5, max_delay=300, poll_interval=2.0,
+                 capture_attempts=3):
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.capture_attempts = capture_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.poll_interval = poll_interval
+        self.bot = None
+        self._threads = []
+        self._stop = threading.Event()
+        self._wakeup = threading.Condition()
+
+    def start(self, bot):
+        """Start the worker threads, using bot to edit the confirmation messages"""
+        if self._threads:
+            return
+        self.bot = bot
+        self._stop.clear()
+
+        # Jobs interrupted by a restart may already be placed on the panel, so they are
+        # held for an admin instead of being submitted again
+        for job_id, reservation_id in db.flag_stale_order_jobs():
+            logger.warning(f"Order job {job_id} (reservation {reservation_id}) was left in processing by a previous run, marked for reconciliation")
+
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._run, name=f"order-worker-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        logger.info(f"Started {self.workers} order workers")
+
+    def stop(self, timeout=10):
+        """Stop the worker threads after their current job"""
+        self._stop.set()
+        with self._wakeup:
+            self._wakeup.notify_all()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def notify(self, count=1):
+        """Wake idle workers after count jobs have been queued"""
+        with self._wakeup:
+            self._wakeup.notify(count)
+
+    def _run(self):
+        while not self._stop.is_set():
+            job = db.claim_order_job()
+            if job is None:
+                with self._wakeup:
+                    self._wakeup.wait(self.poll_interval)
+                continue
+
+            try:
+                self._process(job)
+            except Exception as e:
+                logger.error(f"Error processing order job {job['id']}: {e}", exc_info=True)
+                if job.get('panel_order_id') is not None:
+                    # The panel has the order, so the job must not be submitted again
+                    self._reconcile(job, f"Placed as panel order {job['panel_order_id']} but not completed: {e}")
+                elif job['attempts'] < self.max_attempts:
+                    db.retry_order_job(job['id'], str(e), self._backoff(job['attempts']))
+                else:
+                    self._fail(job, str(e))
+
+    def _backoff(self, attempts):
+        """Exponential backoff with jitter for the given attempt number"""
+        delay = min(self.max_delay, self.base_delay * (2 ** max(attempts - 1, 0)))
+        return delay * random.uniform(0.8, 1.2)
+
+    def _process(self, job):
+        # The reservation was already captured or released (e.g. crash after the panel call)
+        if job['order_status'] != 'reserved':
+            logger.warning(f"Order job {job['id']} has reservation in state {job['order_status']}, skipping")
+            self._finish(job, 'done' if job['order_id'] else 'failed')
+            return
+
+        logger.info(f"Submitting order job {job['id']} (attempt {job['attempts']}) - User: {job['user_id']}, Service: {job['service_id']}, Quantity: {job['quantity']}")
+        response = api_client.place_order(job['service_id'], job['link'], job['quantity'], job['comments'])
+
+        if isinstance(response, dict) and "order" in response:
+            order_id = response["order"]
+            # The panel has the order now, so it is captured before anything else can fail,
+            # and only the capture is retried, never the submission
+            job['panel_order_id'] = order_id
+            captured = self._capture(job, order_id)
+
+            price = job['price'] or 0.0
+            etb_price = price * CURRENCY_RATES["ETB"]
+            text = get_message(job['language'], 'order', 'success').format(
+                admin_note=" (Admin Order)" if db.is_admin(job['user_id']) else "",
+                order_id=order_id,
+                service_name=job['service_name'],
+                quantity=job['quantity'],
+                price_display=f"${price:.6f} / ETB {etb_price:.2f}"
+            )
+
+            if not captured:
+                self._reconcile(job, f"Placed as panel order {order_id} but the reservation could not be captured", text=text)
+                return
+
+            logger.info(f"Order job {job['id']} placed as panel order {order_id}")
+            self._finish(job, 'done', text=text)
+            return
+
+        error_message = response.get("error", "Unknown error") if isinstance(response, dict) else "Unknown error"
+
+        # The panel may have placed the order, so it is neither refunded nor submitted again
+        if not isinstance(response, dict) or response.get("outcome_unknown") or "error" not in response:
+            self._reconcile(job, f"Panel outcome unknown: {error_message}")
+            return
+
+        # Transient failures are retried with backoff, everything else refunds the user
+        if response.get("retryable") and job['attempts'] < self.max_attempts:
+            delay = self._backoff(job['attempts'])
+            logger.warning(f"Order job {job['id']} failed ({error_message}), retrying in {delay:.0f}s")
+            db.retry_order_job(job['id'], error_message, delay)
+            return
+
+        self._fail(job, error_message)
+
+    def _capture(self, job, order_id):
+        """Attach the panel order ID to the reservation, retrying a failed write a few times"""
+        for attempt in range(self.capture_attempts):
+            if db.capture_order(job['reservation_id'], order_id):
+                return True
+            if attempt + 1 < self.capture_attempts:
+                time.sleep(0.5 * (attempt + 1))
+        return False
+
+    def _reconcile(self, job, error, text=None):
+        """Hold a job the panel may have placed for an admin, without refunding or resubmitting it"""
+        logger.error(f"Order job {job['id']}: {error}, marked for reconciliation")
+        try:
+            self._finish(job, 'needs_reconciliation', error=error, text=text)
+        except Exception as e:
+            # Still in processing, which the next start flags for reconciliation as well
+            logger.error(f"Error marking order job {job['id']} for reconciliation: {e}")
+
+    def _fail(self, job, error_message):
+        """Refund the reservation and report the job as failed"""
+        logger.error(f"Order job {job['id']} failed after {job['attempts']} attempts: {error_message}")
+        db.release_order(job['reservation_id'], error_message)
+        self._finish(job, 'failed', error=error_message, text=get_message(job['language'], 'order', 'failed').format(
+            error_message=error_message
+        ))
+
+    def _finish(self, job, status, error=None, text=None):
+        """Close a job and report it, or its whole batch once the last line is done"""
+        remaining = db.finish_order_job(job['id'], status, error)
+        if job['batch_id']:
+            if remaining == 0:
+                self._send_batch_report(job)
+        elif text:
+            self._edit_message(job, text)
+
+    def _send_batch_report(self, job):
+        """Replace the mass order message with the result of every line"""
+        rows = db.get_order_batch(job['batch_id'])
+        text, omitted = format_mass_order_report(rows, job['language'])
+        self._edit_message(job, text)
+
+        # Lines that do not fit in the message are sent as a CSV file
+        if omitted and self.bot and job['chat_id']:
+            output = io.StringIO()
+            writer = csv.writer(output)
+            writer.writerow(['line', 'service', 'link', 'quantity', 'price', 'order_id', 'error'])
+            for row in rows:
+                writer.writerow([row['batch_line'], row['service_id'], row['link'], row['quantity'],
+                                 f"{row['price'] or 0.0:.6f}", row['order_id'] or '', row['last_error'] or ''])
+            try:
+                self.bot.send_document(
+                    chat_id=job['chat_id'],
+                    document=io.BytesIO(output.getvalue().encode('utf-8')),
+                    filename=f"mass_order_{job['batch_id'][:8]}.csv"
+                )
+            except Exception as e:
+                logger.error(f"Error sending report file for batch {job['batch_id']}: {e}")
+
+    def _edit_message(self, job, text):
+        """Replace the queued confirmation message with the final result"""
+        if not self.bot or not job['chat_id'] or not job['message_id']:
+            return
+        try:
+            self.bot.edit_message_text(
+                chat_id=job['chat_id'],
+                message_id=job['message_id'],
+                text=text,
+                parse_mode="HTML"
+            )
+        except Exception as e:
+            logger.error(f"Error updating message for order job {job['id']}: {e}")
+
+# Create a singleton instance
+order_workers = OrderWorkerPool(
+    workers=int(os.getenv("ORDER_WORKERS", "4")),
+    max_attempts=int(os.getenv("ORDER_MAX_ATTEMPTS", "5")),
+    base_delay=float(os.getenv("ORDER_RETRY_BASE_DELAY", "5")),
+    max_delay=float(os.getenv("ORDER_RETRY_MAX_DELAY", "300"))
+)
@@ -0,0 +1,273 @@
+import json
+import time
+import logging
+import threading
+from collections import defaultdict
+from telegram.ext import BasePersistence
+from utils.db import db
+
+logger = logging.getLogger(__name__)
+
+# user_data keys that are rebuilt on demand and not worth keeping across restarts
+EXCLUDED_USER_DATA_KEYS = {'filtered_services', 'command_menu_active'}
+
+# Values larger than this (as JSON) are not persisted
+MAX_VALUE_BYTES = 4096
+
+# Tags for the values plain JSON would turn into something else
+TUPLE_TAG = "__tuple__"
+ITEMS_TAG = "__items__"
+
+def encode_value(value):
+    """Tag the tuples and dicts with non-string keys in value, which JSON would turn into lists and string keys
+
+    Raises:
+        TypeError: If value holds something else JSON can't store, like a set
+    """
+    if isinstance(value, tuple):
+        return {TUPLE_TAG: [encode_value(item) for item in value]}
+    if isinstance(value, list):
+        return [encode_value(item) for item in value]
+    if isinstance(value, dict):
+        if all(isinstance(key, str) for key in value):
+            return {key: encode_value(item) for key, item in value.items()}
+        return {ITEMS_TAG: [[encode_value(key), encode_value(item)] for key, item in value.items()]}
+    if value is None or isinstance(value, (str, int, float)):
+        return value
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+def decode_value(obj):
+    """json.loads() object_hook restoring what encode_value() tagged"""
+    if len(obj) == 1:
+        if TUPLE_TAG in obj:
+            return tuple(obj[TUPLE_TAG])
+        if ITEMS_TAG in obj:
+            return {key: item for key, item in obj[ITEMS_TAG]}
+    return obj
+
+class LazyUserData(defaultdict):
+    """user_data of all users, loaded from the database on first access per user
+
+    The time of the last access per user is kept so idle users can be evicted.
+    """
+
+    def __init__(self, loader):
+        super().__init__(dict)
+        self._loader = loader
+        self._lock = threading.Lock()
+        self.last_access = {}
+
+    def __getitem__(self, user_id):
+        self.last_access[user_id] = time.monotonic()
+        return super().__getitem__(user_id)
+
+    def __missing__(self, user_id):
+        data = self._loader(user_id)
+        with self._lock:
+            # Another thread may have loaded the same user meanwhile
+            return self.setdefault(user_id, data)
+
+    def copy(self):
+        new = LazyUserData(self._loader)
+        new.update(self)
+        return new
+
+    __copy__ = copy
+
+class SQLitePersistence(BasePersistence):
+    """Keeps conversation states and small user_data values in SQLite
+
+    Changes are collected in memory and written in one transaction by
+    flush_pending(), which the bot runs on an interval and on shutdown.
+    user_data is read from the database when a user is first seen after a
+    restart; conversation states (a few bytes per open conversation) are
+    loaded per handler at startup. Tuples and non-string dict keys are
+    tagged so they load back unchanged; values holding other types JSON
+    can't store, or larger than MAX_VALUE_BYTES, like cached service lists,
+    are skipped.
+    """
+
+    def __init__(self, max_value_bytes=MAX_VALUE_BYTES):
+        super().__init__(store_user_data=True, store_chat_data=False, store_bot_data=False)
+        self.max_value_bytes = max_value_bytes
+        self.flushes = 0
+        self.rows_written = 0
+        self.evicted = 0
+        self._dirty_user_data = {}      # user_id -> data JSON
+        self._dirty_conversations = {}  # (name, key JSON) -> state JSON, None when ended
+        self._saved_user_data = {}      # user_id -> hash of the data JSON last written or loaded
+        self._lock = threading.Lock()
+
+    def _compact(self, user_id, data):
+        """JSON of the persistable part of a user's user_data"""
+        kept = {}
+        for key, value in data.items():
+            if key in EXCLUDED_USER_DATA_KEYS:
+                continue
+            try:
+                value = encode_value(value)
+                encoded = json.dumps(value)
+            except (TypeError, ValueError):
+                logger.debug(f"Not persisting user_data[{key!r}] of user {user_id}: not JSON serializable")
+                continue
+            if len(encoded) > self.max_value_bytes:
+                logger.debug(f"Not persisting user_data[{key!r}] of user {user_id}: {len(encoded)} bytes")
+                continue
+            kept[key] = value
+        if not all(isinstance(key, str) for key in kept):
+            return json.dumps({ITEMS_TAG: [[encode_value(key), value] for key, value in kept.items()]})
+        return json.dumps(kept, sort_keys=True)
+
+    def _load_user_data(self, user_id):
+        encoded = db.get_persisted_user_data(user_id)
+        with self._lock:
+            self._saved_user_data[user_id] = hash(encoded or '{}')
+        if not encoded:
+            return {}
+        try:
+            return json.loads(encoded, object_hook=decode_value)
+        except ValueError:
+            logger.error(f"Discarding unreadable persisted user_data of user {user_id}")
+            return {}
+
+    def get_user_data(self):
+        return LazyUserData(self._load_user_data)
+
+    def get_chat_data(self):
+        return defaultdict(dict)
+
+    def get_bot_data(self):
+        return {}
+
+    def get_conversations(self, name):
+        conversations = {}
+        for key, state in db.get_persisted_conversations(name):
+            try:
+                conversations[tuple(json.loads(key))] = json.loads(state)
+            except ValueError:
+                logger.error(f"Discarding unreadable persisted state of conversation {name} {key}")
+        if conversations:
+            logger.info(f"Restored {len(conversations)} open {name} conversations")
+        return conversations
+
+    def update_conversation(self, name, key, new_state):
+        # A state set by a run_async handler is (previous state, Promise) until the
+        # handler finishes; keep the previous state in case the bot stops meanwhile
+        while isinstance(new_state, tuple):
+            new_state = new_state[0]
+        encoded_key = json.dumps(list(key))
+        with self._lock:
+            self._dirty_conversations[(name, encoded_key)] = None if new_state is None else json.dumps(new_state)
+
+    def update_user_data(self, user_id, data):
+        encoded = self._compact(user_id, data)
+        with self._lock:
+            if self._saved_user_data.get(user_id) == hash(encoded):
+                self._dirty_user_data.pop(user_id, None)
+                return
+            self._dirty_user_data[user_id] = encoded
+
+    def update_chat_data(self, chat_id, data):
+        pass
+
+    def update_bot_data(self, data):
+        pass
+
+    def refresh_user_data(self, user_id, user_data):
+        pass
+
+    def refresh_chat_data(self, chat_id, chat_data):
+        pass
+
+    def refresh_bot_data(self, bot_data):
+        pass
+
+    def flush_pending(self):
+        """Write the changes collected since the last flush
+
+        Returns:
+            int: Number of rows written
+        """
+        with self._lock:
+            user_rows = list(self._dirty_user_data.items())
+            conversations = self._dirty_conversations
+            self._dirty_user_data = {}
+            self._dirty_conversations = {}
+        if not user_rows and not conversations:
+            return 0
+
+        conversation_rows = [(name, key, state) for (name, key), state in conversations.items() if state is not None]
+        ended = [(name, key) for (name, key), state in conversations.items() if state is None]
+        if not db.save_persisted_state(user_rows, conversation_rows, ended):
+            # Keep the changes for the next flush unless newer ones arrived
+            with self._lock:
+                for user_id, encoded in user_rows:
+                    self._dirty_user_data.setdefault(user_id, encoded)
+                for conversation, state in conversations.items():
+                    self._dirty_conversations.setdefault(conversation, state)
+            return 0
+
+        with self._lock:
+            self._saved_user_data.update((user_id, hash(encoded)) for user_id, encoded in user_rows)
+            self.flushes += 1
+            self.rows_written += len(user_rows) + len(conversations)
+        return len(user_rows) + len(conversations)
+
+    def flush(self):
+        """Called by the Updater on shutdown"""
+        written = self.flush_pending()
+        logger.info(f"Persistence flushed {written} pending rows on shutdown")
+
+    def evict_idle(self, user_data, max_idle):
+        """Drop the user_data of users not seen for max_idle seconds from memory
+        
+        Pending changes are written first; evicted users are loaded from the
+        database again when they come back.
+        
+        Returns:
+            int: Number of users evicted
+        """
+        if not isinstance(user_data, LazyUserData):
+            return 0
+        self.flush_pending()
+        
+        cutoff = time.monotonic() - max_idle
+        idle = [user_id for user_id, seen in list(user_data.last_access.items()) if seen < cutoff]
+        evicted = 0
+        with self._lock:
+            for user_id in idle:
+                # Users seen or changed since the list was made stay in memory
+                if user_data.last_access.get(user_id, 0) >= cutoff or user_id in self._dirty_user_data:
+                    continue
+                user_data.pop(user_id, None)
+                user_data.last_access.pop(user_id, None)
+                self._saved_user_data.pop(user_id, None)
+                evicted += 1
+            self.evicted += evicted
+        if evicted:
+            logger.info(f"Evicted user_data of {evicted} idle users, {len(user_data)} in memory")
+        return evicted
+
+    def stats(self):
+        """Flushes, rows written and changes waiting for the next flush"""
+        with self._lock:
+            return {
+                'flushes': self.flushes,
+                'rows_written': self.rows_written,
+                'pending_user_data': len(self._dirty_user_data),
+                'pending_conversations': len(self._dirty_conversations),
+                'users_loaded': len(self._saved_user_data),
+                'users_evicted': self.evicted
+            }
+
+def flush_persistence_job(context):
+    """Job: write the persistence changes collected since the last run"""
+    persistence = context.dispatcher.persistence
+    if persistence:
+        persistence.flush_pending()
+
+def evict_idle_user_data_job(context):
+    """Job: drop user_data of users idle for longer than context.job.context seconds"""
+    persistence = context.dispatcher.persistence
+    if persistence:
+        persistence.evict_idle(context.dispatcher.user_data, context.job.context)
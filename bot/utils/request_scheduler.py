@@ -0,0 +1,163 @@
+import time
+import heapq
+import logging
+import itertools
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Priorities, lower values are served first
+PRIORITY_ORDER = 0
+PRIORITY_STATUS = 1
+PRIORITY_BACKGROUND = 2
+
+PRIORITY_NAMES = {
+    PRIORITY_ORDER: 'order',
+    PRIORITY_STATUS: 'status',
+    PRIORITY_BACKGROUND: 'background'
+}
+
+class TokenBucket:
+    """Token bucket allowing `rate` calls per second with bursts up to `burst`"""
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self._last_refill = time.monotonic()
+
+    def refill(self, now):
+        if now > self._last_refill:
+            self.tokens = min(self.burst, self.tokens + (now - self._last_refill) * self.rate)
+            self._last_refill = now
+
+    def time_until_token(self):
+        """Seconds until one token is available"""
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+class RequestScheduler:
+    """Admits panel API calls by priority, under a token bucket per action
+
+    Callers wait in one priority queue. A waiter is admitted when its
+    action's bucket has a token, fewer than max_concurrent calls are in
+    flight and no waiter ahead of it could be admitted instead. Waiters
+    blocked only by their own bucket do not hold back other actions, so a
+    throttled background sync never delays order placement.
+    """
+
+    def __init__(self, rates, default_rate=(5, 10), max_concurrent=8, max_wait=30.0):
+        self.rates = rates
+        self.default_rate = default_rate
+        self.max_concurrent = max_concurrent
+        self.max_wait = max_wait
+        self.in_flight = 0
+        self._buckets = {}
+        self._waiting = []  # heap of (priority, seq, action)
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._stats = {
+            name: {'admitted': 0, 'timed_out': 0, 'total_wait': 0.0, 'max_wait': 0.0, 'max_depth': 0}
+            for name in PRIORITY_NAMES.values()
+        }
+
+    def _bucket(self, action):
+        if action not in self._buckets:
+            rate, burst = self.rates.get(action, self.default_rate)
+            self._buckets[action] = TokenBucket(rate, burst)
+        return self._buckets[action]
+
+    def _next_admissible(self, now):
+        """The first waiter in priority order whose bucket has a token"""
+        if self.in_flight >= self.max_concurrent:
+            return None
+        for entry in sorted(self._waiting):
+            bucket = self._bucket(entry[2])
+            bucket.refill(now)
+            if bucket.tokens >= 1:
+                return entry
+        return None
+
+    def acquire(self, action, priority):
+        """Wait for a slot to call the panel
+
+        Returns:
+            bool: True once admitted, False if max_wait passed first
+        """
+        name = PRIORITY_NAMES.get(priority, 'background')
+        entry = (priority, next(self._seq), action)
+        start = time.monotonic()
+        with self._cond:
+            heapq.heappush(self._waiting, entry)
+            depth = sum(1 for waiting in self._waiting if waiting[0] == priority)
+            self._stats[name]['max_depth'] = max(self._stats[name]['max_depth'], depth)
+
+            while True:
+                now = time.monotonic()
+                if self._next_admissible(now) == entry:
+                    self._waiting.remove(entry)
+                    heapq.heapify(self._waiting)
+                    self._bucket(action).tokens -= 1
+                    self.in_flight += 1
+                    waited = now - start
+                    stats = self._stats[name]
+                    stats['admitted'] += 1
+                    stats['total_wait'] += waited
+                    stats['max_wait'] = max(stats['max_wait'], waited)
+                    # Another waiter may be admissible now that the queue changed
+                    self._cond.notify_all()
+                    return True
+
+                if now - start >= self.max_wait:
+                    self._waiting.remove(entry)
+                    heapq.heapify(self._waiting)
+                    self._stats[name]['timed_out'] += 1
+                    self._cond.notify_all()
+                    logger.warning(f"API request {action} waited {now - start:.1f}s in the {name} queue, giving up")
+                    return False
+
+                # Sleep until our bucket refills, a call finishes or the queue changes
+                timeout = min(self.max_wait - (now - start), max(self._bucket(action).time_until_token(), 0.01))
+                self._cond.wait(timeout)
+
+    def release(self):
+        """Mark an admitted call as finished"""
+        with self._cond:
+            self.in_flight -= 1
+            self._cond.notify_all()
+
+    def stats(self):
+        """Queue depth and wait time per priority"""
+        with self._cond:
+            result = {'in_flight': self.in_flight}
+            for priority, name in PRIORITY_NAMES.items():
+                stats = self._stats[name]
+                result[name] = {
+                    'depth': sum(1 for waiting in self._waiting if waiting[0] == priority),
+                    'max_depth': stats['max_depth'],
+                    'admitted': stats['admitted'],
+                    'timed_out': stats['timed_out'],
+                    'avg_wait': stats['total_wait'] / stats['admitted'] if stats['admitted'] else 0.0,
+                    'max_wait': stats['max_wait']
+                }
+            return result
+
+def parse_rate_limits(value):
+    """Parse "action=rate:burst,..." into {action: (rate, burst)}"""
+    rates = {}
+    for item in (value or "").split(","):
+        if "=" not in item:
+            continue
+        action, limit = item.split("=", 1)
+        try:
+            rate, _, burst = limit.partition(":")
+            rate = float(rate)
+            burst = float(burst) if burst else max(rate, 1.0)
+            # A bucket that never refills or can't hold one token would block the action for good
+            if not rate > 0 or not burst >= 1:
+                raise ValueError(item)
+            rates[action.strip()] = (rate, burst)
+        except ValueError:
+            logger.error(f"Invalid API rate limit: {item}")
+    return rates
@@ -0,0 +1,40 @@
+import time
+import threading
+
+class RetryBudget:
+    """Caps retries at a fraction of recent requests
+
+    Every request deposits `ratio` tokens and every retry spends one, so
+    retries can never add more than ratio * requests of extra load, no
+    matter how many callers are failing at once. A small time-based refill
+    (min_per_second) keeps retries possible when traffic is low. Tokens are
+    capped at max_tokens so a quiet period cannot bank a retry storm.
+    """
+
+    def __init__(self, ratio=0.2, min_per_second=0.5, max_tokens=10):
+        self.ratio = ratio
+        self.min_per_second = min_per_second
+        self.max_tokens = max_tokens
+        self.tokens = max_tokens
+        self._last_refill = time.time()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.time()
+        self.tokens = min(self.max_tokens, self.tokens + (now - self._last_refill) * self.min_per_second)
+        self._last_refill = now
+
+    def record_request(self):
+        """Deposit the share of a first attempt"""
+        with self._lock:
+            self._refill()
+            self.tokens = min(self.max_tokens, self.tokens + self.ratio)
+
+    def try_spend(self):
+        """Take one retry from the budget, if any is left"""
+        with self._lock:
+            self._refill()
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return True
+            return False
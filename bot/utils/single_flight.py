@@ -0,0 +1,69 @@
+import copy
+import threading
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.followers = 0
+
+class SingleFlight:
+    """Shares one execution of a function among concurrent identical calls
+
+    The first caller for a key runs the function; callers that arrive while
+    it is running wait for it and get the same result. When a result was
+    shared, every caller gets its own deep copy, since callers are free to
+    modify what they get back.
+    """
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+        self._stats = {}
+
+    def do(self, key, fn):
+        """Run fn for key, or wait for the run already in flight"""
+        with self._lock:
+            stats = self._stats.setdefault(key[0], {'calls': 0, 'coalesced': 0})
+            stats['calls'] += 1
+            call = self._calls.get(key)
+            if call is not None:
+                call.followers += 1
+                stats['coalesced'] += 1
+                leader = False
+            else:
+                call = _Call()
+                self._calls[key] = call
+                leader = True
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return copy.deepcopy(call.result)
+
+        try:
+            call.result = fn()
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            # Later callers start a new run from here on
+            with self._lock:
+                del self._calls[key]
+                shared = call.followers > 0
+            call.done.set()
+
+        return copy.deepcopy(call.result) if shared else call.result
+
+    def stats(self):
+        """Calls and coalesced calls per key group, with the coalescing ratio"""
+        with self._lock:
+            result = {}
+            for group, stats in self._stats.items():
+                result[group] = dict(stats, ratio=stats['coalesced'] / stats['calls'] if stats['calls'] else 0.0)
+            calls = sum(stats['calls'] for stats in self._stats.values())
+            coalesced = sum(stats['coalesced'] for stats in self._stats.values())
+            result['total'] = {'calls': calls, 'coalesced': coalesced, 'ratio': coalesced / calls if calls else 0.0}
+            return result
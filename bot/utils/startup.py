@@ -0,0 +1,61 @@
+import time
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+class StartupTimer:
+    """Measures the phases of bot startup
+
+    Foreground phases are timed with mark(), each lasting from the previous
+    mark. Background phases run in their own thread through run_in_background()
+    and are reported when they finish.
+    """
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self._last_mark = self.started
+        self.phases = []
+        self._lock = threading.Lock()
+
+    def mark(self, name):
+        """End a foreground phase"""
+        now = time.monotonic()
+        with self._lock:
+            self.phases.append((name, now - self._last_mark, False))
+            self._last_mark = now
+
+    def run_in_background(self, name, func, *args):
+        """Run a startup phase in a daemon thread and time it
+
+        Returns:
+            threading.Thread: The started thread, to join if the result is needed
+        """
+        def run():
+            start = time.monotonic()
+            try:
+                func(*args)
+            except Exception as e:
+                logger.error(f"Startup phase {name} failed: {e}", exc_info=True)
+            finally:
+                elapsed = time.monotonic() - start
+                with self._lock:
+                    self.phases.append((name, elapsed, True))
+                logger.info(f"Startup phase {name} finished in {elapsed:.3f}s (background)")
+
+        thread = threading.Thread(target=run, name=f"startup-{name}", daemon=True)
+        thread.start()
+        return thread
+
+    def report(self):
+        """Log the time of every phase finished so far and the total"""
+        with self._lock:
+            phases = list(self.phases)
+        lines = [f"  {name:<20} {elapsed:8.3f}s{' (background)' if background else ''}"
+                 for name, elapsed, background in phases]
+        total = time.monotonic() - self.started
+        logger.info("Startup timing:\n" + "\n".join(lines) + f"\n  {'ready':<20} {total:8.3f}s")
+        return total
+
+# Create a singleton instance
+startup_timer = StartupTimer()
@@ -0,0 +1,64 @@
+import copy
+import time
+import threading
+from collections import OrderedDict
+
+# Statuses that will not change any more
+FINAL_STATUSES = {'completed', 'canceled', 'cancelled', 'partial', 'refunded'}
+
+class OrderStatusCache:
+    """Bounded LRU cache of panel order statuses
+
+    Final statuses are kept for final_ttl seconds, everything else (pending,
+    in progress, processing) only for active_ttl, so a refresh shortly after
+    another one is answered locally without hiding real progress for long.
+    """
+
+    def __init__(self, max_entries=5000, active_ttl=15, final_ttl=600):
+        self.max_entries = max_entries
+        self.active_ttl = active_ttl
+        self.final_ttl = final_ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # order_id -> (expires_at, status dict)
+        self._lock = threading.Lock()
+
+    def _ttl(self, status):
+        if str(status.get('status', '')).lower() in FINAL_STATUSES:
+            return self.final_ttl
+        return self.active_ttl
+
+    def get(self, order_id):
+        """Get a copy of the cached status, or None if missing or expired"""
+        order_id = str(order_id)
+        with self._lock:
+            entry = self._entries.get(order_id)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self._entries[order_id]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(order_id)
+            self.hits += 1
+            return copy.deepcopy(entry[1])
+
+    def put(self, order_id, status):
+        """Cache a successful status response"""
+        if not isinstance(status, dict) or status.get('error') or 'status' not in status:
+            return
+        with self._lock:
+            self._entries[str(order_id)] = (time.monotonic() + self._ttl(status), copy.deepcopy(status))
+            self._entries.move_to_end(str(order_id))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self):
+        """Size, hits, misses and hit ratio"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': self.hits / lookups if lookups else 0.0
+            }